@@ -0,0 +1,81 @@
+"""
+The aligned matrix a store of funds is kept in.
+
+The series are laid out as the columns of a single Fortran-order array on the
+union of their dates, with NaN where a fund has nothing. Each column is then
+one contiguous block, so a fund or a run of adjacent funds is a view into the
+matrix rather than a new DataFrame. return_store keeps its returns this way.
+
+The values can be float32 to halve the memory, and can live in a .npy file
+that is memory-mapped, so a database larger than RAM is paged in by the
+columns actually used.
+"""
+import json
+import os
+import numpy as np
+import pandas as pd
+
+DTYPES = ('float64', 'float32')
+
+
+def valid_bounds(values):
+    """First and last row with a price in each column; len(values) and -1 for empty columns."""
+    valid = ~np.isnan(values)
+    has = valid.any(axis=0)
+    first = np.where(has, valid.argmax(axis=0), len(values))
+    last = np.where(has, len(values) - 1 - valid[::-1].argmax(axis=0), -1)
+    return first, last
+
+
+def _union_dates(data):
+    if not data:
+        return pd.DatetimeIndex([])
+    names = {s.index.name for s in data.values()}
+    return pd.DatetimeIndex(np.unique(np.concatenate([s.index.values for s in data.values()])),
+                            name=names.pop() if len(names) == 1 else None)
+
+
+def _paths(path):
+    return path + '.values.npy', path + '.json'
+
+
+def allocate(shape, dtype='float64', path=None):
+    """
+    A NaN-filled Fortran-order matrix of `dtype`, or with `path` one that is
+    memory-mapped from `path`.values.npy.
+    """
+    if dtype not in DTYPES:
+        raise ValueError(f'Unknown dtype {dtype}, choose one of {DTYPES}')
+    if path is None:
+        return np.full(shape, np.nan, dtype=dtype, order='F')
+    values_path, _ = _paths(path)
+    os.makedirs(os.path.dirname(os.path.abspath(values_path)), exist_ok=True)
+    values = np.lib.format.open_memmap(values_path, mode='w+', dtype=dtype, shape=shape,
+                                       fortran_order=True)
+    values[:] = np.nan
+    return values
+
+
+def save(path, values, dates, meta):
+    """Flush a matrix from allocate(..., path) and write its dates and `meta` next to it."""
+    values.flush()
+    # Kept with the dates so that opening a mapped matrix doesn't scan the values.
+    with open(_paths(path)[1], 'w') as f:
+        json.dump(dict(meta, dates=[d.isoformat() for d in dates], index_name=dates.name), f)
+
+
+def open_matrix(path, mmap=True):
+    """(values, dates, meta) written by save(), memory-mapped unless mmap is False."""
+    values_path, meta_path = _paths(path)
+    with open(meta_path) as f:
+        meta = json.load(f)
+    values = np.load(values_path, mmap_mode='r' if mmap else None, allow_pickle=False)
+    dates = pd.DatetimeIndex(pd.to_datetime(meta.pop('dates')), name=meta.pop('index_name'))
+    return values, dates, meta
+
+
+def remove(path):
+    """Delete the files at `path`; on POSIX a matrix already mapped from them stays readable."""
+    for name in (path, *_paths(path)):
+        if os.path.exists(name):
+            os.remove(name)
@@ -0,0 +1,219 @@
+"""
+Search over fund subsets and group weights for tailored-dragon style
+portfolios.
+
+A candidate picks a non-empty subset of funds from every group and a weight
+for every group (on a simplex grid); funds inside a group are equally
+weighted. Candidates are numbered, so workers only receive ranges of ids and
+decode them against the subset and weight tables. The aligned price matrix is
+placed in shared memory once and mapped by every worker without copying.
+
+Each chunk of candidates is backtested in one sim_engine.simulate_batch call,
+then reduced to its non-dominated candidates (on cagr, max drawdown and tau)
+plus its best few by the ranking metric before anything is sent back.
+"""
+import argparse
+import math
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain, combinations
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+import data_loader
+import fund_stats
+import return_store
+import sim_engine
+
+RANK_METRICS = ('cagr', 'calmar', 'tau')
+OBJECTIVES = ('cagr', 'max_drawdown', 'tau')
+METRIC_NAMES = ('cagr', 'max_drawdown', 'calmar', 'vol', 'sharpe', 'tau')
+
+
+def load_prices(groups, minimum_months=55):
+    """Aligned prices of every fund in `groups` with more than `minimum_months` of history."""
+    keys = list(chain.from_iterable(groups.values()))
+    store = return_store.load(keys, minimum_months=minimum_months)
+    return store.frame([k for k in keys if k in store])
+
+
+def group_subsets(columns, min_size=1, max_size=None):
+    """Every subset of a group's column indices with min_size..max_size members."""
+    max_size = len(columns) if max_size is None else max_size
+    return [subset for size in range(min_size, min(max_size, len(columns)) + 1)
+            for subset in combinations(columns, size)]
+
+
+def weight_grid(n_groups, step=0.1, allow_zero=False):
+    """All group weight vectors on a simplex grid with spacing `step`."""
+    units = round(1 / step)
+    floor = 0 if allow_zero else 1
+    spare = units - floor * n_groups
+    if spare < 0:
+        raise ValueError(f'A step of {step} is too coarse for {n_groups} groups')
+
+    # Stars and bars: choose where the n_groups - 1 dividers go.
+    grid = []
+    for dividers in combinations(range(spare + n_groups - 1), n_groups - 1):
+        bounds = (-1,) + dividers + (spare + n_groups - 1,)
+        grid.append([b - a - 1 + floor for a, b in zip(bounds[:-1], bounds[1:])])
+    return np.array(grid, dtype='float64') / units
+
+
+def candidate_metrics(values):
+    """Metrics of (months x candidates) value paths."""
+    n_months = values.shape[0] - 1
+    returns = values[1:] / values[:-1] - 1
+    cagr = values[-1] ** (12 / n_months) - 1
+    max_drawdown = (values / np.maximum.accumulate(values, axis=0) - 1).min(axis=0)
+
+    stats = fund_stats.summary(*fund_stats.moments(returns, axis=0)[1:], cagr, max_drawdown)
+    return {m: stats[m] for m in ('cagr', 'max_drawdown', 'calmar', 'vol', 'sharpe', 'tau')}
+
+
+def pareto_mask(objectives):
+    """
+    Flags for rows of (candidates x objectives), all to be maximized, that no
+    other row dominates. NaN counts as worst.
+    """
+    scores = np.nan_to_num(objectives, nan=-np.inf)
+    keep = np.ones(len(scores), dtype=bool)
+    for i in np.argsort(-scores[:, 0], kind='stable'):
+        if not keep[i]:
+            continue
+        dominated = (scores <= scores[i]).all(axis=1) & (scores < scores[i]).any(axis=1)
+        keep &= ~dominated
+    return keep
+
+
+class Space:
+    """The candidate space: subset tables per group and the group weight grid."""
+
+    def __init__(self, subsets, weights, n_funds):
+        self.subsets = subsets
+        self.weights = weights
+        self.n_funds = n_funds
+        self.shape = tuple(len(s) for s in subsets) + (len(weights),)
+        self.size = math.prod(self.shape)
+
+    def weight_matrix(self, ids):
+        """Fund weight vectors for candidate ids, shape (len(ids), n_funds)."""
+        coords = np.unravel_index(ids, self.shape)
+        group_weights = self.weights[coords[-1]]
+        w = np.zeros((len(ids), self.n_funds))
+        rows = np.arange(len(ids))
+        for g, subsets in enumerate(self.subsets):
+            for k, subset in enumerate(subsets):
+                picked = rows[coords[g] == k]
+                if len(picked) == 0:
+                    continue
+                share = group_weights[picked, g] / len(subset)
+                w[np.ix_(picked, subset)] += share[:, None]
+        return w
+
+    def describe(self, candidate_id, columns, group_names):
+        coords = np.unravel_index(candidate_id, self.shape)
+        weights = self.weights[coords[-1]]
+        return {name: ([columns[i] for i in self.subsets[g][coords[g]]], weights[g])
+                for g, name in enumerate(group_names)}
+
+
+_worker = {}
+
+
+def _init_worker(shm_name, shape, space, rebalance, rank_by, keep_top):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    _worker.update(shm=shm,
+                   prices=np.ndarray(shape, dtype='float64', buffer=shm.buf),
+                   space=space, rebalance=rebalance, rank_by=rank_by, keep_top=keep_top)
+
+
+def _evaluate(ids, prices, space, rebalance, rank_by, keep_top):
+    values = sim_engine.simulate_batch(prices, space.weight_matrix(ids), rebalance)
+    metrics = candidate_metrics(values)
+
+    keep = pareto_mask(np.column_stack([metrics[m] for m in OBJECTIVES]))
+    ranked = np.nan_to_num(metrics[rank_by], nan=-np.inf)
+    keep[np.argsort(-ranked, kind='stable')[:keep_top]] = True
+    return ids[keep], {m: v[keep] for m, v in metrics.items()}
+
+
+def _evaluate_range(start, stop):
+    w = _worker
+    return _evaluate(np.arange(start, stop), w['prices'], w['space'], w['rebalance'],
+                     w['rank_by'], w['keep_top'])
+
+
+def search(prices, groups, rank_by='cagr', step=0.1, allow_zero=False, min_size=1,
+           max_size=None, calendar='yearly', top=20, workers=1, chunk_size=4096):
+    """
+    Evaluate every candidate allocation of `groups` over a price DataFrame and
+    return the `top` candidates by `rank_by`, plus a flag for whether each is
+    on the overall efficient frontier.
+    """
+    if rank_by not in RANK_METRICS:
+        raise ValueError(f'Cannot rank by {rank_by}, choose one of {RANK_METRICS}')
+
+    columns = list(prices.columns)
+    group_names = [name for name, group in groups.items()
+                   if any(key in columns for key in group)]
+    subsets = [group_subsets([columns.index(k) for k in groups[name] if k in columns],
+                             min_size, max_size)
+               for name in group_names]
+    space = Space(subsets, weight_grid(len(group_names), step, allow_zero), len(columns))
+    values = np.ascontiguousarray(prices.to_numpy(dtype='float64'))
+    rebalance = sim_engine.rebalance_mask(prices.index, calendar)
+    ranges = [(start, min(start + chunk_size, space.size))
+              for start in range(0, space.size, chunk_size)]
+
+    if workers > 1 and len(ranges) > 1:
+        shm = shared_memory.SharedMemory(create=True, size=values.nbytes)
+        try:
+            np.ndarray(values.shape, dtype='float64', buffer=shm.buf)[:] = values
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(shm.name, values.shape, space, rebalance,
+                                               rank_by, top)) as pool:
+                results = list(pool.map(_evaluate_range, *zip(*ranges)))
+        finally:
+            shm.close()
+            shm.unlink()
+    else:
+        results = [_evaluate(np.arange(start, stop), values, space, rebalance, rank_by, top)
+                   for start, stop in ranges]
+
+    ids = np.concatenate([r[0] for r in results])
+    metrics = {m: np.concatenate([r[1][m] for r in results]) for m in METRIC_NAMES}
+    frontier = pareto_mask(np.column_stack([metrics[m] for m in OBJECTIVES]))
+    order = np.argsort(-np.nan_to_num(metrics[rank_by], nan=-np.inf), kind='stable')[:top]
+
+    rows = []
+    for i in order:
+        allocation = space.describe(ids[i], columns, group_names)
+        row = {m: metrics[m][i] for m in METRIC_NAMES}
+        row['frontier'] = bool(frontier[i])
+        for name, (funds, weight) in allocation.items():
+            row[f'{name}_weight'] = weight
+            row[f'{name}_funds'] = ', '.join(funds)
+        rows.append(pd.Series(row, name=int(ids[i])))
+
+    return pd.DataFrame(rows), space.size
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Search tailored-dragon allocations.')
+    parser.add_argument('--rank-by', choices=RANK_METRICS, default='cagr')
+    parser.add_argument('--step', type=float, default=0.1)
+    parser.add_argument('--max-size', type=int, default=None)
+    parser.add_argument('--top', type=int, default=20)
+    parser.add_argument('--workers', type=int, default=1)
+    args = parser.parse_args()
+
+    groups = {name: group for name, group in data_loader.tailored.items() if len(group) > 0}
+    prices = load_prices(groups)
+    table, n_candidates = search(prices, groups, args.rank_by, args.step,
+                                 max_size=args.max_size, top=args.top, workers=args.workers)
+    print(table.to_string())
+    print(f'Evaluated {n_candidates} candidates over {len(prices)} months.')
+
+
+if __name__ == '__main__':
+    main()
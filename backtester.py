@@ -0,0 +1,222 @@
+"""
+Vectorized backtests of nested strategy trees.
+
+A strategy holds securities (columns of the price DataFrame) or other
+strategies, weights them equally or by inverse volatility and rebalances to
+those weights on its run dates, or on every date when it has no schedule, as
+a bt child strategy without a Run algo does. Between two run dates a
+strategy's value is its weighted price relatives since the last run plus any
+cash, so every holding period is one array expression instead of a step of a
+day-by-day loop. Child strategies are valued first and enter their parent as
+price series.
+
+The conventions are bt's, so results agree with a bt.Backtest of the same
+tree with fractional positions: prices get a leading row one day before the
+data at PAR, scheduled strategies run on the first date and then on the
+first date of every new period, and inverse volatility uses the returns of
+the trailing three months. The performance figures follow ffn's
+PerformanceStats for monthly data.
+"""
+from collections import namedtuple
+import math
+import numpy as np
+import pandas as pd
+import fund_stats
+import instrument
+from sim_engine import holding_values
+
+PAR = 100
+WEIGHINGS = ('equal', 'inv_vol')
+SCHEDULES = ('monthly', 'quarterly', 'yearly')
+LOOKBACK = pd.DateOffset(months=3)
+MONTH_NAMES = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
+               'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+STAT_KEYS = ['cagr', 'max_drawdown', 'calmar', 'three_month', 'monthly_vol', 'monthly_sharpe',
+             'monthly_skew', 'best_month', 'worst_month', 'best_year', 'worst_year']
+
+Strategy = namedtuple('Strategy', ['name', 'children', 'weigh', 'run'])
+Performance = namedtuple('Performance', ['stats', 'return_table'])
+
+
+def strategy(name, children, weigh='equal', run=None):
+    """
+    A strategy over `children`, which are tickers or other strategies,
+    weighted by `weigh` and rebalanced on the `run` schedule (every date when
+    None).
+    """
+    if weigh not in WEIGHINGS:
+        raise ValueError(f'Unknown weighing: {weigh}, choose one of {WEIGHINGS}')
+    if run is not None and run not in SCHEDULES:
+        raise ValueError(f'Unknown schedule: {run}, choose one of {SCHEDULES}')
+    return Strategy(name, list(children), weigh, run)
+
+
+def run_mask(dates, run=None):
+    """Run flags for `dates`: all of them, or the first date and the first date of each new period."""
+    if run is None:
+        return np.ones(len(dates), dtype=bool)
+    if run == 'monthly':
+        key = dates.year * 12 + dates.month
+    elif run == 'quarterly':
+        key = dates.year * 4 + dates.quarter
+    else:
+        key = dates.year
+    key = np.asarray(key)
+    return np.concatenate(([True], key[1:] != key[:-1]))
+
+
+def selected(prices):
+    """Funds with a usable price, as bt's SelectAll."""
+    with np.errstate(invalid='ignore'):
+        return np.isfinite(prices) & (prices > 0)
+
+
+def equal_weights(prices, rows):
+    held = selected(prices[rows])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(held, 1 / held.sum(axis=1, keepdims=True), 0)
+
+
+def inv_vol_weights(prices, dates, rows, lookback=LOOKBACK):
+    """
+    Inverse volatility weights at `rows`, from the sample std of the returns
+    within the trailing `lookback` (both ends included). Funds with fewer
+    than two returns in the window get no weight, a lone fund gets all of it.
+    """
+    held = selected(prices[rows])
+    returns = np.full(prices.shape, np.nan)
+    returns[1:] = prices[1:] / prices[:-1] - 1
+
+    # The return of the window's first row reaches outside it.
+    first = np.searchsorted(dates, dates[rows] - lookback)
+    offsets = np.arange(max((rows - first).max(), 1))
+    window_rows = rows[:, None] - offsets
+    inside = window_rows > first[:, None]
+    window = np.where(inside[:, :, None], returns[np.maximum(window_rows, 0)], np.nan)
+
+    valid = ~np.isnan(window)
+    count = valid.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(valid, window, 0).sum(axis=1) / count
+        d = np.where(valid, window - mean[:, None], 0)
+        std = np.sqrt((d * d).sum(axis=1) / (count - 1))
+        vol = np.where(held & (count > 1) & (std > 0), 1 / std, np.nan)
+        weights = np.nan_to_num(vol / np.nansum(vol, axis=1, keepdims=True))
+
+    lone = held.sum(axis=1) == 1
+    weights[lone] = held[lone]
+    return weights
+
+
+def _value(node, dates, universe, columns, out):
+    out[node.name] = None
+    series = []
+    for child in node.children:
+        if isinstance(child, Strategy):
+            series.append(_value(child, dates, universe, columns, out))
+        else:
+            series.append(universe[:, columns[child]])
+    prices = np.column_stack(series)
+
+    # The leading row is before the data and never runs.
+    rows = np.flatnonzero(run_mask(dates[1:], node.run)) + 1
+    if node.weigh == 'inv_vol':
+        weights = inv_vol_weights(prices, dates, rows)
+    else:
+        weights = equal_weights(prices, rows)
+
+    values = PAR * holding_values(prices, weights, rows)
+    out[node.name] = values
+    return values
+
+
+@instrument.timed('backtest')
+def backtest(strategy, prices):
+    """
+    Price series of `strategy` and each of its sub-strategies over a
+    DataFrame of security prices, as a DataFrame with the top strategy first.
+    """
+    dates = prices.index.insert(0, prices.index[0] - pd.Timedelta(days=1))
+    universe = np.vstack((np.full((1, prices.shape[1]), np.nan),
+                          prices.to_numpy(dtype='float64')))
+    columns = {name: i for i, name in enumerate(prices.columns)}
+    out = {}
+    _value(strategy, dates, universe, columns, out)
+    return pd.DataFrame(out, index=dates)
+
+
+def _period_last(values, keys):
+    """Last value of every period from keys[0] to keys[-1], NaN for periods without data."""
+    last = np.flatnonzero(np.concatenate((keys[1:] != keys[:-1], [True])))
+    out = np.full(keys[-1] - keys[0] + 1, np.nan)
+    out[keys[last] - keys[0]] = values[last]
+    return out
+
+
+def _lookback_price(dates, values, months):
+    end = dates[-1]
+    last_business_day = pd.offsets.BMonthEnd().rollback(end + pd.offsets.MonthEnd(0))
+    if end.normalize() >= last_business_day.normalize():
+        before = dates.year * 12 + dates.month <= end.year * 12 + end.month - months
+    else:
+        before = dates <= end - pd.DateOffset(months=months)
+    before = np.asarray(before)
+    return values[before][-1] if before.any() else np.nan
+
+
+@instrument.timed('backtest.performance')
+def performance(prices):
+    """
+    Performance of a monthly price Series: its start, end and STAT_KEYS as a
+    Series, and a table of monthly returns by year with a YTD column.
+    """
+    prices = prices.dropna()
+    dates = prices.index
+    values = prices.to_numpy(dtype='float64')
+    af = math.sqrt(12)
+
+    years = (dates[-1] - dates[0]).total_seconds() / 31557600
+    cagr = (values[-1] / values[0]) ** (1 / years) - 1
+    max_drawdown = (values / np.maximum.accumulate(values)).min() - 1
+
+    month_keys = np.asarray(dates.year * 12 + dates.month - 1)
+    mp = _period_last(values, month_keys)
+    mr = np.concatenate(([np.nan], mp[1:] / mp[:-1] - 1))
+    monthly = mr[~np.isnan(mr)]
+    _, mean, std, skew, _ = fund_stats.moments(monthly, axis=-1)
+
+    yp = _period_last(values, np.asarray(dates.year))
+    yearly = yp[1:] / yp[:-1] - 1
+    yearly = yearly[~np.isnan(yearly)]
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        stats = {
+            'start': dates[0],
+            'end': dates[-1],
+            'cagr': cagr,
+            'max_drawdown': max_drawdown,
+            'calmar': cagr / abs(max_drawdown),
+            'three_month': values[-1] / _lookback_price(dates, values, 3) - 1,
+            'monthly_vol': std * af,
+            'monthly_sharpe': mean / std * af if std > 0 else np.nan,
+            'monthly_skew': skew if len(mr) >= 4 and len(monthly) >= 3 else np.nan,
+            'best_month': monthly.max() if len(monthly) else np.nan,
+            'worst_month': monthly.min() if len(monthly) else np.nan,
+            'best_year': yearly.max() if len(yearly) else np.nan,
+            'worst_year': yearly.min() if len(yearly) else np.nan,
+        }
+
+    # Months without a return count as flat; the first month is measured from
+    # the first price.
+    first_year = month_keys[0] // 12
+    table = np.zeros((month_keys[-1] // 12 - first_year + 1, 12))
+    bins = month_keys[0] + np.arange(len(mr))
+    has_return = ~np.isnan(mr)
+    table[bins[has_return] // 12 - first_year, bins[has_return] % 12] = mr[has_return]
+    table[0, month_keys[0] % 12] = mp[0] / values[0] - 1
+    ytd = np.prod(table + 1, axis=1) - 1
+
+    return_table = pd.DataFrame(np.column_stack((table, ytd)),
+                                index=first_year + np.arange(len(table)),
+                                columns=MONTH_NAMES + ['YTD'])
+    return Performance(pd.Series(stats, dtype=object), return_table)
@@ -0,0 +1,167 @@
+"""
+Render tailored-dragon reports for a batch of portfolios.
+
+Portfolios are read from a JSON list of {"name": ..., "groups": {...}}, with
+groups laid out like data_loader.tailored, and rendered concurrently, one
+report per worker process. The performance, correlation and info fragments
+are cached on disk under a hash of everything they are computed from (the
+fund series, the strategy and the rendering code version), so a variant that
+shares its funds with last month's run, or with another client in the same
+batch, skips the backtest and the Styler rendering.
+
+    python batch_report.py portfolios.json -o reports --workers 4
+"""
+import argparse
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+import pandas as pd
+import data_loader
+import instrument
+import series_cache
+import yanshuf
+
+# Bump when a fragment's rendering changes so cached fragments are redone.
+FRAGMENT_VERSION = 1
+
+
+@lru_cache(maxsize=None)
+def environment():
+    """The Jinja environment, built once per process; it caches compiled templates."""
+    from jinja2 import Environment, PackageLoader, select_autoescape
+
+    return Environment(
+        loader=PackageLoader('yanshuf', 'templates'),
+        autoescape=select_autoescape(['html', 'xml'])
+    )
+
+
+def data_hash(*parts):
+    """sha1 of pandas objects (values, index and labels) and plain values."""
+    h = hashlib.sha1(str(FRAGMENT_VERSION).encode())
+    for part in parts:
+        if isinstance(part, (pd.Series, pd.DataFrame)):
+            h.update(pd.util.hash_pandas_object(part, index=True).to_numpy().tobytes())
+            labels = part.name if isinstance(part, pd.Series) else list(part.columns)
+            h.update(repr(labels).encode())
+        else:
+            h.update(repr(part).encode())
+    return h.hexdigest()
+
+
+def fragment_dir():
+    return os.path.join(series_cache.CACHE_DIR, 'fragments')
+
+
+def cached_fragment(key, render):
+    """The fragment stored under `key`, rendering and storing it on a miss. Returns (html, hit)."""
+    path = os.path.join(fragment_dir(), key + '.html')
+    try:
+        with open(path) as f:
+            html = f.read()
+        instrument.count('report.fragment_hit')
+        return html, True
+    except OSError:
+        pass
+    instrument.count('report.fragment_miss')
+
+    html = render()
+    os.makedirs(fragment_dir(), exist_ok=True)
+    # Replace rather than write in place: workers may race on a shared fragment.
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as f:
+        f.write(html)
+    os.replace(tmp, path)
+    return html, False
+
+
+@instrument.timed('render.info')
+def render_info(info):
+    return environment().get_template('info.html.jinja').render(info=info)
+
+
+@instrument.timed('render.page')
+def render_page(perf, corr, info_html):
+    return environment().get_template('index.html.jinja').render(perf=perf, corr=corr, info=info_html)
+
+
+def render_report(perf, corr, info):
+    """The full page for rendered performance and correlation tables and fund info."""
+    return render_page(perf, corr, render_info(info))
+
+
+def build_report(name, groups):
+    """
+    Render the report of one portfolio through the fragment cache. Returns
+    the page and which fragments were reused.
+    """
+    strategy, keys = yanshuf.tailored_strategy(groups, name)
+    data = yanshuf.compile_data(55, keys)
+    series = [data[k] for k in keys if k in data]
+    info = yanshuf.tailored_info(groups)
+    names = {k: data_loader.shortnames.get(k) for k in keys}
+
+    def performance():
+        stats, _ = yanshuf.dragon_backtest(keys, strategy, data)
+        return yanshuf.render_performance(stats)
+
+    perf, perf_hit = cached_fragment(data_hash('perf', strategy, yanshuf.stat_keys, *series),
+                                     performance)
+    corr, corr_hit = cached_fragment(data_hash('corr', names, yanshuf.corr_table_limit, *series),
+                                     lambda: yanshuf.render_corr(yanshuf.tailored_returns(keys, data)))
+    info_html, info_hit = cached_fragment(data_hash('info', info), lambda: render_info(info))
+
+    return render_page(perf, corr, info_html), {'perf': perf_hit, 'corr': corr_hit, 'info': info_hit}
+
+
+def _write_report(out_dir, name, groups):
+    page, hits = build_report(name, groups)
+    path = os.path.join(out_dir, name + '.html')
+    with open(path, 'w') as f:
+        f.write(page)
+    return path, hits
+
+
+def read_portfolios(path):
+    with open(path) as f:
+        return [(p['name'], p['groups']) for p in json.load(f)]
+
+
+def run_batch(portfolios, out_dir, workers=1):
+    """Write a report per (name, groups) portfolio to `out_dir`. Returns (path, hits) for each."""
+    os.makedirs(out_dir, exist_ok=True)
+    names = [name for name, _ in portfolios]
+    if len(set(names)) != len(names):
+        raise ValueError('Portfolio names must be unique')
+
+    args = [(out_dir, name, groups) for name, groups in portfolios]
+    if workers > 1 and len(args) > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=environment) as pool:
+            return list(pool.map(_write_report, *zip(*args)))
+    return [_write_report(*a) for a in args]
+
+
+def write_reports(portfolios_path, out_dir, workers):
+    """Render the portfolios in a JSON file, or data_loader.tailored, and list the reports."""
+    portfolios = read_portfolios(portfolios_path) if portfolios_path \
+        else [('tailored-dragon', data_loader.tailored)]
+    for path, hits in run_batch(portfolios, out_dir, workers):
+        reused = [k for k, hit in hits.items() if hit]
+        print(f"{path}  reused: {', '.join(reused) or '-'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Render tailored-dragon reports for many portfolios.')
+    parser.add_argument('portfolios', nargs='?',
+                        help='JSON list of {"name", "groups"}; default data_loader.tailored')
+    parser.add_argument('-o', '--out-dir', default='reports')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+    write_reports(args.portfolios, args.out_dir, args.workers)
+
+
+if __name__ == '__main__':
+    main()
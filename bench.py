@@ -0,0 +1,228 @@
+"""
+Benchmarks of loading, stats, simulation and backtesting on synthetic data.
+
+    python bench.py [--funds 10 100 1000 5000] [--years 10 25 50] [--only load simulate]
+
+Each benchmark is timed at every scale (number of funds by years of monthly
+history). Every run appends one JSON line per benchmark and scale to the
+history file and flags timings that got slower than the previous run of the
+same benchmark at the same scale.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+import backtester
+import fund_tree
+import parsers
+import return_store
+import series_cache
+import sim_engine
+import simulator
+import synthetic
+import yanshuf
+from skill_metric import skill_metric, skill_metric_array
+
+FUNDS = (10, 100, 1000, 5000)
+YEARS = (10, 25, 50)
+HISTORY = os.environ.get('YANSHUF_BENCH_HISTORY', 'bench_history.jsonl')
+# Slowdown relative to the previous run that gets flagged.
+THRESHOLD = 0.2
+
+Benchmark = namedtuple('Benchmark', ['run', 'reset'])
+
+
+def dataset(work_dir, funds, years):
+    """Synthetic files for a scale, written once per work directory."""
+    directory = os.path.join(work_dir, f'data_{funds}x{years}') + os.sep
+    listing = os.path.join(directory, 'sheets.json')
+    if not os.path.exists(listing):
+        sheets = synthetic.write_dataset(directory, funds, years)
+        with open(listing, 'w') as f:
+            json.dump(sheets, f)
+    with open(listing) as f:
+        return directory, json.load(f)
+
+
+def setup_load(work_dir, funds, years, warm=False):
+    directory, sheets = dataset(work_dir, funds, years)
+    parsers.use_data(directory, sheets)
+    series_cache.CACHE_DIR = os.path.join(directory, '.cache')
+    keys = parsers.all_keys()
+    if warm:
+        parsers.load(keys)
+        return Benchmark(lambda: parsers.load(keys), None)
+    return Benchmark(lambda: parsers.load(keys), series_cache.invalidate)
+
+
+def setup_load_cached(work_dir, funds, years):
+    return setup_load(work_dir, funds, years, warm=True)
+
+
+def setup_flatten(work_dir, funds, years):
+    tree = synthetic.fund_tree([f'fund_{i:05d}' for i in range(funds)])
+    return Benchmark(lambda: fund_tree.flatten(tree), None)
+
+
+def setup_compute_stats(work_dir, funds, years):
+    prices = synthetic.random_prices(funds, years)
+    portfolio = prices.mean(axis=1)
+    return Benchmark(lambda: simulator.make_stats_df(prices, portfolio), None)
+
+
+def _moments(funds):
+    rng = np.random.default_rng(0)
+    return rng.normal(0.08, 0.03, funds), rng.uniform(0.05, 0.3, funds), rng.normal(0, 0.1, funds)
+
+
+def setup_skill_metric(work_dir, funds, years):
+    mu, sigma, skew = _moments(funds)
+    return Benchmark(lambda: [skill_metric(m, s, k) for m, s, k in zip(mu, sigma, skew)], None)
+
+
+def setup_skill_metric_array(work_dir, funds, years):
+    mu, sigma, skew = _moments(funds)
+    return Benchmark(lambda: skill_metric_array(mu, sigma, skew), None)
+
+
+def setup_simulate(work_dir, funds, years):
+    prices = synthetic.random_prices(funds, years)
+    weights = fund_tree.flatten(synthetic.fund_tree(list(prices.columns)))
+    return Benchmark(lambda: sim_engine.simulate_frame(prices, weights, 'yearly',
+                                                       is_taxable=lambda name: True,
+                                                       tax_rate=0.25), None)
+
+
+def setup_dragon_backtest(work_dir, funds, years):
+    # End in 2020 so the report's 2018-2020 columns exist.
+    prices = synthetic.random_prices(funds, years, start=f'{2021 - years}-01-01')
+    data = return_store.build(dict(prices.items()))
+    keys = list(prices.columns)
+    groups = np.array_split(np.array(keys), min(6, funds))
+    strategy = backtester.strategy('dragon', [
+        backtester.strategy(f'group_{g}', list(group), 'inv_vol' if g % 2 else 'equal')
+        for g, group in enumerate(groups)
+    ], 'equal', run='yearly')
+    return Benchmark(lambda: yanshuf.dragon_backtest(keys, strategy, data), None)
+
+
+# name -> (setup, whether the scale's years matter)
+BENCHMARKS = {
+    'load': (setup_load, True),
+    'load_cached': (setup_load_cached, True),
+    'flatten': (setup_flatten, False),
+    'compute_stats': (setup_compute_stats, True),
+    'skill_metric': (setup_skill_metric, False),
+    'skill_metric_array': (setup_skill_metric_array, False),
+    'simulate': (setup_simulate, True),
+    'dragon_backtest': (setup_dragon_backtest, True),
+}
+
+
+def time_call(benchmark, repeat):
+    times = []
+    for _ in range(repeat):
+        if benchmark.reset is not None:
+            benchmark.reset()
+        start = time.perf_counter()
+        benchmark.run()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'machine': platform.node(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+    }
+
+
+def read_history(path):
+    """The last record of every (benchmark, funds, years) in a history file."""
+    last = {}
+    if not os.path.exists(path):
+        return last
+    with open(path) as f:
+        for line in f:
+            record = json.loads(line)
+            last[(record['benchmark'], record['funds'], record['years'])] = record
+    return last
+
+
+def scales(names, funds, years):
+    for name in names:
+        _, uses_years = BENCHMARKS[name]
+        for n in funds:
+            for y in (years if uses_years else [None]):
+                yield name, n, y
+
+
+def run(names, funds, years, repeat=3, history=HISTORY, work_dir=None):
+    previous = read_history(history)
+    env = environment()
+    stamp = datetime.datetime.now().isoformat(timespec='seconds')
+    records = []
+
+    # The load benchmarks point the loader at synthetic files; put it back after each.
+    data = (parsers.DATA_DIR, parsers.spreadsheets, series_cache.CACHE_DIR)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        work_dir = work_dir or tmp
+        for name, n, y in scales(names, funds, years):
+            setup, _ = BENCHMARKS[name]
+            try:
+                times = time_call(setup(work_dir, n, y or years[0]), repeat)
+            finally:
+                parsers.use_data(*data[:2])
+                series_cache.CACHE_DIR = data[2]
+            record = dict(env, time=stamp, benchmark=name, funds=n, years=y, repeat=repeat,
+                          best=min(times), median=float(np.median(times)))
+            records.append(record)
+
+            before = previous.get((name, n, y))
+            change = ''
+            if before is not None:
+                ratio = record['best'] / before['best'] - 1
+                change = f'{ratio:+.0%} vs {before["commit"]}'
+                if ratio > THRESHOLD:
+                    change += '  SLOWER'
+            print(f'{name:20} {n:6d} {y or "":>4} {record["best"]:10.4f}s  {change}', flush=True)
+
+            with open(history, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS), default=list(BENCHMARKS))
+    parser.add_argument('--funds', nargs='+', type=int, default=FUNDS)
+    parser.add_argument('--years', nargs='+', type=int, default=YEARS)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--history', default=HISTORY)
+    parser.add_argument('--work-dir', default=None,
+                        help='keep the synthetic files here to reuse them between runs')
+    args = parser.parse_args()
+
+    run(args.only, args.funds, args.years, args.repeat, args.history, args.work_dir)
+
+
+if __name__ == '__main__':
+    main()
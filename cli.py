@@ -0,0 +1,210 @@
+"""
+Command line entry point.
+
+    python cli.py report [PORTFOLIOS] [-o OUT_DIR] [--workers N]
+    python cli.py simulate
+    python cli.py vintage [--horizon MONTHS] [--calendar yearly]
+    python cli.py policies [SPEC ...] [--cost FRACTION]
+    python cli.py stats KEY [KEY ...] [--bootstrap N [--confidence 0.9] [--workers N]]
+    python cli.py ingest [KEY ...] [--rebuild]
+    python cli.py update [--calendar yearly]
+    python cli.py serve [--host HOST] [--port PORT] [--interval SECONDS]
+
+Subcommands import what they need when they run, so starting the process
+costs little more than the interpreter itself. Before the subcommand,
+--trace FILE writes a Chrome trace of the run's timing spans, --timings FILE
+(or -) their totals and counters as JSON, and --profile FILE a cProfile dump,
+or with --sampler a pyinstrument report.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import instrument
+
+POLICIES = ('yearly', 'quarterly', 'monthly', 'monthly:0.05', 'quarterly:0.05', 'monthly:0.25r')
+
+
+def report(args):
+    import batch_report
+
+    if args.portfolios is None and args.out_dir is None:
+        import yanshuf
+        print(batch_report.render_report(*yanshuf.run_tailored_dragon()))
+    else:
+        batch_report.write_reports(args.portfolios, args.out_dir or 'reports', args.workers)
+    return 0
+
+
+def simulate(args):
+    import simulator
+    simulator.simulate()
+    return 0
+
+
+def vintage(args):
+    import simulator
+    import vintage as vintage_analysis
+
+    df = simulator.load()
+    table = vintage_analysis.vintages(df, simulator.fund_data, args.calendar, args.horizon,
+                                      simulator.initial_capital)
+    print(table)
+    print(vintage_analysis.summarize(table))
+    return 0
+
+
+def policies(args):
+    import rebalance_policy
+    import simulator
+    import taxes
+
+    df = simulator.load()
+    table = rebalance_policy.compare(df, simulator.fund_data,
+                                     [rebalance_policy.parse(spec, args.cost) for spec in args.specs],
+                                     taxes.is_taxable, taxes.TAX_RATE, simulator.initial_capital)
+    print(table)
+    return 0
+
+
+def stats(args):
+    import pandas as pd
+    import correlation
+    import fund_stats
+    import parsers
+
+    data = parsers.load(args.keys)
+    missing = [k for k in args.keys if k not in data]
+    if missing:
+        print(f"Unknown keys: {', '.join(missing)}", file=sys.stderr)
+        return 1
+    # Each fund over its own history, not only the months they all share.
+    prices = pd.DataFrame({k: data[k] for k in args.keys})
+    if args.bootstrap:
+        print(fund_stats.bootstrap_table(prices, args.bootstrap, args.confidence, seed=args.seed,
+                                         workers=args.workers or os.cpu_count()))
+    else:
+        print(fund_stats.stats_table(prices))
+    print(correlation.corr_frame(correlation.returns_frame({k: data[k] for k in args.keys})))
+    return 0
+
+
+def ingest(args):
+    import incremental
+    import parsers
+    import series_cache
+
+    keys = args.keys or parsers.all_keys()
+    if args.rebuild:
+        series_cache.invalidate(args.keys or None)
+    for key in keys:
+        series, appended = incremental.refresh(key)
+        change = 'reparsed' if appended is None else f'+{appended}'
+        print(f'{key:40} {len(series):6d} {change}')
+    return 0
+
+
+def update(args):
+    import incremental
+
+    incremental.describe(*incremental.update(calendar=args.calendar))
+    return 0
+
+
+def serve(args):
+    import asyncio
+    import report_server
+
+    try:
+        asyncio.run(report_server.serve(args.host, args.port, args.interval))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def parser():
+    p = argparse.ArgumentParser(prog='yanshuf', description='Fund data, simulation and reports.')
+    p.add_argument('-v', '--verbose', action='store_true', help='log at DEBUG level')
+    p.add_argument('--trace', metavar='FILE', help='write a Chrome trace of timing spans')
+    p.add_argument('--timings', metavar='FILE', help='write span totals and counters as JSON, - for stderr')
+    p.add_argument('--profile', metavar='FILE', help='profile the command with cProfile')
+    p.add_argument('--sampler', action='store_true', help='profile with pyinstrument instead')
+    commands = p.add_subparsers(dest='command', required=True)
+
+    r = commands.add_parser('report', help='render tailored-dragon reports')
+    r.add_argument('portfolios', nargs='?',
+                   help='JSON list of {"name", "groups"}; without it and -o, print the default report')
+    r.add_argument('-o', '--out-dir')
+    r.add_argument('--workers', type=int, default=1)
+    r.set_defaults(run=report)
+
+    s = commands.add_parser('simulate', help='simulate data_loader.simulation with taxes')
+    s.set_defaults(run=simulate)
+
+    v = commands.add_parser('vintage', help='simulate data_loader.simulation from every start month')
+    v.add_argument('--horizon', type=int, help='months held; default to the end of the data')
+    v.add_argument('--calendar', default='yearly', choices=['monthly', 'quarterly', 'yearly', 'never'])
+    v.set_defaults(run=vintage)
+
+    c = commands.add_parser('policies', help='compare rebalance policies on data_loader.simulation')
+    c.add_argument('specs', nargs='*', default=list(POLICIES), metavar='SPEC',
+                   help="CALENDAR[:BAND[r]], e.g. yearly, monthly:0.05, quarterly:0.2r")
+    c.add_argument('--cost', type=float, default=0.0, help='fraction of each trade paid in costs')
+    c.set_defaults(run=policies)
+
+    s = commands.add_parser('stats', help='statistics and correlations of funds')
+    s.add_argument('keys', nargs='+')
+    s.add_argument('--bootstrap', type=int, default=0, metavar='N',
+                   help='add confidence intervals from N block-bootstrap resamples')
+    s.add_argument('--confidence', type=float, default=0.9)
+    s.add_argument('--seed', type=int, default=0)
+    s.add_argument('--workers', type=int, help='processes for the resamples; default one per core')
+    s.set_defaults(run=stats)
+
+    i = commands.add_parser('ingest', help='parse new and changed source files into the cache')
+    i.add_argument('keys', nargs='*')
+    i.add_argument('--rebuild', action='store_true', help='drop the cached entries first')
+    i.set_defaults(run=ingest)
+
+    u = commands.add_parser('update', help='advance the simulation checkpoint to the latest months')
+    u.add_argument('--calendar', default='yearly', choices=['monthly', 'quarterly', 'yearly', 'never'])
+    u.set_defaults(run=update)
+
+    h = commands.add_parser('serve', help='serve the report and fund pages, recomputing what changed')
+    h.add_argument('--host', default='127.0.0.1')
+    h.add_argument('--port', type=int, default=8000)
+    h.add_argument('--interval', type=float, default=2.0, help='seconds between checks of DATA_DIR')
+    h.set_defaults(run=serve)
+    return p
+
+
+def run(args):
+    with instrument.span(f'command.{args.command}'):
+        if args.profile:
+            with instrument.profiled(args.profile, args.sampler):
+                return args.run(args)
+        return args.run(args)
+
+
+def main(argv=None):
+    args = parser().parse_args(argv)
+    logging.basicConfig(stream=sys.stderr, level=logging.DEBUG if args.verbose else logging.INFO)
+    if not (args.trace or args.timings):
+        return run(args)
+
+    instrument.enable()
+    try:
+        return run(args)
+    finally:
+        recorder = instrument.disable()
+        if args.trace:
+            instrument.write_json(args.trace, recorder.chrome_trace())
+        if args.timings == '-':
+            print(json.dumps(recorder.summary(), indent=1), file=sys.stderr)
+        elif args.timings:
+            instrument.write_json(args.timings, recorder.summary())
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,143 @@
+"""
+Pairwise-complete correlations of many funds.
+
+Every pair is correlated over the months both funds have returns for, as
+pandas' DataFrame.corr does, but from matrix products of the masked returns
+instead of a loop over pairs. The products are taken one block of funds at a
+time against all the others, so memory stays at a few (block x funds)
+matrices however large the universe is, and the top-k search never holds the
+full matrix. Exponentially weighted correlations are the same products with
+every month weighted by its decay.
+"""
+import numpy as np
+import pandas as pd
+import instrument
+
+BLOCK = 256
+
+
+def returns_frame(data):
+    """
+    Monthly returns of a dict of price series, each over its own history. The
+    frame is not cut down to the months every fund has.
+    """
+    return pd.DataFrame({name: series.pct_change().iloc[1:] for name, series in data.items()})
+
+
+def _masked(returns):
+    returns = np.asarray(returns, dtype='float64')
+    valid = ~np.isnan(returns)
+    # Centre each fund on its mean to keep the cross products well conditioned.
+    shift = np.where(valid, returns, 0).sum(axis=0) / np.maximum(valid.sum(axis=0), 1)
+    x = np.where(valid, returns - shift, 0)
+    return x, valid.astype('float64')
+
+
+def _corr(x, m, rows, min_periods, weights=None):
+    xi, mi = x[:, rows], m[:, rows]
+    n = mi.T @ m
+    # Month weights on the block's side of every product weight each pair's months.
+    if weights is not None:
+        xi, mi = xi * weights[:, None], mi * weights[:, None]
+    w = n if weights is None else mi.T @ m
+    sx = xi.T @ m
+    sy = mi.T @ x
+    sxx = (xi * x[:, rows]).T @ m
+    syy = mi.T @ (x * x)
+    sxy = xi.T @ x
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cov = sxy - sx * sy / w
+        var = (sxx - sx * sx / w) * (syy - sy * sy / w)
+        corr = cov / np.sqrt(var)
+    corr[(n < max(min_periods, 2)) | ~(var > 0)] = np.nan
+    return np.clip(corr, -1, 1), n
+
+
+def corr_blocks(returns, min_periods=1, block=BLOCK, weights=None):
+    """
+    Yield (rows, corr, periods) for consecutive blocks of funds: the slice of
+    funds, their correlations with every fund and the months each pair shares.
+    With `weights`, one per month, months count in proportion to them.
+    """
+    x, m = _masked(returns)
+    weights = None if weights is None else np.asarray(weights, dtype='float64')
+    for start in range(0, x.shape[1], block):
+        rows = slice(start, min(start + block, x.shape[1]))
+        corr, n = _corr(x, m, rows, min_periods, weights)
+        yield rows, corr, n
+
+
+@instrument.timed('corr')
+def pairwise_corr(returns, min_periods=1, block=BLOCK, weights=None):
+    """Correlation matrix of a (months x funds) return array, pair by pair."""
+    returns = np.asarray(returns, dtype='float64')
+    out = np.empty((returns.shape[1], returns.shape[1]))
+    for rows, corr, _ in corr_blocks(returns, min_periods, block, weights):
+        out[rows] = corr
+    return out
+
+
+def corr_frame(returns, min_periods=1):
+    """pairwise_corr of a return DataFrame, labelled like DataFrame.corr."""
+    return pd.DataFrame(pairwise_corr(returns.to_numpy(), min_periods),
+                        index=returns.columns, columns=returns.columns)
+
+
+def rolling_corr(returns, window, rows=None, min_periods=None):
+    """
+    Correlations over the `window` months ending at each of `rows` (default
+    the last one), stacked as (rows x funds x funds), or a single matrix when
+    rows is None. A pair needs `min_periods` shared months, by default all of
+    the window as in pandas' rolling corr.
+    """
+    returns = np.asarray(returns, dtype='float64')
+    min_periods = window if min_periods is None else min_periods
+    ends = [len(returns) - 1] if rows is None else rows
+    out = np.full((len(ends), returns.shape[1], returns.shape[1]), np.nan)
+    for i, end in enumerate(ends):
+        if end + 1 >= window:
+            out[i] = pairwise_corr(returns[end + 1 - window:end + 1], min_periods)
+    return out[0] if rows is None else out
+
+
+def ewm_corr(returns, halflife, rows=None, min_periods=1, block=BLOCK):
+    """
+    Exponentially weighted correlations at each of `rows` (default the last),
+    matching pandas' ewm(halflife=...).corr: weights decay every month and a
+    pair takes in the months both funds have.
+    """
+    returns = np.asarray(returns, dtype='float64')
+    decay = 0.5 ** (1 / halflife)
+    ends = [len(returns) - 1] if rows is None else rows
+    out = np.stack([pairwise_corr(returns[:end + 1], min_periods, block,
+                                  weights=decay ** np.arange(end, -1, -1.0)) for end in ends])
+    return out[0] if rows is None else out
+
+
+def top_pairs(returns, k=5, min_periods=12, largest=True, block=BLOCK):
+    """
+    The k funds most correlated with each fund in a return DataFrame, or the
+    least correlated with largest=False, as a table of fund, other, corr and
+    the months the pair shares.
+    """
+    names = np.asarray(returns.columns)
+    k = min(k, len(names) - 1)
+    frames = []
+    for rows, corr, n in corr_blocks(returns.to_numpy(), min_periods, block):
+        own = np.arange(rows.start, rows.stop)
+        corr[own - rows.start, own] = np.nan
+        key = np.where(np.isnan(corr), -np.inf, corr if largest else -corr)
+        best = np.argpartition(-key, k - 1, axis=1)[:, :k] if k > 0 else np.empty((len(own), 0), int)
+        order = np.argsort(-np.take_along_axis(key, best, axis=1), axis=1, kind='stable')
+        best = np.take_along_axis(best, order, axis=1)
+        picked = np.take_along_axis(corr, best, axis=1)
+        keep = ~np.isnan(picked)
+        frames.append(pd.DataFrame({
+            'fund': np.repeat(names[own], k)[keep.ravel()],
+            'other': names[best][keep],
+            'corr': picked[keep],
+            'periods': np.take_along_axis(n, best, axis=1)[keep].astype(int),
+        }))
+    if not frames:
+        return pd.DataFrame(columns=['fund', 'other', 'corr', 'periods'])
+    return pd.concat(frames, ignore_index=True)
@@ -0,0 +1,223 @@
+"""
+Performance statistics of many funds in one pass.
+
+The kernel takes prices with time on axis -2, a (months x funds) matrix or a
+stack of them such as (paths x months x funds), and computes every metric for
+all columns with a handful of array reductions instead of a pandas/empyrical
+call chain per fund. Missing prices, e.g. before a fund starts, are skipped
+the way compute_stats' dropna skips them.
+
+Because stacks are computed as one, bootstrap confidence intervals cost a
+resampled (resamples x months x funds) return array per chunk and one call
+of the kernel on it. Each fund is resampled from its own history only, with
+the block bootstrap of the resampling module.
+"""
+import math
+import warnings
+import numpy as np
+import pandas as pd
+import instrument
+import resampling
+from skill_metric import skill_metric_array
+
+# What compute_stats reports, and what summary() computes.
+CORE_METRICS = ('calmar', 'tau', 'cagr', 'max_drawdown', 'vol', 'sharpe',
+                'skew', 'kurt', 'raw_skew', 'raw_kurt')
+METRICS = CORE_METRICS + ('var', 'cvar')
+# Tail probability of the monthly VaR and CVaR, as in empyrical.
+VAR_CUTOFF = 0.05
+# Coverage of the bootstrap intervals.
+CONFIDENCE = 0.9
+
+
+def shape(n, m2, m3, m4):
+    """
+    Sample std, bias-corrected skew and excess kurtosis, as pandas computes
+    them, from the count and the sums of the 2nd to 4th powers of deviations
+    from the mean.
+    """
+    with np.errstate(invalid='ignore', divide='ignore'):
+        std = np.sqrt(m2 / (n - 1))
+        skew = np.sqrt(n * (n - 1)) / (n - 2) * (m3 / n) / (m2 / n) ** 1.5
+        kurt = (n + 1) * n * (n - 1) * m4 / ((n - 2) * (n - 3) * m2 * m2) \
+            - 3 * (n - 1) ** 2 / ((n - 2) * (n - 3))
+    return std, skew, kurt
+
+
+def moments(returns, axis=-2):
+    """
+    Count, mean, sample std, bias-corrected skew and excess kurtosis along
+    `axis`, ignoring NaN, as pandas computes them.
+    """
+    returns = np.asarray(returns, dtype='float64')
+    valid = ~np.isnan(returns)
+    n = valid.sum(axis=axis)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(valid, returns, 0).sum(axis=axis) / n
+        d = np.where(valid, returns - np.expand_dims(mean, axis), 0)
+    d2 = d * d
+    m2 = d2.sum(axis=axis)
+    m3 = (d2 * d).sum(axis=axis)
+    m4 = (d2 * d2).sum(axis=axis)
+    return (n, mean) + shape(n, m2, m3, m4)
+
+
+def summary(mean, std, raw_skew, raw_kurt, cagr, max_drawdown):
+    """
+    The CORE_METRICS, as a dict of arrays, from the moments of monthly
+    returns, the CAGR and the max drawdown (at most 0).
+    """
+    af = math.sqrt(12)
+    mu = mean * 12
+    sigma = std * af
+    skew = raw_skew / af
+    with np.errstate(invalid='ignore', divide='ignore'):
+        calmar = np.where(max_drawdown < 0, cagr / np.abs(max_drawdown), np.nan)
+        calmar[np.isinf(calmar)] = np.nan
+        sharpe = mu / sigma
+
+    return {
+        'calmar': calmar,
+        'tau': skill_metric_array(mu, sigma, skew),
+        'cagr': cagr,
+        'max_drawdown': max_drawdown,
+        'vol': sigma,
+        'sharpe': sharpe,
+        'skew': skew,
+        'kurt': raw_kurt / 12,
+        'raw_skew': raw_skew,
+        'raw_kurt': raw_kurt,
+    }
+
+
+def nan_quantile(x, q, n):
+    """
+    The `q` quantile along axis -2 of `x`, which has `n` values that are not
+    NaN per column, interpolated linearly as np.nanpercentile does. One sort
+    of the stack instead of a quantile per column.
+    """
+    if x.shape[-2] == 0:
+        return np.full(np.shape(n), np.nan)
+    ordered = np.sort(x, axis=-2)
+    position = np.maximum(n - 1, 0) * q
+    below = np.floor(position).astype(np.int64)
+    above = np.minimum(below + 1, np.maximum(n - 1, 0))
+    a = np.take_along_axis(ordered, below[..., None, :], axis=-2)[..., 0, :]
+    b = np.take_along_axis(ordered, above[..., None, :], axis=-2)[..., 0, :]
+    t = position - below
+    with np.errstate(invalid='ignore'):
+        value = np.where(t >= 0.5, b - (b - a) * (1 - t), a + (b - a) * t)
+    return np.where(n > 0, value, np.nan)
+
+
+@instrument.timed('stats')
+def fund_stats(prices, cutoff=VAR_CUTOFF):
+    """
+    Every metric in METRICS for monthly `prices` with time on axis -2, as a
+    dict of arrays without that axis. Figures match compute_stats; var and
+    cvar are the `cutoff` quantile of monthly returns and the mean beyond it.
+    """
+    return return_stats(price_returns(prices), cutoff)
+
+
+def price_returns(prices):
+    """
+    Returns of `prices`, with time on axis -2, from each price to the fund's
+    previous one, NaN where a price is missing. A return spans any gap before
+    it, as pct_change after dropna.
+    """
+    prices = np.asarray(prices, dtype='float64')
+    rows = np.arange(prices.shape[-2])[:, None]
+    last = np.maximum.accumulate(np.where(np.isnan(prices), 0, rows), axis=-2)
+    return prices[..., 1:, :] / np.take_along_axis(prices, last[..., :-1, :], axis=-2) - 1
+
+
+def return_stats(returns, cutoff=VAR_CUTOFF):
+    """fund_stats of monthly `returns` rather than prices."""
+    n, mean, std, raw_skew, raw_kurt = moments(returns)
+
+    # Gaps count as flat months, which leaves growth and drawdowns unchanged.
+    growth = np.where(np.isnan(returns), 1, 1 + returns)
+    wealth = np.cumprod(growth, axis=-2)
+    peaks = np.maximum(np.maximum.accumulate(wealth, axis=-2), 1)
+    max_drawdown = np.minimum((wealth / peaks).min(axis=-2) - 1, 0)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cagr = wealth[..., -1, :] ** (12 / n) - 1
+
+    var = nan_quantile(returns, cutoff, n)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        tail = returns <= var[..., None, :]
+        cvar = np.where(tail, returns, 0).sum(axis=-2) / tail.sum(axis=-2)
+
+    stats = summary(mean, std, raw_skew, raw_kurt, cagr, max_drawdown)
+    stats.update(var=var, cvar=cvar)
+    return stats
+
+
+def stats_table(prices, cutoff=VAR_CUTOFF):
+    """fund_stats of a (months x funds) DataFrame as a metrics x funds DataFrame."""
+    stats = fund_stats(prices.to_numpy(dtype='float64'), cutoff)
+    return pd.DataFrame([stats[m] for m in METRICS], index=list(METRICS), columns=prices.columns)
+
+
+def packed_returns(prices):
+    """
+    Every fund's monthly returns, as price_returns gives them, moved to the
+    top of a (months x funds) array, NaN below them, and how many each fund
+    has.
+    """
+    returns = price_returns(prices)
+    valid = ~np.isnan(returns)
+    n = valid.sum(axis=0)
+    order = np.argsort(~valid, axis=0, kind='stable')
+    return np.take_along_axis(returns, order, axis=0)[:int(n.max(initial=0))], n
+
+
+def _bootstrap_chunk(packed, n, block, stationary, cutoff, n_resamples, seed):
+    rng = np.random.default_rng(seed)
+    idx = resampling.bootstrap_indices(rng, n_resamples, len(packed), n, block, stationary)
+    returns = packed[idx, np.arange(len(n))]
+    # A fund's resampled history is as long as its own.
+    returns[:, np.arange(len(packed))[:, None] >= n] = np.nan
+    return return_stats(returns, cutoff)
+
+
+@instrument.timed('stats.bootstrap')
+def bootstrap_stats(prices, n_resamples=2000, block=12, stationary=True, seed=0, workers=1,
+                    cutoff=VAR_CUTOFF, chunk_size=None):
+    """
+    fund_stats of `n_resamples` block-bootstrap resamples of every fund in a
+    (months x funds) price matrix, as a dict of (resamples x funds) arrays.
+    """
+    packed, n = packed_returns(prices)
+    n_funds = len(n)
+    if chunk_size is None:
+        chunk_size = resampling.chunk_size(len(packed) * n_funds * 8 * 6)
+    results = resampling.run_chunks(_bootstrap_chunk, (packed, n, block, stationary, cutoff),
+                                    n_resamples, chunk_size, seed, workers)
+    instrument.count('stats.resamples', n_resamples * n_funds)
+    return {m: np.concatenate([r[m] for r in results]) if results else np.empty((0, n_funds))
+            for m in METRICS}
+
+
+def bootstrap_table(prices, n_resamples=2000, confidence=CONFIDENCE, cutoff=VAR_CUTOFF, **options):
+    """
+    stats_table of a (months x funds) DataFrame with the `confidence`
+    percentile interval of every metric from bootstrap_stats (which takes
+    the `options`), as (fund, value/low/high) columns.
+    """
+    table = stats_table(prices, cutoff)
+    samples = bootstrap_stats(prices.to_numpy(dtype='float64'), n_resamples, cutoff=cutoff, **options)
+    bounds = {}
+    for m in METRICS:
+        with np.errstate(invalid='ignore'), warnings.catch_warnings():
+            # Metrics that are undefined in every resample, e.g. calmar of a rising fund.
+            warnings.simplefilter('ignore', RuntimeWarning)
+            bounds[m] = np.nanquantile(samples[m], [(1 - confidence) / 2, (1 + confidence) / 2], axis=0)
+    return pd.concat({
+        name: pd.DataFrame({'value': table[name],
+                            'low': [bounds[m][0, j] for m in METRICS],
+                            'high': [bounds[m][1, j] for m in METRICS]}, index=table.index)
+        for j, name in enumerate(prices.columns)
+    }, axis=1)
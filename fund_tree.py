@@ -1,46 +1,131 @@
+"""
+Fund trees: nested (name, pct, children) tuples with (name, pct) funds as
+leaves, every pct relative to its parent.
+
+compile_tree lays a tree out in preorder, so each subtree is a contiguous
+slice of the node arrays (parent index, local weight, depth, subtree size),
+and, when first asked for, a node-by-leaf membership matrix. Effective weights are the
+products of the local weights down each path; changing one node only
+recomputes its own slice.
+"""
 import math
+from functools import cached_property
+import numpy as np
+
+
+class CompiledTree:
+    """Array form of a fund tree. Node 0 is the root."""
+
+    def __init__(self, names, parent, weight, depth, is_leaf):
+        self.names = list(names)
+        self.parent = np.asarray(parent, dtype='int64')
+        self.weight = np.asarray(weight, dtype='float64')
+        self.depth = np.asarray(depth, dtype='int64')
+        self.is_leaf = np.asarray(is_leaf, dtype=bool)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.n_levels = int(self.depth.max()) + 1
+
+        # Parents come before their children, so one pass back gives the
+        # subtree sizes and one pass forward the effective weights.
+        n = len(self.names)
+        parents = self.parent.tolist()
+        weights = self.weight.tolist()
+        size = [1] * n
+        for i in range(n - 1, 0, -1):
+            size[parents[i]] += size[i]
+        effective = weights[:1] + [0.0] * (n - 1)
+        for i in range(1, n):
+            effective[i] = effective[parents[i]] * weights[i]
+        self.size = np.array(size, dtype='int64')
+        self.effective = np.array(effective)
+
+        self.leaves = np.flatnonzero(self.is_leaf)
+        self.leaf_names = [self.names[i] for i in self.leaves]
+
+    @cached_property
+    def children(self):
+        """Child ids of every node, in order."""
+        children = [[] for _ in self.names]
+        for i, p in enumerate(self.parent.tolist()[1:], 1):
+            children[p].append(i)
+        return [np.array(c, dtype='int64') for c in children]
+
+    @cached_property
+    def membership(self):
+        """Node-by-leaf boolean matrix of the leaves under each node."""
+        nodes = np.arange(len(self.names))[:, None]
+        return (self.leaves >= nodes) & (self.leaves < nodes + self.size[:, None])
+
+    def node_id(self, node):
+        return self.index[node] if isinstance(node, str) else int(node)
+
+    def _update(self, i):
+        """Recompute the effective weights of the subtree at node i."""
+        above = self.effective[self.parent[i]] if i > 0 else 1
+        self.effective[i] = above * self.weight[i]
+        ids = np.arange(i + 1, i + self.size[i])
+        for d in range(self.depth[i] + 1, self.n_levels):
+            nodes = ids[self.depth[ids] == d]
+            self.effective[nodes] = self.effective[self.parent[nodes]] * self.weight[nodes]
+
+    def set_weight(self, node, pct):
+        """Change the local weight of one node (a name or id)."""
+        i = self.node_id(node)
+        self.weight[i] = pct
+        self._update(i)
+
+    def leaf_weights(self):
+        """Effective weights of the leaves, in leaf_names order."""
+        return self.effective[self.leaves]
+
+    def check(self):
+        """Raise ValueError unless every group's children, and all leaves, sum to 1."""
+        sums = np.bincount(self.parent[1:], weights=self.weight[1:], minlength=len(self.names))
+        # math.isclose(total, 1) for every group at once.
+        bad = np.flatnonzero(~self.is_leaf & (np.abs(sums - 1) > 1e-9 * np.maximum(np.abs(sums), 1)))
+        if len(bad):
+            raise ValueError(f'Children of {self.names[bad[0]]} sum to {sums[bad[0]]}, not 1')
+        total = self.leaf_weights().sum()
+        if not math.isclose(total, 1):
+            raise ValueError(f'Fund weights sum to {total}, not 1')
+
+    def groups_at(self, level):
+        """Nodes at depth `level`, and shallower leaves, so every leaf is in exactly one group."""
+        return np.flatnonzero((self.depth == level) | (self.is_leaf & (self.depth < level)))
+
+    def group_returns(self, returns, groups):
+        """
+        Returns of `groups` (names or ids) from leaf returns of shape
+        (... x leaves): the effective-weight average over each group's leaves.
+        """
+        ids = [self.node_id(g) for g in groups]
+        w = self.membership[ids] * self.leaf_weights()
+        return np.asarray(returns) @ (w / w.sum(axis=1, keepdims=True)).T
+
+
+def compile_tree(t, check=True):
+    names, parent, weight, depth, is_leaf = [], [], [], [], []
+    stack = [(t, -1, 0)]
+    while stack:
+        node, p, d = stack.pop()
+        i = len(names)
+        names.append(node[0])
+        parent.append(p)
+        weight.append(node[1])
+        depth.append(d)
+        is_leaf.append(len(node) == 2)
+        if len(node) == 3:
+            stack.extend((child, i, d + 1) for child in reversed(node[2]))
+
+    tree = CompiledTree(names, parent, weight, depth, is_leaf)
+    if check:
+        tree.check()
+    return tree
+
 
 def flatten(t):
-    # (subtree, cummulative_pct)
-    stack = []
-    global_pct = {}
-    stack.append((t, 1))
-    
-    while (True):
-        if len(stack) == 0: break
-        st = stack.pop()
-        (parent, cpct) = st
-        if len(parent) == 2:
-            # This is a leaf
-            (name, pct) = parent
-            child_pct = cpct * pct
-            global_pct[name] = round(child_pct, 10)            
-            continue
-            
-        (name, pct, children) = parent
-        new_cpct = pct * cpct        
-        
-        sum_pct = 0
-        for node in children:
-            if len(node) == 2:
-                (_, child_pct) = node
-            else:
-                (_, child_pct, _) = node
-            
-            sum_pct += child_pct
-            stack.append((node, new_cpct))        
-        if sum_pct != 1:
-            print("Children do not sum up to 100 pct!")
-            return
-    
-    test_pct = 0
-    for tp in global_pct.values():
-        test_pct += tp
-    test_pct = round(test_pct, 10)
-    if test_pct != 1:
-        print(global_pct)
-        print(f"Pcts do not sum up to 100 pct! ({test_pct})")
-        return
-        
-    return global_pct
-            
\ No newline at end of file
+    """Effective weight of every fund in a tree. Raises ValueError if the weights don't add up."""
+    tree = compile_tree(t)
+    # Funds come out in the order the stack-based walk always produced.
+    return {name: round(w, 10) for name, w in zip(reversed(tree.leaf_names),
+                                                   reversed(tree.leaf_weights().tolist()))}
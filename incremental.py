@@ -0,0 +1,365 @@
+"""
+Incremental month-end updates.
+
+When managers publish a new month their source files only gain rows at the
+end. For the row-per-month formats (parsers.APPENDABLE) the bytes past the
+cached size are parsed on their own and appended to the cached series, after
+one read of the file has confirmed that the cached part is unchanged. Other
+formats are parsed again, and count as appended to if their earlier history
+comes out the same.
+
+A Checkpoint holds what the simulation report is computed from in a form that
+can be moved forward: running return moments, peaks and worst drawdowns of
+every fund and of the simulated portfolio, correlation sums, and the
+simulation state with its tax lots. Its prices come from the same returns
+store as simulator.load, proxies included. Advancing it costs time
+proportional to the new aligned rows. Anything other than an append (edited
+history, a different fund tree, proxies, tax treatment or calendar) rebuilds
+it from scratch. Edits are caught by a fingerprint of every series up to the
+checkpoint's last month, whatever the cache says was appended, since the
+cache may have been refreshed in between (e.g. by cli.py ingest).
+
+    python cli.py update [--calendar yearly]
+"""
+import hashlib
+import io
+import os
+import pickle
+import numpy as np
+import pandas as pd
+import data_loader
+import fund_tree
+import parsers
+import return_store
+import series_cache
+import sim_engine
+import taxes
+import fund_stats
+from fund_stats import CORE_METRICS as METRICS
+
+CHECKPOINT_VERSION = 3
+
+
+def read_append(path, meta):
+    """
+    The bytes appended to `path` since it was cached and the sha1 of the whole
+    file, or None unless the cached part is unchanged and ended with a newline.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    size = meta['size']
+    if len(data) <= size or data[size - 1:size] != b'\n':
+        return None
+
+    h = hashlib.sha1(data[:size])
+    if h.hexdigest() != meta['sha1']:
+        return None
+    h.update(data[size:])
+    return data[size:], h.hexdigest()
+
+
+def _parse_tail(parse_class, fn, path, meta):
+    appended = read_append(path, meta)
+    if appended is None:
+        return None
+    tail, sha1 = appended
+    entry = series_cache.read_entry(path, meta, mmap=False)
+    if entry is None:
+        return None
+
+    ticker, stored = entry
+    options = {'initial': stored.iloc[-1]} if parse_class == 'iasg' else {}
+    _, new = parsers.PARSERS[parse_class](fn, io.BytesIO(tail), skiprows=0, **options)
+    if len(new) == 0 or new.index[0] <= stored.index[-1]:
+        return None
+
+    series = pd.concat((stored, new.astype(stored.dtype)))
+    series.name = stored.name
+    series.index.name = stored.index.name
+    series_cache.store_entry(path, ticker, series, sha1=sha1, data_dir=parsers.DATA_DIR)
+    return series, len(new)
+
+
+def refresh(key):
+    """
+    Bring the cached series of `key` up to date with its source file. Returns
+    (series, rows appended), with None for the rows when earlier history
+    changed too.
+    """
+    parse_class, fn = parsers.file_index()[key]
+    path = parsers.DATA_DIR + fn
+    meta = series_cache.read_meta(path, parsers.DATA_DIR)
+    if series_cache.is_fresh(path, meta):
+        return series_cache.read_entry(path, meta)[1], 0
+
+    usable = meta is not None and meta.get('version') == series_cache.FORMAT_VERSION
+    if usable and parse_class in parsers.APPENDABLE:
+        result = _parse_tail(parse_class, fn, path, meta)
+        if result is not None:
+            return result
+
+    old = series_cache.read_entry(path, meta, mmap=False) if usable else None
+    _, series = parsers.parse_file(parse_class, fn)
+    if old is None or len(series) < len(old[1]):
+        return series, None
+    head = series.iloc[:len(old[1])]
+    same = head.index.equals(old[1].index) and \
+        np.array_equal(head.to_numpy(), old[1].to_numpy(), equal_nan=True)
+    return series, (len(series) - len(old[1]) if same else None)
+
+
+def block_moments(x):
+    """Count, mean and central moment sums M2-M4 of each column of `x`."""
+    n = len(x)
+    mean = x.mean(axis=0)
+    d = x - mean
+    d2 = d * d
+    return n, mean, d2.sum(axis=0), (d2 * d).sum(axis=0), (d2 * d2).sum(axis=0)
+
+
+def merge_moments(a, b):
+    """Moments of two blocks combined (Chan et al., Pebay)."""
+    na, mean_a, m2a, m3a, m4a = a
+    nb, mean_b, m2b, m3b, m4b = b
+    if na == 0:
+        return b
+    n = na + nb
+    delta = mean_b - mean_a
+    mean = mean_a + delta * nb / n
+    m2 = m2a + m2b + delta ** 2 * na * nb / n
+    m3 = m3a + m3b + delta ** 3 * na * nb * (na - nb) / n ** 2 \
+        + 3 * delta * (na * m2b - nb * m2a) / n
+    m4 = m4a + m4b + delta ** 4 * na * nb * (na * na - na * nb + nb * nb) / n ** 3 \
+        + 6 * delta ** 2 * (na * na * m2b + nb * nb * m2a) / n ** 2 \
+        + 4 * delta * (na * m3b - nb * m3a) / n
+    return n, mean, m2, m3, m4
+
+
+class RunningStats:
+    """The compute_stats figures of price columns, fed one block of rows at a time."""
+
+    def __init__(self, n_columns):
+        zeros = np.zeros(n_columns)
+        self.moments = (0, zeros, zeros, zeros, zeros)
+        self.first = None
+        self.last = None
+        self.peak = None
+        self.max_drawdown = zeros
+
+    def update(self, prices):
+        """Take in the next rows of prices and return their returns."""
+        if self.first is None:
+            self.first = self.peak = prices[0]
+            chain = prices
+        else:
+            chain = np.vstack((self.last, prices))
+        returns = chain[1:] / chain[:-1] - 1
+        if len(returns):
+            self.moments = merge_moments(self.moments, block_moments(returns))
+
+        peaks = np.maximum.accumulate(np.vstack((self.peak, prices)), axis=0)[1:]
+        self.max_drawdown = np.minimum(self.max_drawdown, (prices / peaks - 1).min(axis=0))
+        self.peak = peaks[-1]
+        self.last = prices[-1]
+        return returns
+
+    def stats(self):
+        n, mean, d2, d3, d4 = self.moments
+        std, raw_skew, raw_kurt = fund_stats.shape(n, d2, d3, d4)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cagr = (self.last / self.first) ** (12 / n) - 1
+        return fund_stats.summary(mean, std, raw_skew, raw_kurt, cagr, self.max_drawdown)
+
+
+class RunningCorrelation:
+    """Sums and cross products of return columns, for their correlation matrix."""
+
+    def __init__(self, n_columns):
+        self.n = 0
+        self.shift = None
+        self.sums = np.zeros(n_columns)
+        self.cross = np.zeros((n_columns, n_columns))
+
+    def update(self, returns):
+        if len(returns) == 0:
+            return
+        if self.shift is None:
+            # Centre on the first returns to keep the sums well conditioned.
+            self.shift = returns[0]
+        x = returns - self.shift
+        self.n += len(x)
+        self.sums += x.sum(axis=0)
+        self.cross += x.T @ x
+
+    def corr(self):
+        cov = self.cross - np.outer(self.sums, self.sums) / self.n
+        d = np.sqrt(np.diag(cov))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return cov / np.outer(d, d)
+
+
+def settings(fund_weights, initial_capital=1_000_000, calendar=sim_engine.yearly):
+    """
+    Everything other than the prices that the figures of a Checkpoint depend
+    on: the weights, which funds are taxable and at what rate, the initial
+    capital, the rebalance calendar and the funds' proxies.
+    """
+    if isinstance(calendar, str):
+        calendar = sim_engine.CALENDARS[calendar]
+    if callable(calendar):
+        calendar = f'{calendar.__module__}.{calendar.__qualname__}'
+    else:
+        calendar = np.asarray(calendar, dtype=bool).tobytes()
+    return (dict(fund_weights), [taxes.is_taxable(name) for name in fund_weights], taxes.TAX_RATE,
+            initial_capital, calendar, return_store.proxy_chains(list(fund_weights)))
+
+
+def fingerprint(series, end):
+    """Row count and sha1 of the dates and prices of `series` up to `end`."""
+    head = series.iloc[:0 if end is None else series.index.searchsorted(end, side='right')]
+    h = hashlib.sha1(np.asarray(head.index, dtype='datetime64[ns]').tobytes())
+    h.update(np.asarray(head, dtype='float64').tobytes())
+    return len(head), h.hexdigest()
+
+
+def fingerprints(series, end):
+    return {name: fingerprint(s, end) for name, s in series.items()}
+
+
+class Checkpoint:
+    """Running state of the simulation report, up to the aligned row `end`."""
+
+    def __init__(self, fund_weights, initial_capital=1_000_000, calendar=sim_engine.yearly):
+        self.version = (CHECKPOINT_VERSION, series_cache.FORMAT_VERSION)
+        self.settings = settings(fund_weights, initial_capital, calendar)
+        self.fund_weights = dict(fund_weights)
+        self.funds = list(fund_weights)
+        self.weights = sim_engine.weights_vector(fund_weights, self.funds)
+        self.taxable = [taxes.is_taxable(name) for name in self.funds]
+        self.tax_rate = taxes.TAX_RATE
+        self.initial_capital = initial_capital
+        self.calendar = calendar
+        self.end = None
+        self.sim_state = None
+        self.sim_values = np.empty(0)
+        self.dates = pd.DatetimeIndex([])
+        self.running = RunningStats(len(self.funds) + 1)
+        self.correlation = RunningCorrelation(len(self.funds))
+        # Of the series the rows up to `end` were built from.
+        self.fingerprints = {}
+
+    def advance(self, df):
+        """Take in aligned rows after `end`, one column per fund."""
+        if len(df) == 0:
+            return self
+        prices = sim_engine.price_matrix(df, self.funds)
+        result = sim_engine.simulate(prices, self.weights,
+                                     sim_engine.rebalance_mask(df.index, self.calendar),
+                                     self.initial_capital,
+                                     taxable=self.taxable,
+                                     tax_rate=self.tax_rate,
+                                     tax_dates=df.index.is_year_start,
+                                     state=self.sim_state)
+        self.sim_state = result.state
+        returns = self.running.update(np.column_stack((prices, result.values)))
+        self.correlation.update(returns[:, :-1])
+
+        self.sim_values = np.concatenate((self.sim_values, result.values))
+        self.dates = self.dates.append(df.index)
+        self.end = df.index[-1]
+        return self
+
+    def simulation(self):
+        return pd.Series(self.sim_values, self.dates)
+
+    def stats_df(self):
+        """Same layout as simulator.make_stats_df, less the var and cvar rows."""
+        stats = self.running.stats()
+        return pd.DataFrame([stats[m] for m in METRICS], index=list(METRICS),
+                            columns=self.funds + ['sim'])
+
+    def corr_df(self):
+        return pd.DataFrame(self.correlation.corr(), index=self.funds, columns=self.funds)
+
+
+def checkpoint_path():
+    return os.path.join(series_cache.CACHE_DIR, 'checkpoint.pkl')
+
+
+def load_checkpoint(path):
+    try:
+        with open(path, 'rb') as f:
+            checkpoint = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+        return None
+    if getattr(checkpoint, 'version', None) != (CHECKPOINT_VERSION, series_cache.FORMAT_VERSION):
+        return None
+    return checkpoint
+
+
+def save_checkpoint(checkpoint, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'wb') as f:
+        pickle.dump(checkpoint, f)
+    os.replace(tmp, path)
+
+
+def _frame(series, funds):
+    """Aligned prices of `funds`, as simulator.load has them, from a dict of their source series."""
+    store = return_store.from_series(series, funds, return_store.proxy_chains(funds))
+    return store.frame(funds)
+
+
+def build(fund_weights, calendar=sim_engine.yearly, series=None):
+    """A Checkpoint over the whole history, from `series` of the funds and proxies or else parsers.load."""
+    funds = list(fund_weights)
+    if series is None:
+        series = parsers.load(return_store.sources(funds, return_store.proxy_chains(funds)))
+    checkpoint = Checkpoint(fund_weights, calendar=calendar).advance(_frame(series, funds))
+    checkpoint.fingerprints = fingerprints(series, checkpoint.end)
+    return checkpoint
+
+
+def update(fund_weights=None, path=None, calendar=sim_engine.yearly):
+    """
+    Bring the checkpoint at `path` up to date with the source files. Returns
+    it with the number of aligned rows added, or None if it was rebuilt.
+    """
+    fund_weights = fund_tree.flatten(data_loader.simulation) if fund_weights is None else fund_weights
+    path = checkpoint_path() if path is None else path
+    checkpoint = load_checkpoint(path)
+    funds = list(fund_weights)
+    series = {name: refresh(name)[0]
+              for name in return_store.sources(funds, return_store.proxy_chains(funds))
+              if name in parsers.file_index()}
+
+    if checkpoint is not None and checkpoint.settings == settings(fund_weights, calendar=calendar) \
+            and fingerprints(series, checkpoint.end) == checkpoint.fingerprints:
+        df = _frame(series, funds)
+        new = df.iloc[0 if checkpoint.end is None else df.index.searchsorted(checkpoint.end, side='right'):]
+        checkpoint.advance(new)
+        checkpoint.fingerprints = fingerprints(series, checkpoint.end)
+        save_checkpoint(checkpoint, path)
+        return checkpoint, len(new)
+
+    checkpoint = build(fund_weights, calendar, series)
+    save_checkpoint(checkpoint, path)
+    return checkpoint, None
+
+
+def describe(checkpoint, added):
+    if added is None:
+        print(f'Rebuilt the checkpoint from {len(checkpoint.dates)} months.')
+    else:
+        print(f'Added {added} months, now up to {checkpoint.end:%Y-%m}.')
+    print(checkpoint.stats_df())
+    print(checkpoint.corr_df())
+
+
+def main():
+    describe(*update())
+
+
+if __name__ == '__main__':
+    main()
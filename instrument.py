@@ -0,0 +1,157 @@
+"""
+Timing spans and counters.
+
+Code marks its stages with `with span('backtest'):` or @timed('stats') and
+bumps counters with count('ingest.parsed'). Nothing is recorded until
+enable() is called (the CLI does so for --trace and --timings); until then a
+span is a shared no-op context manager and a counter is one global lookup.
+
+Recorded spans can be written as a JSON summary of totals per span name or as
+a Chrome trace (chrome://tracing, Perfetto) showing every span on its
+thread's timeline. profiled() wraps a command in cProfile, or in pyinstrument's
+sampling profiler when that is installed.
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+_recorder = None
+
+
+class Recorder:
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.events = []
+        self.counters = {}
+
+    def summary(self):
+        spans = {}
+        for name, _, duration, _, _ in self.events:
+            s = spans.setdefault(name, {'count': 0, 'seconds': 0.0, 'max': 0.0})
+            s['count'] += 1
+            s['seconds'] += duration
+            s['max'] = max(s['max'], duration)
+        return {'spans': spans, 'counters': dict(self.counters)}
+
+    def chrome_trace(self):
+        pid = os.getpid()
+        events = [{'name': name, 'ph': 'X', 'pid': pid, 'tid': tid,
+                   'ts': (start - self.origin) * 1e6, 'dur': duration * 1e6, 'args': args}
+                  for name, start, duration, tid, args in self.events]
+        end = max([e['ts'] + e['dur'] for e in events], default=0)
+        events += [{'name': name, 'ph': 'C', 'pid': pid, 'tid': 0, 'ts': end, 'args': {name: value}}
+                   for name, value in self.counters.items()]
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+class _Span:
+    __slots__ = ('recorder', 'name', 'args', 'start')
+
+    def __init__(self, recorder, name, args):
+        self.recorder = recorder
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        duration = time.perf_counter() - self.start
+        self.recorder.events.append((self.name, self.start, duration, threading.get_ident(), self.args))
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name, **args):
+    """Context manager timing the enclosed block as `name`, with optional args for the trace."""
+    if _recorder is None:
+        return _NULL_SPAN
+    return _Span(_recorder, name, args)
+
+
+def timed(name):
+    """Decorator: span(name) around every call."""
+    def decorate(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            if _recorder is None:
+                return f(*args, **kwargs)
+            with _Span(_recorder, name, {}):
+                return f(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def count(name, n=1):
+    if _recorder is not None:
+        _recorder.counters[name] = _recorder.counters.get(name, 0) + n
+
+
+def enable():
+    """Start recording into a fresh Recorder, which is returned."""
+    global _recorder
+    _recorder = Recorder()
+    return _recorder
+
+
+def disable():
+    """Stop recording and return what was recorded, or None."""
+    global _recorder
+    recorder, _recorder = _recorder, None
+    return recorder
+
+
+def enabled():
+    return _recorder is not None
+
+
+def write_json(path, data):
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=1)
+
+
+@contextmanager
+def profiled(path, sampler=False):
+    """
+    Profile the enclosed block and write the result to `path`: cProfile stats
+    (for pstats or snakeviz), or with sampler=True a pyinstrument text report.
+    """
+    if sampler:
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            raise RuntimeError('The sampling profiler needs pyinstrument installed') from None
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            with open(path, 'w') as f:
+                f.write(profiler.output_text())
+        return
+
+    import cProfile
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
@@ -0,0 +1,161 @@
+"""
+Tax-lot bookkeeping for the simulator.
+
+Each fund keeps its purchase lots in growable NumPy arrays. Sells consume
+lots in FIFO or HIFO order, or from an explicit list of lots, and the cost
+basis of a sell is computed with a cumulative sum over the lots it touches
+rather than by popping and re-inserting tuples. FIFO keeps a head pointer, so
+fully consumed lots at the front are never looked at again.
+
+Every sell records its realized gain, so the gains for a tax period are a
+single query on the ledger.
+"""
+from bisect import bisect_right
+import numpy as np
+
+FIFO = 'fifo'
+HIFO = 'hifo'
+METHODS = (FIFO, HIFO)
+
+
+class Lots:
+    """The open purchase lots of one fund."""
+
+    def __init__(self, capacity=16):
+        self.shares = np.zeros(capacity)
+        self.price = np.zeros(capacity)
+        self.when = np.zeros(capacity, dtype='int64')
+        self.n = 0
+        self.head = 0
+
+    def add(self, shares, price, when):
+        if self.n == len(self.shares):
+            grow = len(self.shares)
+            self.shares = np.concatenate((self.shares, np.zeros(grow)))
+            self.price = np.concatenate((self.price, np.zeros(grow)))
+            self.when = np.concatenate((self.when, np.zeros(grow, dtype='int64')))
+        self.shares[self.n] = shares
+        self.price[self.n] = price
+        self.when[self.n] = when
+        self.n += 1
+        return self.n - 1
+
+    def open_ids(self):
+        ids = np.arange(self.head, self.n)
+        return ids[self.shares[ids] > 0]
+
+    def consume(self, order, to_sell):
+        """
+        Sell up to `to_sell` shares from the lots in `order`, in that order.
+        Returns (basis, shares still unsold).
+        """
+        held = self.shares[order]
+        cum = np.cumsum(held)
+        k = np.searchsorted(cum, to_sell)
+        if k == len(order):
+            basis = held @ self.price[order]
+            self.shares[order] = 0
+            return basis, to_sell - (cum[-1] if len(cum) else 0)
+
+        full = order[:k]
+        partial = to_sell - (cum[k - 1] if k > 0 else 0)
+        basis = held[:k] @ self.price[full] + partial * self.price[order[k]]
+        self.shares[full] = 0
+        self.shares[order[k]] = max(self.shares[order[k]] - partial, 0)
+        return basis, 0
+
+    def sell_fifo(self, to_sell):
+        basis = 0
+        window = 8
+        while to_sell > 0 and self.head < self.n:
+            order = np.arange(self.head, min(self.n, self.head + window))
+            lot_basis, to_sell = self.consume(order, to_sell)
+            basis += lot_basis
+            while self.head < self.n and self.shares[self.head] <= 0:
+                self.head += 1
+            window *= 2
+        return basis
+
+    def sell_hifo(self, to_sell):
+        ids = self.open_ids()
+        order = ids[np.argsort(-self.price[ids], kind='stable')]
+        basis, _ = self.consume(order, to_sell)
+        return basis
+
+    def sell_lots(self, lot_ids, to_sell):
+        ids = np.asarray(lot_ids, dtype='int64')
+        basis, _ = self.consume(ids[self.shares[ids] > 0], to_sell)
+        return basis
+
+    def total_shares(self):
+        return self.shares[self.head:self.n].sum()
+
+    def cost_basis(self):
+        live = slice(self.head, self.n)
+        return self.shares[live] @ self.price[live]
+
+
+class LotLedger:
+    """
+    Purchase lots and realized gains for `n_funds` funds. `when` is any
+    non-decreasing integer time stamp, typically the row of the price matrix.
+    """
+
+    def __init__(self, n_funds, method=FIFO):
+        if method not in METHODS:
+            raise ValueError(f'Unknown lot selection method: {method}')
+        self.method = method
+        self.books = [Lots() for _ in range(n_funds)]
+        self.sale_when = []
+        self.sale_fund = []
+        self.sale_gain = []
+
+    def buy(self, fund, shares, price, when):
+        """Record a purchase and return its lot id."""
+        return self.books[fund].add(shares, price, when)
+
+    def sell(self, fund, shares, price, when, lots=None):
+        """
+        Sell `shares` of `fund` at `price`, from `lots` if given, otherwise by
+        the ledger's method. Returns the cost basis of the shares sold.
+        """
+        book = self.books[fund]
+        if lots is not None:
+            basis = book.sell_lots(lots, shares)
+        elif self.method == HIFO:
+            basis = book.sell_hifo(shares)
+        else:
+            basis = book.sell_fifo(shares)
+
+        gain = shares * price - basis
+        self.sale_when.append(when)
+        self.sale_fund.append(fund)
+        self.sale_gain.append(gain)
+        return basis
+
+    def realized_gains(self, since=None, until=None):
+        """Sum of gains realized at times in (since, until]."""
+        lo = 0 if since is None else bisect_right(self.sale_when, since)
+        hi = len(self.sale_when) if until is None else bisect_right(self.sale_when, until)
+        return sum(self.sale_gain[lo:hi])
+
+    def realized_by(self, labels):
+        """Realized gains grouped by labels[when], e.g. the years of the price rows."""
+        if not self.sale_when:
+            return {}
+        keys = np.asarray(labels)[np.asarray(self.sale_when)]
+        uniq, inverse = np.unique(keys, return_inverse=True)
+        sums = np.bincount(inverse, weights=np.asarray(self.sale_gain))
+        return dict(zip(uniq.tolist(), sums.tolist()))
+
+    def open_lots(self, fund):
+        """(lot ids, shares, prices, purchase times) of the fund's open lots."""
+        book = self.books[fund]
+        ids = book.open_ids()
+        return ids, book.shares[ids], book.price[ids], book.when[ids]
+
+    def shares(self, fund):
+        return self.books[fund].total_shares()
+
+    def cost_basis(self, fund):
+        return self.books[fund].cost_basis()
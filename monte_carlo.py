@@ -0,0 +1,129 @@
+"""
+Monte Carlo simulation of the fund-tree portfolio from bootstrapped history.
+
+Synthetic paths are built by resampling whole months (rows of the aligned
+return matrix), so the cross-fund correlation of each month is preserved, in
+blocks so that some serial structure survives too. Paths are generated and
+valued in chunks of arrays of shape (paths, months, funds), which
+resampling.run_chunks seeds and can spread over a process pool.
+"""
+import argparse
+import math
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+import data_loader
+import fund_stats
+import fund_tree
+import resampling
+import return_store
+from skill_metric import skill_metric_array
+
+PathMetrics = namedtuple('PathMetrics', ['terminal', 'cagr', 'max_drawdown', 'tau'])
+
+
+def load_returns(tree=None):
+    """Aligned monthly returns of the funds in a fund tree, and their weights."""
+    weights = fund_tree.flatten(data_loader.simulation if tree is None else tree)
+    names = list(weights.keys())
+    return return_store.load(names).common_returns(names), weights
+
+
+def portfolio_values(returns, weights, rebalance_every=12):
+    """
+    Portfolio value paths, starting from 1, for returns of shape
+    (paths, months, funds), rebalanced to `weights` every `rebalance_every`
+    months (never when None).
+    """
+    n_paths, n_months, n_funds = returns.shape
+    period = n_months if rebalance_every is None else rebalance_every
+    n_periods = -(-n_months // period)
+
+    if n_periods * period == n_months:
+        growth = returns + 1
+    else:
+        growth = np.ones((n_paths, n_periods * period, n_funds))
+        growth[:, :n_months] += returns
+    growth = growth.reshape(n_paths, n_periods, period, n_funds)
+    np.cumprod(growth, axis=2, out=growth)
+
+    within = growth @ weights
+    period_start = np.cumprod(within[:, :, -1], axis=1)
+    period_start = np.concatenate((np.ones((n_paths, 1)), period_start[:, :-1]), axis=1)
+    values = within * period_start[:, :, None]
+    return values.reshape(n_paths, -1)[:, :n_months]
+
+
+def path_metrics(values):
+    """Terminal wealth, CAGR, max drawdown and tau of value paths starting at 1."""
+    n_months = values.shape[1]
+    with_start = np.concatenate((np.ones((len(values), 1)), values), axis=1)
+    monthly = with_start[:, 1:] / with_start[:, :-1] - 1
+
+    terminal = values[:, -1]
+    cagr = terminal ** (12 / n_months) - 1
+    max_drawdown = (with_start / np.maximum.accumulate(with_start, axis=1) - 1).min(axis=1)
+
+    af = math.sqrt(12)
+    _, mean, std, raw_skew, _ = fund_stats.moments(monthly, axis=1)
+    mu = mean * 12
+    sigma = std * af
+    skew = raw_skew / af
+    tau = skill_metric_array(mu, sigma, skew)
+
+    return PathMetrics(terminal, cagr, max_drawdown, tau)
+
+
+def _run_chunk(returns, weights, n_months, block, stationary, rebalance_every, n_paths, seed):
+    rng = np.random.default_rng(seed)
+    idx = resampling.bootstrap_indices(rng, n_paths, n_months, len(returns), block, stationary)
+    values = portfolio_values(returns[idx], weights, rebalance_every)
+    return path_metrics(values)
+
+
+def simulate_paths(returns, weights, n_paths=10_000, years=30, block=12, stationary=True,
+                   rebalance_every=12, seed=0, workers=1, chunk_size=None):
+    """
+    Bootstrap `n_paths` paths of `years` years from a (months x funds) return
+    matrix and return their PathMetrics. Terminal wealth is per unit invested.
+    """
+    returns = np.ascontiguousarray(returns, dtype='float64')
+    weights = np.asarray(weights, dtype='float64')
+    n_months = years * 12
+    if chunk_size is None:
+        chunk_size = resampling.chunk_size(n_months * returns.shape[1] * 8 * 3)
+    chunks = resampling.run_chunks(_run_chunk, (returns, weights, n_months, block, stationary,
+                                                rebalance_every), n_paths, chunk_size, seed, workers)
+    return PathMetrics(*(np.concatenate(parts) for parts in zip(*chunks)))
+
+
+def summarize(metrics, percentiles=(5, 25, 50, 75, 95)):
+    d = {}
+    for name, values in metrics._asdict().items():
+        d[name] = pd.Series(np.nanpercentile(values, percentiles),
+                            index=[f'p{p}' for p in percentiles])
+        d[name]['mean'] = np.nanmean(values)
+    return pd.DataFrame(d)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--paths', type=int, default=10_000)
+    parser.add_argument('--years', type=int, default=30)
+    parser.add_argument('--block', type=int, default=12)
+    parser.add_argument('--fixed-blocks', action='store_true')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=1)
+    args = parser.parse_args()
+
+    returns, weights = load_returns()
+    metrics = simulate_paths(returns.to_numpy(), list(weights.values()), args.paths,
+                             args.years, args.block, not args.fixed_blocks,
+                             seed=args.seed, workers=args.workers)
+    print(summarize(metrics))
+    print(f'{args.paths} paths of {args.years} years from {len(returns)} months of '
+          f'{returns.shape[1]} funds.')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,165 +1,384 @@
 """
 Parses each kind of spreadsheet into our data structures.
-"""
-from pathlib import PurePath
-import logging, sys
-logging.basicConfig(stream=sys.stderr, level=logging.DEBUG)
 
-import math
+Every format is registered with @register along with its schema: which
+columns it reads, their dtypes and how many lines come before the data. CSV
+formats read only those columns, with pyarrow when it is installed, and the
+column header declared for a format recognizes files that are not listed in
+data_loader.spreadsheets. A new vendor is one more registered parse function.
+"""
+import calendar
+import logging
 import os
-from itertools import accumulate, islice, chain
+import re
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
+import numpy as np
 import pandas as pd
 from data_loader import spreadsheets, DATA_DIR
+import instrument
+from series_cache import cached, load_entry
 
+logger = logging.getLogger('parsers')
 
-def adjust(acc, val):
-    val = 0 if math.isnan(val) else val
-    return acc * (1 + (val/100))
-
-    
-def adjust_pct(acc, val):
-    val = 0 if math.isnan(val) else val
-    return acc * (1 + val)
-
+MONTH_ABBRS = {name.lower(): i for i, name in enumerate(calendar.month_abbr) if name}
 
-def combine_to_date(year, month):
-    date = f'{year:04d}-{month:02d}-01'
-    return pd.to_datetime(date)
 
+def nav_from_returns(returns, scale=100, initial=1000):
+    """
+    NAV series compounded from periodic returns, treating NaN as a flat month.
+    Same arithmetic, in the same order, as folding acc * (1 + val / scale)
+    over the returns starting from `initial`.
+    """
+    returns = np.asarray(returns, dtype='float64')
+    factors = 1 + np.where(np.isnan(returns), 0, returns) / scale
+    return np.cumprod(np.concatenate(([initial], factors)))[1:]
 
-def combine_to_date2(year, month):
-    date = f'{year}-{month}-01'
-    return pd.to_datetime(date)
 
+def month_numbers(months):
+    """Month tokens ('3', '03', 'Mar', 'March') as integers 1-12."""
+    months = pd.Series(months, dtype='object').astype(str).str.strip()
+    numbers = pd.to_numeric(months, errors='coerce')
+    names = months.str[:3].str.lower().map(MONTH_ABBRS)
+    return numbers.fillna(names).to_numpy(dtype='int64')
 
-def generate_ticker(file_base):
-    return file_base
 
+def month_start_dates(years, months, name=None):
+    """One bulk month-start DatetimeIndex for parallel year/month arrays."""
+    years = np.asarray(years, dtype='int64')
+    months = np.asarray(months, dtype='int64')
+    periods = ((years - 1970) * 12 + months - 1).astype('datetime64[M]')
+    return pd.DatetimeIndex(periods.astype('datetime64[ns]'), name=name)
 
-def hfrx_to_date(d):
-    m, y = d.split('/')
-    return pd.to_datetime(f"{y}-{m}-01")
 
+def split_month_year(labels, sep):
+    """Month-start dates from 'month<sep>year' labels such as '3/2020' or 'Mar 2020'."""
+    parts = pd.Series(labels, dtype='object').astype(str).str.strip().str.split(sep, n=1, expand=True)
+    return month_start_dates(parts[1].astype('int64'), month_numbers(parts[0]),
+                             name=getattr(labels, 'name', None))
 
-def parse_hfrx(fn):
-    file = DATA_DIR + fn
-    ticker = generate_ticker(os.path.splitext(fn)[0])
-    df = pd.read_csv(file, skiprows=1, header=None, index_col=0, usecols=[0, 1],
-                     names=['date', 'value'], parse_dates=None)
-
-    print(df)
-    dates = df.index.map(hfrx_to_date)
-    data = pd.Series(df['value'], index=dates, name=ticker)
 
-    return (ticker, data)
-
-
-def parse_iasg(fn):
-    file = DATA_DIR + fn
-    ticker = generate_ticker(os.path.splitext(fn)[0])
-    df = pd.read_csv(file, skiprows=1, header=None,
-                     names=["year", "month", ticker, "value"],
-                     usecols=["year", "month", ticker], parse_dates=None)
-
-    dates = df['year'].combine(df['month'], combine_to_date)
-    l = islice(accumulate(df[ticker], func=adjust, initial=1000), 1, None)
-    return (ticker, pd.Series(l, index=dates))
-
-
-def parse_amundi(fn):
-    file = DATA_DIR + fn
-    ticker = generate_ticker(os.path.splitext(fn)[0])
-    df = pd.read_csv(file, skiprows=15, header=0,
-                     names=['currency', 'value', 'dummy'],
-                     index_col=1,
-                     parse_dates=True)
-    return (ticker, pd.Series(df['value']).mul(10))
+def generate_ticker(file_base):
+    return file_base
 
 
+def file_ticker(fn):
+    """The ticker of the file `fn`, a path under DATA_DIR."""
+    return generate_ticker(os.path.splitext(fn)[0])
+
+
+# A file format: its parse function, the columns it reads as (position, name,
+# dtype), how many lines come before the data, the values read as missing, a
+# regex matching the last of those lines (the column header) to recognize new
+# files by, whether its parser can read rows appended to a file on their own:
+# parse(fn, source, skiprows=0), and whether dates that aren't ISO put the
+# day first.
+Format = namedtuple('Format', ['name', 'parse', 'columns', 'skiprows', 'na_values', 'header',
+                               'extensions', 'appendable', 'dayfirst'])
+
+FORMATS = {}
+PARSERS = {}
+APPENDABLE = set()
+
+# 'pyarrow', 'c' (pandas' C engine), or 'auto' for pyarrow when it is installed.
+CSV_ENGINE = os.environ.get('YANSHUF_CSV_ENGINE', 'auto')
+
+
+def register(name, columns=None, skiprows=1, na_values=(), header=None, extensions=('.csv',),
+             appendable=False, dayfirst=False):
+    """Decorator adding a parse function to the registry as format `name`."""
+    def decorate(parse):
+        FORMATS[name] = Format(name, parse, columns, skiprows, tuple(na_values),
+                               None if header is None else re.compile(header),
+                               tuple(extensions), appendable, dayfirst)
+        PARSERS[name] = parse
+        if appendable:
+            APPENDABLE.add(name)
+        return parse
+    return decorate
+
+
+@lru_cache(maxsize=None)
+def _arrow_csv():
+    if CSV_ENGINE == 'c':
+        return None
+    try:
+        from pyarrow import csv
+    except ImportError:
+        if CSV_ENGINE == 'pyarrow':
+            raise
+        return None
+    return csv
+
+
+# pandas' default missing-value strings, given to pyarrow too so that both
+# engines read the same values as missing.
+NA_VALUES = ('', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND',
+             '1.#QNAN', '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null')
+
+
+def _read_arrow(csv, source, skiprows, columns, na_values):
+    import pyarrow as pa
+
+    types = {'str': pa.string(), 'int64': pa.int64(), 'float64': pa.float64(),
+             'date': pa.timestamp('ns')}
+    table = csv.read_csv(
+        source,
+        read_options=csv.ReadOptions(skip_rows=skiprows, autogenerate_column_names=True),
+        convert_options=csv.ConvertOptions(
+            include_columns=[f'f{p}' for p, _, _ in columns],
+            column_types={f'f{p}': types[dtype] for p, _, dtype in columns},
+            null_values=list(NA_VALUES + na_values), strings_can_be_null=False))
+    return {name: table.column(f'f{p}').to_numpy() for p, name, _ in columns}
+
+
+def parse_dates(labels, dayfirst=False):
+    """datetime64[ns] of date strings: ISO dates, or else a format inferred with `dayfirst`."""
+    try:
+        dates = pd.to_datetime(labels, format='ISO8601')
+    except ValueError:
+        dates = pd.to_datetime(labels, dayfirst=dayfirst)
+    return np.asarray(dates, dtype='datetime64[ns]')
+
+
+def _read_c(source, skiprows, columns, na_values, dayfirst=False):
+    df = pd.read_csv(source, skiprows=skiprows, header=None, usecols=[p for p, _, _ in columns],
+                     dtype={p: str if dtype in ('str', 'date') else dtype for p, _, dtype in columns},
+                     na_values=list(na_values) or None, engine='c')
+    # Dates are parsed here rather than by read_csv, which would apply
+    # dayfirst to ISO dates too.
+    return {name: parse_dates(df[p], dayfirst) if dtype == 'date'
+            else df[p].to_numpy(dtype=object if dtype == 'str' else None)
+            for p, name, dtype in columns}
+
+
+def read_columns(source, columns, skiprows=0, na_values=(), dayfirst=False):
+    """
+    The `columns` (position, name, dtype) of a headerless CSV after `skiprows`
+    lines, as a dict of arrays. dtype is 'str', 'int64', 'float64' or 'date'.
+    Read with pyarrow when it is available, converting while parsing and
+    skipping the other columns, or else with pandas' C engine. pyarrow only
+    reads ISO dates, so files with others, e.g. 31/01/2020, go to the C
+    engine, which infers their format, taking the day first with `dayfirst`.
+    """
+    csv = _arrow_csv()
+    if csv is not None:
+        import pyarrow as pa
+
+        start = source.tell() if hasattr(source, 'tell') else None
+        try:
+            return _read_arrow(csv, source, skiprows, columns, tuple(na_values))
+        except pa.ArrowInvalid:
+            if start is not None:
+                source.seek(start)
+    return _read_c(source, skiprows, columns, na_values, dayfirst)
+
+
+def read_format(name, fn, source=None, skiprows=None):
+    """(ticker, columns) of `fn` (or `source`, e.g. a file's appended bytes) read by its format's schema."""
+    form = FORMATS[name]
+    file = DATA_DIR + fn if source is None else source
+    return (file_ticker(fn),
+            read_columns(file, form.columns, form.skiprows if skiprows is None else skiprows,
+                         form.na_values, form.dayfirst))
+
+
+def fund_series(ticker, values, dates):
+    """Every parser's result: prices named by ticker on a DatetimeIndex named 'date'."""
+    dates = pd.DatetimeIndex(np.asarray(dates, dtype='datetime64[ns]'), name='date')
+    return pd.Series(np.asarray(values, dtype='float64'), index=dates, name=ticker)
+
+
+def month_year_dates(labels):
+    """Month-start dates of 'month/year' labels, by strptime unless some months are names."""
+    try:
+        return pd.to_datetime(labels, format='%m/%Y').to_numpy(dtype='datetime64[ns]')
+    except ValueError:
+        return split_month_year(labels, '/')
+
+
+@register('hfrx', columns=((0, 'date', 'str'), (1, 'value', 'float64')),
+          header=r'Date,Close\b', appendable=True)
+def parse_hfrx(fn, source=None, skiprows=None):
+    ticker, c = read_format('hfrx', fn, source, skiprows)
+    return (ticker, fund_series(ticker, c['value'], month_year_dates(c['date'])))
+
+
+@register('iasg', columns=((0, 'year', 'int64'), (1, 'month', 'int64'), (2, 'ror', 'float64')),
+          header=r'Year,Month,ROR\b', appendable=True)
+def parse_iasg(fn, source=None, skiprows=None, initial=1000):
+    ticker, c = read_format('iasg', fn, source, skiprows)
+    return (ticker, fund_series(ticker, nav_from_returns(c['ror'], initial=initial),
+                                month_start_dates(c['year'], c['month'])))
+
+
+@register('amundi', columns=((1, 'date', 'date'), (2, 'value', 'float64')), skiprows=16,
+          header=r'Currency,Date,NAV\b', appendable=True, dayfirst=True)
+def parse_amundi(fn, source=None, skiprows=None):
+    ticker, c = read_format('amundi', fn, source, skiprows)
+    return (ticker, fund_series(ticker, c['value'] * 10, c['date']))
+
+
+@register('tabular_csvs',
+          columns=((0, 'year', 'int64'),) + tuple((m, f'{m:02d}', 'float64') for m in range(1, 13)),
+          header=r'Year,Jan,Feb,Mar\b')
 def parse_tabular_csv(fn):
-    file = DATA_DIR + fn
-    ticker = generate_ticker(os.path.splitext(fn)[0])
-    df = pd.read_csv(file, skiprows=1, header=None, parse_dates=None,
-                     names=['year', '01', '02', '03', '04', '05', '06',
-                            '07', '08', '09', '10', '11', '12', 'ytd'],
-                     usecols=['year', '01', '02', '03', '04', '05', '06',
-                              '07', '08', '09', '10', '11', '12'])
-    df = df.melt(id_vars=['year'], var_name='month', value_name=ticker)
-    dates = df['year'].combine(df['month'], combine_to_date2)
-    df.insert(0, 'date', dates)
-    df.set_index('date', drop=True, inplace=True)
-    df.sort_index(inplace=True)
-    df.dropna(inplace=True)
-    l = islice(accumulate(df[ticker], func=adjust, initial=1000), 1, None)
-    return (ticker, pd.Series(l, index=df.index))
+    ticker, c = read_format('tabular_csvs', fn)
+    # Rows are years, columns are months: flatten to one value per month.
+    returns = np.column_stack([c[f'{m:02d}'] for m in range(1, 13)]).astype('float64').ravel()
+    years = np.repeat(c['year'], 12)
+    months = np.tile(np.arange(1, 13), len(c['year']))
+    dates = month_start_dates(years, months)
+
+    order = np.argsort(dates.values, kind='stable')
+    order = order[~np.isnan(returns[order])]
+    return (ticker, fund_series(ticker, nav_from_returns(returns[order]), dates[order]))
 
 
+@register('rcm', extensions=('.xlsx', '.xls'))
 def parse_rcm(fn):
     file = DATA_DIR + fn
-    ticker = generate_ticker(os.path.splitext(fn)[0])
+    ticker = file_ticker(fn)
     orig_data = pd.read_excel(file, skiprows=2, header=None,
-                              index_col=0, names=[ticker], parse_date=False)
-    l = islice(accumulate(orig_data[ticker],
-                          func=adjust_pct, initial=1000), 1, None)
-    data = pd.Series(l, orig_data.index)
-
-    return (ticker, data)
-
-
-def eureka_to_date(d):
-    m, y = d.split(' ')
-    return pd.to_datetime(f"{y}-{m}-01")
+                              index_col=0, names=[ticker])
+    return (ticker, fund_series(ticker, nav_from_returns(orig_data[ticker], scale=1), orig_data.index))
 
 
+@register('eurekahedge', extensions=('.xlsx', '.xls'))
 def parse_eureka(fn):
     file = DATA_DIR + fn
-    ticker = generate_ticker(os.path.splitext(fn)[0])
+    ticker = file_ticker(fn)
     orig_data = pd.read_excel(file, skiprows=4, header=None,
                               index_col=0, names=['return', 'value'], parse_dates=False)
-    dates = orig_data.index.map(eureka_to_date)
-    data = pd.Series(orig_data['value'].mul(10), index=dates, name=ticker)
-
-    return (ticker, data)
-
-
-def parse_fred(fn):
-    file = DATA_DIR + fn
-    ticker = generate_ticker(os.path.splitext(fn)[0])
-    df = pd.read_csv(file, skiprows=1, header=None, index_col=0, na_values='.',
-                     names=['date', 'value'], parse_dates=True)
-    data = pd.Series(df['value'], name=ticker)
-
-    return (ticker, data)
-
-
-def parse_yahoo(fn):
-    file = DATA_DIR + fn
-    ticker = generate_ticker(os.path.splitext(fn)[0])
-    orig_data = pd.read_csv(file, skiprows=1, header=None,
-                            index_col=0, usecols=[0, 5], parse_dates=True)
-    data = pd.Series(orig_data[5], name=ticker)
-
-    return (ticker, data)
-
-
-def restrict(pair):
-    ticker, df = pair
-    return (ticker, df)
-
-def parse_class_list(parse_class, keys):
-    return [file for file in spreadsheets[parse_class] if PurePath(file).stem in keys]
-
-def load(keys):
-    return dict(map(restrict,
-                    chain(map(parse_rcm, parse_class_list('rcm', keys)),
-                          map(parse_tabular_csv,
-                              parse_class_list('tabular_csvs', keys)),
-                          map(parse_iasg, parse_class_list('iasg', keys)),
-                          map(parse_amundi, parse_class_list('amundi', keys)),
-                          map(parse_eureka,
-                              parse_class_list('eurekahedge', keys)),
-                          map(parse_hfrx, parse_class_list('hfrx', keys)),
-                          map(parse_yahoo, parse_class_list('yahoo', keys)),
-                          map(parse_fred, parse_class_list('fred', keys))
-                          ))
-                )
+    dates = split_month_year(orig_data.index, ' ')
+    return (ticker, fund_series(ticker, orig_data['value'].mul(10).to_numpy(), dates))
+
+
+@register('fred', columns=((0, 'date', 'date'), (1, 'value', 'float64')), na_values=('.',),
+          header=r'(DATE|observation_date),', appendable=True)
+def parse_fred(fn, source=None, skiprows=None):
+    ticker, c = read_format('fred', fn, source, skiprows)
+    return (ticker, fund_series(ticker, c['value'], c['date']))
+
+
+@register('yahoo', columns=((0, 'date', 'date'), (5, 'value', 'float64')),
+          header=r'Date,Open,High,Low,Close,Adj Close\b', appendable=True)
+def parse_yahoo(fn, source=None, skiprows=None):
+    ticker, c = read_format('yahoo', fn, source, skiprows)
+    return (ticker, fund_series(ticker, c['value'], c['date']))
+
+
+def sniff(path):
+    """The format whose header matches the file at `path`, or None."""
+    ext = os.path.splitext(path)[1].lower()
+    forms = [f for f in FORMATS.values() if f.header is not None and ext in f.extensions]
+    if not forms:
+        return None
+    try:
+        with open(path, 'rb') as f:
+            lines = [f.readline() for _ in range(max(form.skiprows for form in forms))]
+    except OSError:
+        return None
+    lines = [line.decode('utf-8-sig', errors='replace').strip() for line in lines]
+    for form in forms:
+        if form.header.match(lines[form.skiprows - 1]):
+            return form.name
+    return None
+
+
+LOAD_WORKERS = int(os.environ.get('YANSHUF_WORKERS', 1))
+
+
+def build_index(sheets, data_dir=None):
+    """
+    Map each file's ticker to its (parse class, file name): the files listed
+    in `sheets`, then any other file in `data_dir` whose format sniff() finds.
+    A listed file may be in a subdirectory, e.g. 'sub/x.csv' with ticker 'sub/x'.
+    """
+    index = {}
+    for parse_class in PARSERS:
+        for file in sheets.get(parse_class, []):
+            index[file_ticker(file)] = (parse_class, file)
+    if data_dir is None:
+        return index
+
+    listed = {file for files in sheets.values() for file in files}
+    try:
+        files = sorted(os.listdir(data_dir))
+    except OSError:
+        return index
+    for file in files:
+        ticker = file_ticker(file)
+        if file in listed or ticker in index or not os.path.isfile(os.path.join(data_dir, file)):
+            continue
+        parse_class = sniff(os.path.join(data_dir, file))
+        if parse_class is not None:
+            logger.debug('Found %s file %s', parse_class, file)
+            index[ticker] = (parse_class, file)
+    return index
+
+
+@lru_cache(maxsize=None)
+def file_index():
+    return build_index(spreadsheets, DATA_DIR)
+
+
+def use_data(data_dir, sheets):
+    """Read from another data directory and spreadsheet listing, e.g. synthetic data."""
+    global DATA_DIR, spreadsheets
+    DATA_DIR = data_dir
+    spreadsheets = sheets
+    file_index.cache_clear()
+
+
+def all_keys():
+    return list(file_index())
+
+
+def parse_file(parse_class, fn):
+    return cached(PARSERS[parse_class], DATA_DIR)(fn)
+
+
+def iter_load(keys, workers=None):
+    """
+    Yield (ticker, series) pairs as they become available. Cached series come
+    first; the rest are parsed in a process pool of `workers` processes, or
+    serially when workers is 1.
+    """
+    workers = LOAD_WORKERS if workers is None else workers
+    index = file_index()
+    pending = []
+    for key in dict.fromkeys(keys):
+        if key not in index:
+            continue
+        parse_class, fn = index[key]
+        # Every key is looked up; only misses get an 'ingest' span below.
+        with instrument.span('ingest.lookup', file=fn):
+            entry = load_entry(DATA_DIR + fn, data_dir=DATA_DIR)
+        if entry is not None:
+            instrument.count('ingest.cached')
+            yield entry
+        else:
+            pending.append((parse_class, fn))
+    instrument.count('ingest.parsed', len(pending))
+
+    if workers <= 1 or len(pending) <= 1:
+        for parse_class, fn in pending:
+            with instrument.span('ingest', file=fn):
+                result = parse_file(parse_class, fn)
+            yield result
+        return
+
+    # Spans are only recorded in this process, so the pool is timed as a whole.
+    with instrument.span('ingest.pool', files=len(pending)):
+        with ProcessPoolExecutor(max_workers=min(workers, len(pending))) as pool:
+            futures = [pool.submit(parse_file, parse_class, fn) for parse_class, fn in pending]
+            for future in as_completed(futures):
+                yield future.result()
+
+
+def load(keys, workers=None):
+    data = dict(iter_load(keys, workers))
+    # Keep the file index order regardless of completion order.
+    return {ticker: data[ticker] for ticker in file_index() if ticker in data}
@@ -0,0 +1,178 @@
+"""
+Rebalance policies, many evaluated in one pass over the months.
+
+A policy checks the portfolio on a calendar (monthly, quarterly, yearly)
+and, with a tolerance band, only rebalances when some fund has drifted from
+its target weight by more than the band, absolutely or relative to the
+target. A calendar policy has no band, a band policy checks monthly, and a
+hybrid checks less often against a band. Every trade can pay a proportional
+transaction cost.
+
+All policies hold the same funds over the same prices, so their holdings are
+stacked as (policies x funds) arrays and each month updates every policy at
+once. Taxes follow sim_engine.simulate (gains assessed at the start of each
+year with losses carried forward, paid at the next rebalance) except that the
+cost basis is the average cost of each fund, since lot-by-lot selling does not
+stack across policies; until a fund is bought a second time the two agree.
+"""
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+import fund_stats
+import instrument
+import sim_engine
+
+Policy = namedtuple('Policy', ['name', 'calendar', 'band', 'relative', 'cost'])
+PolicyResult = namedtuple('PolicyResult',
+                          ['values', 'pretax', 'rebalances', 'turnover', 'costs', 'taxes', 'owed'])
+
+COLUMNS = ('rebalances', 'turnover', 'costs', 'taxes', 'tax_drag',
+           'cagr', 'max_drawdown', 'vol', 'sharpe', 'calmar', 'terminal_value')
+
+
+def policy(calendar='yearly', band=None, relative=False, cost=0.0, name=None):
+    """
+    A policy that checks on `calendar` (anything sim_engine.rebalance_mask
+    takes) and rebalances when the largest drift is over `band`, or always
+    without one. `cost` is the fraction of each trade's value paid.
+    """
+    if band is not None and band < 0:
+        raise ValueError(f'Band must not be negative: {band}')
+    if name is None:
+        name = calendar if isinstance(calendar, str) else 'custom'
+        if band is not None:
+            name += f' {band:g}{"r" if relative else ""}'
+        if cost:
+            name += f' @{cost:g}'
+    return Policy(name, calendar, band, relative, cost)
+
+
+def parse(spec, cost=0.0):
+    """
+    Policy from a string such as 'yearly', 'monthly:0.05' (a 5 point absolute
+    band checked monthly) or 'quarterly:0.2r' (a 20% relative band).
+    """
+    calendar, _, band = spec.partition(':')
+    if calendar not in sim_engine.CALENDARS:
+        raise ValueError(f'Unknown calendar: {calendar}, choose one of {list(sim_engine.CALENDARS)}')
+    if not band:
+        return policy(calendar, cost=cost)
+    relative = band.endswith('r')
+    return policy(calendar, float(band.rstrip('r')), relative, cost)
+
+
+@instrument.timed('policies')
+def evaluate(prices, weights, dates, policies, taxable=None, tax_rate=0, tax_dates=None):
+    """
+    Value paths, starting at 1, of holding `weights` over a (months x funds)
+    price matrix under each of `policies`, as (months x policies) arrays:
+    after costs and taxes, and with taxable funds taxed at 0 (None without
+    taxes). Also per policy the number of rebalances, the summed one-way
+    turnover as a fraction of value, and the costs, taxes paid and taxes
+    still owed at the end, per unit of initial capital.
+    """
+    prices = np.asarray(prices, dtype='float64')
+    weights = np.asarray(weights, dtype='float64')
+    n_months, n_funds = prices.shape
+    n = len(policies)
+    taxable = np.zeros(n_funds, dtype=bool) if taxable is None else np.asarray(taxable, dtype=bool)
+    if tax_dates is None:
+        tax_dates = pd.DatetimeIndex(dates).is_year_start
+    tax_dates = np.asarray(tax_dates, dtype=bool)
+    taxed = bool(tax_rate) and taxable.any()
+
+    # With taxes, a second copy of every policy at a zero rate gives the pre-tax paths.
+    copies = 2 if taxed else 1
+    check = np.tile(np.array([sim_engine.rebalance_mask(dates, p.calendar) for p in policies]
+                             ).reshape(n, n_months), (copies, 1))
+    # The first month is the purchase.
+    check[:, 0] = False
+    band = np.tile([np.nan if p.band is None else p.band for p in policies], copies)
+    relative = np.tile([p.relative for p in policies], copies)
+    cost = np.tile([p.cost for p in policies], copies)
+    rate = np.repeat([tax_rate, 0.0][:copies], n)
+    scale = np.where(relative[:, None], 1 / np.where(weights > 0, weights, np.inf), 1.0)
+
+    shares = np.tile(weights / prices[0], (len(band), 1))
+    basis = shares * prices[0]
+    gains = np.zeros(len(band))
+    carried = np.zeros(len(band))
+    owed = np.zeros(len(band))
+    values = np.empty((n_months, len(band)))
+    rebalances = np.zeros(len(band), dtype=np.int64)
+    turnover = np.zeros(len(band))
+    costs = np.zeros(len(band))
+    paid = np.zeros(len(band))
+
+    for t in range(n_months):
+        price = prices[t]
+        holdings = shares * price
+        value = holdings.sum(axis=1)
+        if check[:, t].any():
+            drift = (np.abs(holdings / value[:, None] - weights) * scale).max(axis=1)
+            on = check[:, t] & (np.isnan(band) | (drift > band))
+            if on.any():
+                net = value[on] - owed[on]
+                paid[on] += owed[on]
+                owed[on] = 0
+                trade = net[:, None] * weights - holdings[on]
+                traded = np.abs(trade).sum(axis=1)
+                costs[on] += cost[on] * traded
+                turnover[on] += traded / 2 / value[on]
+                rebalances[on] += 1
+                value[on] = net - cost[on] * traded
+
+                new_shares = value[on, None] * weights / price
+                sold = np.maximum(shares[on] - new_shares, 0)
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    average = np.where(shares[on] > 0, basis[on] / shares[on], 0)
+                gains[on] += (sold * (price - average))[:, taxable].sum(axis=1)
+                basis[on] += np.maximum(new_shares - shares[on], 0) * price - sold * average
+                shares[on] = new_shares
+
+        if tax_dates[t]:
+            due = gains + carried
+            carried = np.minimum(due, 0)
+            owed += np.maximum(due, 0) * rate
+            gains[:] = 0
+        values[t] = value
+
+    result = PolicyResult(values[:, :n], values[:, n:] if taxed else None, rebalances[:n],
+                          turnover[:n], costs[:n], paid[:n], owed[:n])
+    instrument.count('policies.evaluated', n * copies)
+    return result
+
+
+def compare(df, fund_weights, policies, is_taxable=None, tax_rate=0, initial_capital=1_000_000):
+    """
+    Comparison table, one row per policy, of holding the flattened fund tree
+    weights over an aligned price DataFrame: rebalances and turnover per
+    year, costs and taxes as a fraction of initial capital, the CAGR lost to
+    taxes, performance after taxes still owed, and the terminal value.
+    """
+    names = list(fund_weights)
+    taxable = None if is_taxable is None else [is_taxable(name) for name in names]
+    result = evaluate(sim_engine.price_matrix(df, names), sim_engine.weights_vector(fund_weights, names),
+                      df.index, policies, taxable, tax_rate)
+    years = (len(df) - 1) / 12
+    # Taxes still owed come out of the end value, as they would on a sale.
+    values = result.values.copy()
+    values[-1] -= result.owed
+    stats = fund_stats.fund_stats(values)
+    pretax_cagr = stats['cagr'] if result.pretax is None \
+        else fund_stats.fund_stats(result.pretax)['cagr']
+
+    table = pd.DataFrame({
+        'rebalances': result.rebalances / years,
+        'turnover': result.turnover / years,
+        'costs': result.costs,
+        'taxes': result.taxes + result.owed,
+        'tax_drag': pretax_cagr - stats['cagr'],
+        'cagr': stats['cagr'],
+        'max_drawdown': stats['max_drawdown'],
+        'vol': stats['vol'],
+        'sharpe': stats['sharpe'],
+        'calmar': stats['calmar'],
+        'terminal_value': values[-1] * initial_capital,
+    }, index=pd.Index([p.name for p in policies], name='policy'))
+    return table[list(COLUMNS)]
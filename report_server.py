@@ -0,0 +1,239 @@
+"""
+Local HTTP server for the tailored-dragon report and per-fund stats pages.
+
+    python cli.py serve [--port 8000] [--interval 2]
+
+    GET /                  the report of data_loader.tailored
+    GET /?run=quarterly    the same, rebalanced on another schedule
+    GET /fund/<key>        statistics of one fund
+
+Loaded data, backtest results and rendered fragments stay in memory, each
+entry tagged with the fund keys it was computed from. A watcher polls the
+files under DATA_DIR and drops only the entries that depend on a file that
+changed, so a refresh after one fund's update redoes that fund's part and
+nothing else; files added to DATA_DIR become servable at the next poll.
+Requests for an entry already being computed wait for that computation
+instead of starting their own; the work itself runs in a thread so the
+server keeps answering in the meantime.
+"""
+import asyncio
+import html
+import json
+import logging
+import os
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import data_loader
+import instrument
+import parsers
+
+logger = logging.getLogger('report_server')
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           500: 'Internal Server Error'}
+
+
+class ResultCache:
+    """In-memory results by key, each depending on a set of fund keys, with in-flight coalescing."""
+
+    def __init__(self):
+        self.entries = {}
+        self.pending = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    async def get(self, key, deps, compute):
+        """The entry for `key`, computing it in a thread with `compute()` if needed."""
+        if key in self.entries:
+            instrument.count('server.hit')
+            return self.entries[key][0]
+        if key in self.pending:
+            instrument.count('server.coalesced')
+            return await asyncio.shield(self.pending[key][0])
+
+        instrument.count('server.miss')
+        future = asyncio.get_running_loop().run_in_executor(None, compute)
+        self.pending[key] = (future, frozenset(deps))
+        future.add_done_callback(lambda f: self._done(key, f))
+        # Shielded, so a client hanging up doesn't cancel work others wait for.
+        return await asyncio.shield(future)
+
+    def _done(self, key, future):
+        # Only kept if no file it depends on changed while it ran.
+        if self.pending.get(key, (None,))[0] is not future:
+            return
+        _, deps = self.pending.pop(key)
+        if not future.cancelled() and future.exception() is None:
+            self.entries[key] = (future.result(), deps)
+
+    def invalidate(self, keys):
+        """Drop the entries, finished or running, that depend on any of `keys`. Returns how many."""
+        keys = set(keys)
+        stale = [k for k, (_, deps) in self.entries.items() if deps & keys]
+        for k in stale:
+            del self.entries[k]
+        running = [k for k, (_, deps) in self.pending.items() if deps & keys]
+        for k in running:
+            del self.pending[k]
+        return len(stale) + len(running)
+
+
+def dependencies(keys):
+    """`keys` and the proxies they are spliced with."""
+    proxies = getattr(data_loader, 'proxies', {})
+    return set(keys) | {p for k in keys for p in proxies.get(k, ())}
+
+
+def listing():
+    """Names in DATA_DIR, or None if it can't be read."""
+    try:
+        return frozenset(os.listdir(parsers.DATA_DIR))
+    except OSError:
+        return None
+
+
+def snapshot():
+    """(mtime, size) of the source file of every key, None when it is missing."""
+    files = {}
+    for key, (_, fn) in parsers.file_index().items():
+        try:
+            st = os.stat(parsers.DATA_DIR + fn)
+            files[key] = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            files[key] = None
+    return files
+
+
+def changed(before, after):
+    return {k for k in before.keys() | after.keys() if before.get(k) != after.get(k)}
+
+
+class ReportServer:
+    """The pages, their cache and the DATA_DIR watcher."""
+
+    def __init__(self):
+        self.cache = ResultCache()
+        self.listing = listing()
+        self.files = snapshot()
+
+    def scan(self):
+        """snapshot(), re-indexing DATA_DIR first if files were added or removed."""
+        names = listing()
+        if names != self.listing:
+            parsers.file_index.cache_clear()
+            self.listing = names
+        return snapshot()
+
+    async def check(self):
+        """Invalidate what depends on source files changed since the last check. Returns their keys."""
+        # The stat sweep runs in a thread; the cache is only touched here.
+        files = await asyncio.get_running_loop().run_in_executor(None, self.scan)
+        keys = changed(self.files, files)
+        self.files = files
+        if keys:
+            n = self.cache.invalidate(keys)
+            logger.info('%d changed files, %d cache entries dropped', len(keys), n)
+        return keys
+
+    async def watch(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            await self.check()
+
+    async def report(self, groups, name='tailored-dragon', run='yearly'):
+        import batch_report
+        import yanshuf
+
+        strategy, keys = yanshuf.tailored_strategy(groups, name, run)
+        deps = dependencies(keys)
+        ident = (name, json.dumps(groups, sort_keys=True), run)
+        get = self.cache.get
+
+        data = await get(('data', tuple(keys)), deps, lambda: yanshuf.compile_data(55, keys))
+        stats = await get(('backtest',) + ident, deps,
+                          lambda: yanshuf.dragon_backtest(keys, strategy, data)[0])
+        perf = await get(('perf',) + ident, deps, lambda: yanshuf.render_performance(stats))
+        corr = await get(('corr', tuple(keys)), deps,
+                         lambda: yanshuf.render_corr(yanshuf.tailored_returns(keys, data)))
+        info = await get(('info', ident[1]), (),
+                         lambda: batch_report.render_info(yanshuf.tailored_info(groups)))
+        return batch_report.render_page(perf, corr, info)
+
+    async def fund(self, key):
+        """Stats page of `key`; KeyError if there is no such fund."""
+        if key not in parsers.file_index():
+            raise KeyError(key)
+        return await self.cache.get(('fund', key), {key}, lambda: render_fund(key))
+
+    async def respond(self, method, target):
+        """(status, html) of a request."""
+        if method != 'GET':
+            return 405, REASONS[405]
+        url = urlsplit(target)
+        try:
+            if url.path == '/':
+                run = parse_qs(url.query).get('run', ['yearly'])[0]
+                return 200, await self.report(data_loader.tailored, run=run)
+            if url.path.startswith('/fund/'):
+                return 200, await self.fund(unquote(url.path[len('/fund/'):]))
+        except KeyError:
+            return 404, REASONS[404]
+        except ValueError as e:
+            return 400, html.escape(str(e))
+        except Exception:
+            logger.exception('Failed to serve %s', target)
+            return 500, REASONS[500]
+        return 404, REASONS[404]
+
+    async def handle(self, reader, writer):
+        try:
+            request = (await reader.readline()).decode('latin-1').split()
+            # Headers are not needed, only skipped.
+            while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                pass
+            if len(request) != 3:
+                status, body = 400, REASONS[400]
+            else:
+                with instrument.span('serve', target=request[1]):
+                    status, body = await self.respond(request[0], request[1])
+            body = body.encode()
+            writer.write(f'HTTP/1.1 {status} {REASONS[status]}\r\n'
+                         f'Content-Type: text/html; charset=utf-8\r\n'
+                         f'Content-Length: {len(body)}\r\n'
+                         f'Connection: close\r\n\r\n'.encode() + body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host='127.0.0.1', port=8000, interval=2.0):
+        """Start listening and watching; returns the asyncio server and the watcher task."""
+        server = await asyncio.start_server(self.handle, host, port)
+        return server, asyncio.create_task(self.watch(interval))
+
+
+def render_fund(key):
+    import batch_report
+    import fund_stats
+
+    series = parsers.load([key])[key]
+    stats = fund_stats.stats_table(series.to_frame())
+    return batch_report.environment().get_template('fund.html.jinja').render(
+        key=key, name=data_loader.shortnames.get(key, key),
+        stats=stats.to_html(float_format='{:.4f}'.format),
+        start=series.index[0].date(), end=series.index[-1].date(), months=len(series))
+
+
+async def serve(host='127.0.0.1', port=8000, interval=2.0):
+    server, watcher = await ReportServer().start(host, port, interval)
+    logger.info('Serving on http://%s:%d/', host, port)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        watcher.cancel()
@@ -0,0 +1,63 @@
+"""
+Block bootstrap of monthly return histories.
+
+Resampled months are drawn as row indices into the history, in blocks so
+that some serial structure survives, and the work is cut into chunks of
+draws. Both the Monte Carlo simulation and the bootstrap intervals of
+fund_stats draw this way.
+"""
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+# Rough upper bound for the arrays of one chunk.
+CHUNK_BYTES = 64 * 1024 * 1024
+
+
+def bootstrap_indices(rng, n_paths, n_months, n_source, block=12, stationary=True):
+    """
+    Row indices into a return history of length `n_source`, as (paths x
+    months). With `stationary` the block lengths are geometric with mean
+    `block` (Politis-Romano), otherwise every block has exactly `block`
+    months. Blocks wrap around.
+
+    `n_source` may also be one length per fund, for funds packed at the top
+    of one array (each with n rows of its own), which gives (paths x months x
+    funds) indices. Block boundaries and relative start points are then
+    shared by all funds.
+    """
+    if stationary:
+        new_block = rng.random((n_paths, n_months)) < 1 / block
+    else:
+        new_block = np.zeros((n_paths, n_months), dtype=bool)
+        new_block[:, ::block] = True
+    new_block[:, 0] = True
+
+    positions = np.broadcast_to(np.arange(n_months), (n_paths, n_months))
+    block_start = np.maximum.accumulate(np.where(new_block, positions, 0), axis=1)
+    offsets = positions - block_start
+    start = np.take_along_axis(rng.random((n_paths, n_months)), block_start, axis=1)
+    if np.ndim(n_source) == 0:
+        return ((start * n_source).astype(np.int64) + offsets) % n_source
+    n = np.maximum(np.asarray(n_source, dtype=np.int64), 1)
+    return ((start[..., None] * n).astype(np.int64) + offsets[..., None]) % n
+
+
+def chunk_size(bytes_per_draw):
+    """How many draws of `bytes_per_draw` bytes of arrays fit in CHUNK_BYTES."""
+    return max(1, CHUNK_BYTES // max(bytes_per_draw, 1))
+
+
+def run_chunks(run, args, n, size, seed=0, workers=1):
+    """
+    run(*args, draws, seed) for chunks of `size` of the `n` draws, in a
+    process pool with `workers` > 1. The chunks' seeds are spawned from
+    `seed`, so their results, returned in order, are the same however many
+    workers run them.
+    """
+    sizes = [min(size, n - start) for start in range(0, n, size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    calls = [tuple(args) + (draws, s) for draws, s in zip(sizes, seeds)]
+    if workers > 1 and len(calls) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(calls))) as pool:
+            return list(pool.map(run, *zip(*calls)))
+    return [run(*c) for c in calls]
@@ -0,0 +1,260 @@
+"""
+Monthly returns of a set of funds, each over its own history.
+
+Returns, unlike prices, need no common base, so every fund keeps the whole of
+its valid range: the store is one Fortran-order (months x funds) matrix on
+the union calendar with the first and last row of each fund's returns, and
+the row of a month holds the return since the fund's previous price. A fund
+can also declare proxies to splice onto before its inception, e.g. an index
+for the years before a fund launched; their returns are copied into the
+fund's column in front of its own.
+
+Prices are only materialized for the funds and months a consumer asks for,
+rebased to 1 at the start of their common window. Every price consumer here
+works on price relatives, so that is the same as the raw prices for them.
+They are computed in float64 on each call; returns of adjacent funds are
+handed out as views of the store.
+
+As in aligned_store, the returns can be float32 to halve the memory, and can
+live in a memory-mapped .npy file so that only the columns in use are paged
+in. load(), which every consumer builds its store with, does so as set by
+YANSHUF_STORE_DTYPE and YANSHUF_STORE_DIR.
+"""
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+import aligned_store
+import data_loader
+import parsers
+
+
+# 'float64' or 'float32' for the returns of the stores load() builds.
+DTYPE = os.environ.get('YANSHUF_STORE_DTYPE', 'float64')
+# With a directory, load() maps its returns from a scratch file there instead of RAM.
+STORE_DIR = os.environ.get('YANSHUF_STORE_DIR')
+
+
+class ReturnStore:
+    """Read-only mapping of fund name -> price Series, backed by one returns matrix."""
+
+    def __init__(self, dates, names, returns, first, last, inception=None, splices=None):
+        self.dates = pd.DatetimeIndex(dates)
+        self.names = list(names)
+        self.returns = returns
+        self.column = {name: j for j, name in enumerate(self.names)}
+        self.first = np.asarray(first, dtype=np.int64)
+        self.last = np.asarray(last, dtype=np.int64)
+        # First row of each fund's own returns, before any proxy.
+        self.inception = self.first.copy() if inception is None else np.asarray(inception, dtype=np.int64)
+        self.splices = splices or {}
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.column
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def keys(self):
+        return list(self.names)
+
+    def items(self):
+        return ((name, self[name]) for name in self.names)
+
+    def _columns(self, cols, rows=slice(None)):
+        """The store's `rows` of columns `cols`, a view when they are adjacent and in order."""
+        if cols and cols == list(range(cols[0], cols[-1] + 1)):
+            return self.returns[rows, cols[0]:cols[-1] + 1]
+        return self.returns[rows, cols]
+
+    def __getitem__(self, name):
+        """The fund's prices over its whole history, proxies included, starting at 1."""
+        block, dates = self.matrix([name])
+        return pd.Series(block[:, 0], index=dates, name=name)
+
+    def window(self, names):
+        """
+        Row slice from the month every one of `names` has a price, the one
+        before their first common return, to the last month they all have.
+        """
+        cols = [self.column[name] for name in names]
+        return slice(int(self.first[cols].max()) - 1, int(self.last[cols].min()) + 1)
+
+    def matrix(self, names, base=1.0):
+        """
+        (months x funds) prices of `names` on the months where all of them
+        have a price, starting at `base`, and those months' dates.
+        """
+        cols = [self.column[name] for name in names]
+        rows = self.window(names) if cols else slice(0, 0)
+        if rows.stop - rows.start < 2:
+            return np.empty((0, len(cols))), self.dates[:0]
+
+        returns = self._columns(cols, slice(rows.start + 1, rows.stop)).astype('float64', copy=False)
+        missing = np.isnan(returns)
+        # A month a fund hasn't is carried in its next return, so it grows by 1 here.
+        prices = np.empty((len(returns) + 1, len(cols)))
+        prices[0] = base
+        np.cumprod(np.where(missing, 1.0, 1.0 + returns), axis=0, out=prices[1:])
+        prices[1:] *= base
+        # Every fund has a price in the first month unless it is a gap in one of them.
+        head = (self.first[cols] - 1 == rows.start) | ~np.isnan(self.returns[rows.start, cols])
+        keep = np.concatenate([[head.all()], ~missing.any(axis=1)])
+        dates = self.dates[rows]
+        if keep.all():
+            return prices, dates
+        prices, dates = prices[keep], dates[keep]
+        if not keep[0]:
+            prices *= base / prices[0]
+        return prices, dates
+
+    def frame(self, names=None, base=1.0):
+        """DataFrame of prices of `names` (default all) over their common months, like DataFrame(...).dropna()."""
+        names = self.names if names is None else list(names)
+        block, dates = self.matrix(names, base)
+        return pd.DataFrame(block, index=dates, columns=names, copy=False)
+
+    def common_returns(self, names=None):
+        """
+        Returns of `names` over their common months, like the pct_change of
+        frame(names), taken straight from the store when there are no gaps.
+        """
+        names = self.names if names is None else list(names)
+        cols = [self.column[name] for name in names]
+        rows = self.window(names) if cols else slice(0, 0)
+        block = self._columns(cols, slice(rows.start + 1, rows.stop)) if rows.stop - rows.start > 1 \
+            else np.empty((0, len(cols)))
+        if not np.isnan(block).any():
+            return pd.DataFrame(block, index=self.dates[rows][1:], columns=names, copy=False)
+        prices = self.frame(names)
+        return prices.pct_change().iloc[1:]
+
+    def returns_frame(self, names=None, spliced=True):
+        """
+        Returns of `names` (default all) on the store's calendar, each over
+        its own range and NaN elsewhere. Without `spliced`, only the funds'
+        own returns, without those of their proxies.
+        """
+        names = self.names if names is None else list(names)
+        cols = [self.column[name] for name in names]
+        block = self._columns(cols)
+        if not spliced:
+            block = self.returns[:, cols]
+            block[np.arange(len(self.dates))[:, None] < self.inception[cols]] = np.nan
+        return pd.DataFrame(block, index=self.dates, columns=names, copy=False)
+
+
+def _splice(returns, own, first, last, j):
+    """
+    Copy the proxy's own returns `own` into column j of `returns` for their
+    unbroken run of months just before first[j].
+    """
+    end = first[j]
+    if end == 0 or np.isnan(own[end - 1]):
+        return None
+    gaps = np.flatnonzero(np.isnan(own[:end]))
+    start = gaps[-1] + 1 if len(gaps) else 0
+    returns[start:end, j] = own[start:end]
+    first[j] = start
+    last[j] = max(last[j], end - 1)
+    return start, end
+
+
+def build(data, proxies=None, dtype='float64', path=None):
+    """
+    Returns store of a dict of price series, in the dict's order. `proxies`
+    maps a fund to the funds, also in `data`, to splice onto before its
+    inception, most preferred first; each one extends the history further
+    back from where the last stopped. The returns are `dtype`, and with
+    `path` they are written to `path`.values.npy and the store maps that file.
+    """
+    dates = aligned_store._union_dates(data)
+    returns = aligned_store.allocate((len(dates), len(data)), dtype, path)
+    for j, series in enumerate(data.values()):
+        series = series.dropna()
+        rows = dates.searchsorted(series.index)
+        values = series.to_numpy(dtype='float64')
+        returns[rows[1:], j] = values[1:] / values[:-1] - 1
+
+    first, last = aligned_store.valid_bounds(returns)
+    inception = first.copy()
+    names = list(data)
+    column = {name: j for j, name in enumerate(names)}
+    chains = {name: [p for p in chain if p in column]
+              for name, chain in (proxies or {}).items() if name in column}
+    # Proxies lend their own returns, whatever they were spliced with
+    # themselves, so the result doesn't depend on the order of `proxies`.
+    lenders = sorted({column[p] for chain in chains.values() for p in chain})
+    own = dict(zip(lenders, returns[:, lenders].T.copy()))
+    splices = {}
+    for name, chain in chains.items():
+        for proxy in chain:
+            rows = _splice(returns, own[column[proxy]], first, last, column[name])
+            if rows is not None:
+                splices.setdefault(name, []).append((proxy, dates[rows[0]], dates[rows[1] - 1]))
+
+    if path is not None:
+        aligned_store.save(path, returns, dates, {
+            'names': names, 'first': first.tolist(), 'last': last.tolist(),
+            'inception': inception.tolist(),
+            'splices': {k: [(p, a.isoformat(), b.isoformat()) for p, a, b in v]
+                        for k, v in splices.items()}})
+        return open_store(path)
+    return ReturnStore(dates, names, returns, first, last, inception, splices)
+
+
+def open_store(path, mmap=True):
+    """Open a store written by build(..., path=path), memory-mapped unless mmap is False."""
+    returns, dates, meta = aligned_store.open_matrix(path, mmap)
+    splices = {k: [(p, pd.Timestamp(a), pd.Timestamp(b)) for p, a, b in v]
+               for k, v in meta['splices'].items()}
+    return ReturnStore(dates, meta['names'], returns, meta['first'], meta['last'],
+                       meta['inception'], splices)
+
+
+def proxy_chains(keys, proxies=None):
+    """The proxies of `keys`, by default those declared in data_loader.proxies."""
+    proxies = getattr(data_loader, 'proxies', {}) if proxies is None else proxies
+    return {k: list(proxies[k]) for k in keys if k in proxies}
+
+
+def sources(keys, chains):
+    """`keys` and their proxies in `chains`, each once: the series a store of them is built from."""
+    return list(dict.fromkeys(list(keys) + [p for c in chains.values() for p in c]))
+
+
+def from_series(data, keys, chains, minimum_months=0, dtype='float64', path=None):
+    """
+    Returns store of the `keys` in a dict of series that have more than
+    `minimum_months` prices, and of their proxies in `chains`; `dtype` and
+    `path` as in build().
+    """
+    own = {k: data[k] for k in keys if k in data and data[k].size > minimum_months}
+    extra = {p: data[p] for c in chains.values() for p in c if p in data and p not in own}
+    return build({**own, **extra}, chains, dtype, path)
+
+
+def _scratch_store(data, keys, chains, minimum_months, dtype):
+    os.makedirs(STORE_DIR, exist_ok=True)
+    fd, path = tempfile.mkstemp(prefix='returns.', dir=STORE_DIR)
+    os.close(fd)
+    try:
+        return from_series(data, keys, chains, minimum_months, dtype, path)
+    finally:
+        aligned_store.remove(path)
+
+
+def load(keys, proxies=None, minimum_months=0):
+    """
+    Returns store of `keys` that have more than `minimum_months` prices, and
+    of their proxies, by default those declared in data_loader.proxies. The
+    returns are DTYPE, and memory-mapped when STORE_DIR is set.
+    """
+    chains = proxy_chains(keys, proxies)
+    data = parsers.load(sources(keys, chains))
+    if STORE_DIR:
+        return _scratch_store(data, keys, chains, minimum_months, DTYPE)
+    return from_series(data, keys, chains, minimum_months, DTYPE)
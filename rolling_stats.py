@@ -0,0 +1,136 @@
+"""
+Rolling versions of the compute_stats metrics for every fund at once.
+
+Moments come from prefix sums of powers of the (shifted) monthly returns, so
+each window is a constant-time difference of two rows rather than a fresh
+pass over the window. Rolling max drawdown splits the months into blocks of
+the window length and combines running scans of neighbouring blocks, so it
+too costs the same per month whatever the window, vectorized over all funds,
+instead of calling empyrical on every slice.
+
+Windows are in months of returns and only full windows produce values, so
+each metric at month t describes the `window` returns ending at t, exactly
+as compute_stats would on that slice.
+"""
+import numpy as np
+import pandas as pd
+import fund_stats
+from fund_stats import CORE_METRICS as METRICS
+
+WINDOWS = (12, 36, 60)
+
+
+def _prefix(x):
+    out = np.zeros((x.shape[0] + 1,) + x.shape[1:])
+    np.cumsum(x, axis=0, out=out[1:])
+    return out
+
+
+def _window_sums(prefix, window):
+    """Sums over each trailing window, NaN where the window isn't full yet."""
+    out = np.full((prefix.shape[0] - 1,) + prefix.shape[1:], np.nan)
+    out[window - 1:] = prefix[window:] - prefix[:-window]
+    return out
+
+
+def rolling_moments(returns, window):
+    """
+    Rolling mean, sample std, bias-corrected skew and excess kurtosis (as
+    pandas computes them) of a (months x funds) return array. Windows that
+    contain a NaN give NaN.
+    """
+    valid = ~np.isnan(returns)
+    # Shift by each fund's mean to keep the power sums well conditioned.
+    shift = np.nanmean(np.where(valid, returns, np.nan), axis=0)
+    x = np.where(valid, returns - shift, 0)
+
+    n = _window_sums(_prefix(valid.astype('float64')), window)
+    x2 = x * x
+    s1 = _window_sums(_prefix(x), window)
+    s2 = _window_sums(_prefix(x2), window)
+    s3 = _window_sums(_prefix(x2 * x), window)
+    s4 = _window_sums(_prefix(x2 * x2), window)
+
+    full = n == window
+    n = np.where(full, n, np.nan)
+    m = s1 / n
+    d2 = s2 - n * m * m
+    d3 = s3 - 3 * m * s2 + 2 * n * m ** 3
+    d4 = s4 - 4 * m * s3 + 6 * m * m * s2 - 3 * n * m ** 4
+    return (m + shift,) + fund_stats.shape(n, d2, d3, d4)
+
+
+def _scan(blocks, ufunc, reverse=False):
+    """Running `ufunc` along each block of a (blocks x window x funds) array, from either end."""
+    if reverse:
+        return ufunc.accumulate(blocks[:, ::-1], axis=1)[:, ::-1]
+    return ufunc.accumulate(blocks, axis=1)
+
+
+def rolling_max_drawdown(prices, window):
+    """
+    Max drawdown within each trailing window of `window` prices. A window of
+    n + 1 prices matches empyrical.max_drawdown on the n returns between them.
+    """
+    n_rows, n_funds = prices.shape
+    out = np.full(prices.shape, np.nan)
+    if n_rows < window:
+        return out
+
+    # Rows are cut into blocks of `window`, so a window is the tail of one
+    # block and the head of the next. Peak, trough and drawdown of every head
+    # and tail come from running scans, and the two combine in constant time.
+    n_blocks = -(-n_rows // window)
+    padded = np.full((n_blocks * window, n_funds), np.nan)
+    padded[:n_rows] = prices
+    blocks = padded.reshape(n_blocks, window, n_funds)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        head_peak = _scan(blocks, np.fmax)
+        head_trough = _scan(blocks, np.fmin)
+        head_dd = _scan(blocks / head_peak - 1, np.fmin)
+        tail_peak = _scan(blocks, np.fmax, reverse=True)
+        tail_trough = _scan(blocks, np.fmin, reverse=True)
+        tail_dd = _scan(tail_trough / blocks - 1, np.fmin, reverse=True)
+
+        start = np.arange(n_rows - window + 1)
+        end = start + window - 1
+        head = [x.reshape(-1, n_funds)[end] for x in (head_peak, head_trough, head_dd)]
+        tail = [x.reshape(-1, n_funds)[start] for x in (tail_peak, tail_trough, tail_dd)]
+        worst = np.fmin(np.fmin(tail[2], head[2]), head[1] / tail[0] - 1)
+        peak = np.fmax(tail[0], head[0])
+
+    # A window starting a block is that block's tail alone.
+    aligned = start % window == 0
+    worst[aligned] = tail[2][aligned]
+    peak[aligned] = tail[0][aligned]
+    worst[np.isnan(peak)] = np.nan
+    out[window - 1:] = worst
+    return out
+
+
+def rolling_stats(prices, windows=WINDOWS):
+    """
+    Rolling stats of a (months x funds) price DataFrame. Returns a dict of
+    window -> DataFrame indexed like the monthly returns, with (metric, fund)
+    columns for every metric in METRICS.
+    """
+    values = prices.to_numpy(dtype='float64')
+    returns = values[1:] / values[:-1] - 1
+    index = prices.index[1:]
+
+    result = {}
+    for window in windows:
+        mean, std, raw_skew, raw_kurt = rolling_moments(returns, window)
+        growth = np.full(returns.shape, np.nan)
+        growth[window - 1:] = values[window:] / values[:-window]
+        max_drawdown = rolling_max_drawdown(values, window + 1)[1:]
+        max_drawdown[np.isnan(mean)] = np.nan
+        with np.errstate(invalid='ignore', divide='ignore'):
+            cagr = np.where(np.isnan(mean), np.nan, growth ** (12 / window) - 1)
+
+        d = fund_stats.summary(mean, std, raw_skew, raw_kurt, cagr, max_drawdown)
+        result[window] = pd.concat({metric: pd.DataFrame(d[metric], index=index,
+                                                         columns=prices.columns)
+                                    for metric in METRICS}, axis=1)
+
+    return result
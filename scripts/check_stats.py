@@ -0,0 +1,37 @@
+# From the repository root: python -m scripts.check_stats
+import logging
+import return_store
+import data_loader
+import fund_stats
+import correlation
+
+logger = logging.getLogger('simulator')
+
+def load():
+    fund_name = 'drury-di'
+    sp500 = 'sp500'
+    return return_store.load([fund_name, sp500]).frame([fund_name, sp500])
+
+def compute_stats(value_series):
+    return fund_stats.stats_table(value_series.to_frame()).iloc[:, 0]
+
+def make_stats_df(data_df):
+    return fund_stats.stats_table(data_df)
+
+def make_corr_df(data_df):
+    return correlation.corr_frame(data_df.pct_change().iloc[1:])
+
+def main():
+    df = load()
+    
+    stats = make_stats_df(df)
+    print(stats)
+    print(make_corr_df(df))
+
+if __name__ == '__main__':
+    main()
+
+# Very close on all measures except skew/kurtosis for blackbird, some exact. 
+# Same for aspect div
+# Same for dunn-wma except sp500 correlation is off
+# Everything very close for drury div
\ No newline at end of file
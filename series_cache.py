@@ -0,0 +1,230 @@
+"""
+On-disk cache of parsed fund series.
+
+Every parsed series is stored as two .npy files (dates and values) next to a
+small JSON metadata file, under the source file's path relative to the data
+directory. An entry is valid while its source file keeps the
+same mtime and size; if only the mtime moved, the content hash decides. Warm
+loads memory-map the values and never touch pandas' CSV/Excel readers.
+
+    python series_cache.py status
+    python series_cache.py clear
+    python series_cache.py rebuild [KEY ...]
+"""
+import hashlib
+import json
+import os
+import sys
+import threading
+from functools import wraps
+from urllib.parse import quote, unquote
+
+import numpy as np
+import pandas as pd
+from data_loader import DATA_DIR
+
+# Bump when a parser changes its output so stale entries are rebuilt.
+FORMAT_VERSION = 4
+
+CACHE_DIR = os.environ.get('YANSHUF_CACHE_DIR', os.path.join(DATA_DIR, '.cache'))
+
+
+ENTRY_SUFFIXES = ('.json', '.dates.npy', '.values.npy')
+
+
+def entry_key(path, data_dir=DATA_DIR):
+    """The key of the entry for the file at `path`: its path under `data_dir`."""
+    return os.path.relpath(path, data_dir)
+
+
+def _entry_paths(key):
+    # Entries share one directory, so separators in the key are escaped.
+    base = os.path.join(CACHE_DIR, quote(key, safe=''))
+    return tuple(base + suffix for suffix in ENTRY_SUFFIXES)
+
+
+def _entry_key(entry):
+    for suffix in ENTRY_SUFFIXES:
+        if entry.endswith(suffix):
+            return unquote(entry[:-len(suffix)])
+    return None
+
+
+def file_hash(path):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def source_key(path):
+    st = os.stat(path)
+    return {'path': os.path.abspath(path), 'mtime_ns': st.st_mtime_ns, 'size': st.st_size}
+
+
+def read_meta(path, data_dir=DATA_DIR):
+    meta_path, _, _ = _entry_paths(entry_key(path, data_dir))
+    try:
+        with open(meta_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _temp_path(path):
+    # Per process and thread: report_server stores entries from several threads.
+    return f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+
+
+def _write_meta(meta_path, meta):
+    tmp = _temp_path(meta_path)
+    with open(tmp, 'w') as f:
+        json.dump(meta, f)
+    os.replace(tmp, meta_path)
+
+
+def is_fresh(path, meta=None, data_dir=DATA_DIR):
+    meta = read_meta(path, data_dir) if meta is None else meta
+    if meta is None or meta.get('version') != FORMAT_VERSION:
+        return False
+
+    key = source_key(path)
+    if meta['path'] != key['path'] or meta['size'] != key['size']:
+        return False
+    if meta['mtime_ns'] == key['mtime_ns']:
+        return True
+
+    # Touched but possibly unchanged: fall back to the content hash.
+    if meta.get('sha1') != file_hash(path):
+        return False
+    meta['mtime_ns'] = key['mtime_ns']
+    _write_meta(_entry_paths(meta['key'])[0], meta)
+    return True
+
+
+def load_entry(path, mmap=True, data_dir=DATA_DIR):
+    """Return the cached (ticker, series) for `path`, or None if missing or stale."""
+    meta = read_meta(path, data_dir)
+    if not is_fresh(path, meta):
+        return None
+    return read_entry(path, meta, mmap)
+
+
+def read_entry(path, meta, mmap=True):
+    """The stored (ticker, series) for `path` whether or not it is fresh, or None."""
+    _, dates_path, values_path = _entry_paths(meta['key'])
+    try:
+        dates = np.load(dates_path, allow_pickle=False)
+        values = np.load(values_path, mmap_mode='r' if mmap else None,
+                         allow_pickle=False)
+    except (OSError, ValueError):
+        return None
+
+    index = pd.DatetimeIndex(dates, name=meta['index_name'])
+    return (meta['ticker'], pd.Series(values, index=index, name=meta['name'], copy=False))
+
+
+def _save_array(path, array):
+    # Replace rather than overwrite, so series still mapped from the old file stay valid.
+    tmp = _temp_path(path)
+    with open(tmp, 'wb') as f:
+        np.save(f, array)
+    os.replace(tmp, path)
+
+
+def store_entry(path, ticker, series, sha1=None, data_dir=DATA_DIR):
+    """
+    Write `series` as the cache entry for `path`. `sha1` saves hashing the
+    source again when the caller already has it. Returns False if it can't
+    be cached.
+    """
+    if not isinstance(series.index, pd.DatetimeIndex) or series.dtype == object:
+        return False
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    key = entry_key(path, data_dir)
+    meta_path, dates_path, values_path = _entry_paths(key)
+    _save_array(dates_path, series.index.values.astype('datetime64[ns]'))
+    _save_array(values_path, np.ascontiguousarray(series.values))
+
+    meta = source_key(path)
+    meta.update(version=FORMAT_VERSION,
+                key=key,
+                sha1=file_hash(path) if sha1 is None else sha1,
+                ticker=ticker,
+                name=series.name,
+                index_name=series.index.name,
+                length=len(series))
+    _write_meta(meta_path, meta)
+    return True
+
+
+def cached(parse, data_dir=DATA_DIR):
+    """Wrap a parse_* function so it reads from and fills the cache."""
+    @wraps(parse)
+    def wrapper(fn):
+        path = data_dir + fn
+        entry = load_entry(path, data_dir=data_dir)
+        if entry is not None:
+            return entry
+
+        ticker, series = parse(fn)
+        store_entry(path, ticker, series, data_dir=data_dir)
+        return (ticker, series)
+
+    return wrapper
+
+
+def invalidate(keys=None):
+    """
+    Drop the cache entries of the given tickers (file paths under the data
+    directory without their extension), or everything when keys is None.
+    """
+    if not os.path.isdir(CACHE_DIR):
+        return 0
+
+    removed = 0
+    for entry in os.listdir(CACHE_DIR):
+        key = _entry_key(entry)
+        if key is not None and (keys is None or os.path.splitext(key)[0] in keys):
+            os.remove(os.path.join(CACHE_DIR, entry))
+            removed += 1
+    return removed
+
+
+def status():
+    if not os.path.isdir(CACHE_DIR):
+        return []
+    rows = []
+    for entry in sorted(os.listdir(CACHE_DIR)):
+        if not entry.endswith('.json'):
+            continue
+        with open(os.path.join(CACHE_DIR, entry)) as f:
+            meta = json.load(f)
+        fresh = os.path.exists(meta['path']) and is_fresh(meta['path'], meta)
+        rows.append((meta.get('key', unquote(entry[:-len('.json')])), meta['length'], fresh))
+    return rows
+
+
+def main(argv):
+    import parsers
+
+    command, keys = (argv[0] if argv else 'status'), argv[1:]
+    if command == 'clear':
+        print(f'Removed {invalidate(keys or None)} cache files from {CACHE_DIR}')
+    elif command == 'rebuild':
+        invalidate(keys or None)
+        data = parsers.load(keys or parsers.all_keys())
+        print(f'Rebuilt {len(data)} series in {CACHE_DIR}')
+    elif command == 'status':
+        for key, length, fresh in status():
+            print(f"{key:40} {length:6d} {'fresh' if fresh else 'stale'}")
+    else:
+        print(__doc__)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
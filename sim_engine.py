@@ -0,0 +1,240 @@
+"""
+Array-based portfolio simulation.
+
+Prices are a dense (months x funds) matrix and target weights a vector in the
+same column order (see fund_tree.flatten), so valuing the portfolio and
+rebalancing it are NumPy operations instead of per-fund .at lookups. Holdings
+only change on rebalance dates, so the months in between are valued one
+segment at a time. simulate_tree keeps the hierarchy instead, valuing each
+group from its children with its own rebalance calendar.
+"""
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+import instrument
+from lot_ledger import FIFO, LotLedger
+
+SimulationResult = namedtuple('SimulationResult',
+                              ['values', 'holdings', 'trades', 'taxes', 'ledger', 'state'])
+# Everything needed to continue a simulation with later rows; `rows` is how
+# many rows it has covered, so ledger time stamps keep increasing.
+SimState = namedtuple('SimState',
+                      ['shares', 'ledger', 'carried_gains', 'last_assessed', 'tax_owed', 'rows'])
+
+
+def monthly(dates):
+    return np.ones(len(dates), dtype=bool)
+
+
+def quarterly(dates):
+    return np.asarray(dates.is_quarter_start)
+
+
+def yearly(dates):
+    return np.asarray(dates.is_year_start)
+
+
+def never(dates):
+    return np.zeros(len(dates), dtype=bool)
+
+
+CALENDARS = {
+    'monthly': monthly,
+    'quarterly': quarterly,
+    'yearly': yearly,
+    'never': never,
+}
+
+
+def rebalance_mask(dates, calendar):
+    """
+    Boolean rebalance flags for `dates`. `calendar` is a name from CALENDARS,
+    a function of a DatetimeIndex, or an array of flags.
+    """
+    if isinstance(calendar, str):
+        calendar = CALENDARS[calendar]
+    if callable(calendar):
+        calendar = calendar(pd.DatetimeIndex(dates))
+    mask = np.asarray(calendar, dtype=bool)
+    if mask.shape != (len(dates),):
+        raise ValueError(f'Rebalance calendar has shape {mask.shape}, expected ({len(dates)},)')
+    return mask
+
+
+def weights_vector(fund_weights, names):
+    """Target weights from a fund_tree.flatten dict, in the column order of `names`."""
+    return np.array([fund_weights[name] for name in names], dtype='float64')
+
+
+def price_matrix(df, names):
+    return df[list(names)].to_numpy(dtype='float64')
+
+
+@instrument.timed('simulate')
+def simulate(prices, weights, rebalance, initial_capital=1_000_000,
+             taxable=None, tax_rate=0, tax_dates=None, lot_method=FIFO, state=None):
+    """
+    Buy `weights` of `initial_capital` at the first row of `prices` and hold,
+    resetting to target weights wherever `rebalance` is set. With a SimState
+    from an earlier result, carry on from it instead of buying; `prices` are
+    then the rows that follow.
+
+    Funds flagged in `taxable` keep purchase lots in a LotLedger, sold by
+    `lot_method`. Gains realized on rebalance sells accumulate (losses carry
+    forward) until the next `tax_dates` flag, when `tax_rate` of any positive
+    balance becomes owed; the amount owed is deducted from the portfolio at
+    the next rebalance.
+    """
+    prices = np.asarray(prices, dtype='float64')
+    weights = np.asarray(weights, dtype='float64')
+    rebalance = np.asarray(rebalance, dtype=bool)
+    n_months, n_funds = prices.shape
+    taxable = np.zeros(n_funds, dtype=bool) if taxable is None else np.asarray(taxable, dtype=bool)
+    tax_dates = np.zeros(n_months, dtype=bool) if tax_dates is None else np.asarray(tax_dates, dtype=bool)
+
+    values = np.empty(n_months)
+    holdings = np.empty((n_months, n_funds))
+    trades = np.zeros((n_months, n_funds))
+    taxes = np.zeros(n_months)
+
+    if state is None:
+        shares = (initial_capital * weights) / prices[0]
+        ledger = LotLedger(n_funds, lot_method)
+        for i in np.flatnonzero(taxable):
+            ledger.buy(i, shares[i], prices[0, i], 0)
+        carried_gains = 0
+        last_assessed = None
+        tax_owed = 0
+        offset = 0
+    else:
+        shares, ledger, carried_gains, last_assessed, tax_owed, offset = state
+
+    events = np.flatnonzero(rebalance | tax_dates)
+    bounds = np.concatenate(([0], events, [n_months]))
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        if start == end:
+            continue
+
+        if rebalance[start]:
+            price = prices[start]
+            value = price @ shares - tax_owed
+            taxes[start] = tax_owed
+            tax_owed = 0
+
+            new_shares = (value * weights) / price
+            delta = new_shares - shares
+            for i in np.flatnonzero(taxable & (delta != 0)):
+                if delta[i] < 0:
+                    ledger.sell(i, -delta[i], price[i], offset + start)
+                else:
+                    ledger.buy(i, delta[i], price[i], offset + start)
+            trades[start] = delta
+            shares = new_shares
+
+        # Simple carry-forward of loss
+        if tax_dates[start]:
+            cap_gains = carried_gains + ledger.realized_gains(since=last_assessed,
+                                                              until=offset + start)
+            last_assessed = offset + start
+            carried_gains = 0 if cap_gains > 0 else cap_gains
+            if cap_gains > 0:
+                tax_owed += cap_gains * tax_rate
+
+        holdings[start:end] = shares
+        values[start:end] = prices[start:end] @ shares
+        if rebalance[start]:
+            values[start] = value
+
+    state = SimState(shares, ledger, carried_gains, last_assessed, tax_owed, offset + n_months)
+    return SimulationResult(values, holdings, trades, taxes, ledger, state)
+
+
+@instrument.timed('simulate_batch')
+def simulate_batch(prices, weights, rebalance):
+    """
+    Untaxed value paths, starting at 1, for many weight vectors at once.
+    `weights` is (candidates x funds); the result is (months x candidates).
+    Within a holding period every candidate's value is the period's price
+    relatives times its weights, so all candidates share one matrix product.
+    """
+    prices = np.asarray(prices, dtype='float64')
+    weights = np.atleast_2d(np.asarray(weights, dtype='float64'))
+    starts = np.flatnonzero(np.asarray(rebalance, dtype=bool))
+    if len(starts) == 0 or starts[0] != 0:
+        starts = np.concatenate(([0], starts))
+
+    period = np.cumsum(np.isin(np.arange(len(prices)), starts)) - 1
+    within = (prices / prices[starts][period]) @ weights.T
+
+    period_growth = (prices[starts[1:]] / prices[starts[:-1]]) @ weights.T
+    period_start = np.vstack((np.ones((1, len(weights))), np.cumprod(period_growth, axis=0)))
+    return within * period_start[period]
+
+
+def holding_values(prices, weights, rows):
+    """
+    Values, starting at 1, of holding `weights[k]`, and cash for the rest,
+    from `rows[k]` until the next row. Rows before the first are 1.
+    """
+    n_rows = len(prices)
+    period = np.searchsorted(rows, np.arange(n_rows), side='right') - 1
+    live = period >= 0
+    p = period[live]
+
+    with np.errstate(invalid='ignore'):
+        within = (np.where(weights[p] > 0, prices[live] / prices[rows[p]], 0) * weights[p]).sum(axis=1) \
+            + 1 - weights[p].sum(axis=1)
+        growth = (np.where(weights[:-1] > 0, prices[rows[1:]] / prices[rows[:-1]], 0)
+                  * weights[:-1]).sum(axis=1) + 1 - weights[:-1].sum(axis=1)
+    level = np.concatenate(([1], np.cumprod(growth)))
+
+    values = np.ones(n_rows)
+    values[live] = within * level[p]
+    return values
+
+
+def simulate_tree(prices, dates, tree, calendars=None, default='yearly'):
+    """
+    Values, starting at 1, of every node of a fund_tree.CompiledTree over a
+    (months x leaves) price matrix in tree.leaf_names order; the root is
+    column 0. Each group rebalances to its children's local weights on its
+    own calendar (`calendars` maps node names to anything rebalance_mask
+    takes, the rest use `default`) and drifts in between, so a group can be
+    rebalanced internally more or less often than money moves between groups.
+    """
+    prices = np.asarray(prices, dtype='float64')
+    calendars = {} if calendars is None else calendars
+    values = np.empty((len(prices), len(tree.names)))
+    values[:, tree.leaves] = prices / prices[0]
+
+    # Children come after their parent in preorder, so walk it backwards.
+    for i in range(len(tree.names) - 1, -1, -1):
+        if tree.is_leaf[i]:
+            continue
+        children = tree.children[i]
+        mask = rebalance_mask(dates, calendars.get(tree.names[i], default))
+        rows = np.flatnonzero(np.concatenate(([True], mask[1:])))
+        weights = np.broadcast_to(tree.weight[children], (len(rows), len(children)))
+        values[:, i] = holding_values(values[:, children], weights, rows)
+    return values
+
+
+def simulate_frame(df, fund_weights, calendar='yearly', initial_capital=1_000_000,
+                   is_taxable=None, tax_rate=0, lot_method=FIFO):
+    """
+    Run `simulate` over an aligned price DataFrame with the weights of a
+    flattened fund tree. Taxes are assessed at the start of each year.
+    Returns the portfolio value series and the raw result.
+    """
+    names = list(fund_weights.keys())
+    taxable = None if is_taxable is None else [is_taxable(name) for name in names]
+    result = simulate(price_matrix(df, names),
+                      weights_vector(fund_weights, names),
+                      rebalance_mask(df.index, calendar),
+                      initial_capital,
+                      taxable=taxable,
+                      tax_rate=tax_rate,
+                      tax_dates=df.index.is_year_start,
+                      lot_method=lot_method)
+
+    return pd.Series(result.values, df.index), result
@@ -1,5 +1,13 @@
 from math import pi, atan
+import numpy as np
 from eta_table import ETA_TABLE
+
+# The eta table as sorted arrays, for the vectorized lookups below.
+ETA_SKEWS = np.array(sorted(ETA_TABLE))
+ETA_VALUES = np.array([ETA_TABLE[key] for key in sorted(ETA_TABLE)])
+ETA_KEYS = np.rint(ETA_SKEWS * 100).astype('int64')
+
+_eta_spline = None
             
 def sgn(x):
     if x < 0: return -1
@@ -22,3 +30,40 @@ def skill_metric(mu, sigma, skew):
         return (mu / sigma) * ((1 - t) ** 0.5) + \
             sgn(eta) * (2 / pi) * atan((2 * mu) / (pi * sigma)) * (t ** 0.5)
 
+def compute_eta_array(skew, interpolation=None):
+    """
+    Vectorized compute_eta. Without interpolation skew is rounded to the
+    table's 0.01 grid like compute_eta; 'linear' and 'spline' interpolate
+    between grid points instead. Skews outside the table give NaN.
+    """
+    global _eta_spline
+    skew = np.asarray(skew, dtype='float64')
+    lo, hi = ETA_SKEWS[0], ETA_SKEWS[-1]
+
+    if interpolation is None:
+        with np.errstate(invalid='ignore'):
+            keys = np.rint(np.nan_to_num(skew, nan=np.inf, posinf=np.inf, neginf=np.inf) * 100)
+        idx = np.clip(np.searchsorted(ETA_KEYS, keys), 0, len(ETA_KEYS) - 1)
+        return np.where(ETA_KEYS[idx] == keys, ETA_VALUES[idx], np.nan)
+
+    inside = (skew >= lo) & (skew <= hi)
+    if interpolation == 'linear':
+        eta = np.interp(skew, ETA_SKEWS, ETA_VALUES)
+    elif interpolation == 'spline':
+        if _eta_spline is None:
+            from scipy.interpolate import CubicSpline
+            _eta_spline = CubicSpline(ETA_SKEWS, ETA_VALUES)
+        eta = _eta_spline(np.where(inside, skew, 0))
+    else:
+        raise ValueError(f'Unknown interpolation: {interpolation}')
+    return np.where(inside, eta, np.nan)
+
+def skill_metric_array(mu, sigma, skew, interpolation=None):
+    """Vectorized skill_metric over arrays of mu, sigma and skew; NaN where tau is undefined."""
+    mu = np.asarray(mu, dtype='float64')
+    sigma = np.asarray(sigma, dtype='float64')
+    eta = compute_eta_array(skew, interpolation)
+    t = (2 / pi) * ((eta ** 2) / (1 + eta ** 2))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return (mu / sigma) * np.sqrt(1 - t) + \
+            np.sign(eta) * (2 / pi) * np.arctan((2 * mu) / (pi * sigma)) * np.sqrt(t)
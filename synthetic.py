@@ -0,0 +1,159 @@
+"""
+Synthetic fund data for benchmarks and tests.
+
+Generates random monthly NAV histories and writes them in the layouts the
+parsers read, so the loading path can be exercised without the real
+spreadsheets. Excel formats are only written when an Excel writer (openpyxl)
+is installed.
+"""
+import importlib.util
+import logging
+import os
+import numpy as np
+import pandas as pd
+
+EXTENSIONS = {
+    'hfrx': 'csv',
+    'iasg': 'csv',
+    'amundi': 'csv',
+    'tabular_csvs': 'csv',
+    'rcm': 'xlsx',
+    'eurekahedge': 'xlsx',
+    'fred': 'csv',
+    'yahoo': 'csv',
+}
+EXCEL_FORMATS = ('rcm', 'eurekahedge')
+
+logger = logging.getLogger('synthetic')
+
+# Equal splits whose float sums are exactly 1 and whose products stay short
+# decimals, so fund_tree.flatten accepts any tree built from them.
+TREE_BRANCHING = (8, 5, 4, 2)
+
+
+def available_formats():
+    excel = importlib.util.find_spec('openpyxl') is not None
+    if not excel:
+        logger.warning('openpyxl is not installed: no %s files are written', ', '.join(EXCEL_FORMATS))
+    return [f for f in EXTENSIONS if excel or f not in EXCEL_FORMATS]
+
+
+def random_returns(rng, n_months, n_funds, mean=0.006, vol=0.035):
+    return rng.normal(mean, vol, (n_months, n_funds))
+
+
+def random_prices(n_funds, years, seed=0, start='1990-01-01', prefix='fund'):
+    """A (months x funds) DataFrame of month-start NAVs starting at 1000."""
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(start, periods=years * 12, freq='MS')
+    navs = 1000 * np.cumprod(1 + random_returns(rng, len(dates), n_funds), axis=0)
+    return pd.DataFrame(navs, index=dates,
+                        columns=[f'{prefix}_{i:05d}' for i in range(n_funds)])
+
+
+def _write_lines(path, header, lines):
+    with open(path, 'w') as f:
+        f.write('\n'.join(header + lines) + '\n')
+
+
+def write_hfrx(path, dates, navs):
+    _write_lines(path, ['Date,Close'],
+                 [f'{d.month}/{d.year},{v:.4f}' for d, v in zip(dates, navs)])
+
+
+def write_iasg(path, dates, navs):
+    returns = np.diff(navs, prepend=1000) / np.concatenate(([1000], navs[:-1])) * 100
+    _write_lines(path, ['Year,Month,ROR,VAMI'],
+                 [f'{d.year},{d.month},{r:.4f},{v:.2f}'
+                  for d, r, v in zip(dates, returns, navs)])
+
+
+def write_amundi(path, dates, navs):
+    preamble = [f'Fund information line {i}' for i in range(15)]
+    _write_lines(path, preamble + ['Currency,Date,NAV,'],
+                 [f'EUR,{d:%Y-%m-%d},{v / 10:.4f},' for d, v in zip(dates, navs)])
+
+
+def write_tabular_csv(path, dates, navs):
+    returns = np.diff(navs, prepend=1000) / np.concatenate(([1000], navs[:-1])) * 100
+    table = {}
+    for d, r in zip(dates, returns):
+        table.setdefault(d.year, [''] * 12)[d.month - 1] = f'{r:.4f}'
+    lines = [f'{year},' + ','.join(cells) + ',' for year, cells in table.items()]
+    _write_lines(path, ['Year,Jan,Feb,Mar,Apr,May,Jun,Jul,Aug,Sep,Oct,Nov,Dec,YTD'], lines)
+
+
+def write_fred(path, dates, navs):
+    _write_lines(path, ['DATE,VALUE'],
+                 [f'{d:%Y-%m-%d},{v:.4f}' for d, v in zip(dates, navs)])
+
+
+def write_yahoo(path, dates, navs):
+    _write_lines(path, ['Date,Open,High,Low,Close,Adj Close,Volume'],
+                 [f'{d:%Y-%m-%d},{v:.4f},{v:.4f},{v:.4f},{v:.4f},{v:.4f},0'
+                  for d, v in zip(dates, navs)])
+
+
+def write_rcm(path, dates, navs):
+    returns = np.diff(navs, prepend=1000) / np.concatenate(([1000], navs[:-1]))
+    pd.DataFrame({'return': returns}, index=dates).to_excel(path, startrow=2, header=False)
+
+
+def write_eureka(path, dates, navs):
+    returns = np.diff(navs, prepend=1000) / np.concatenate(([1000], navs[:-1])) * 100
+    labels = [f'{d:%b %Y}' for d in dates]
+    pd.DataFrame({'return': returns, 'value': navs / 10}, index=labels) \
+        .to_excel(path, startrow=4, header=False)
+
+
+WRITERS = {
+    'hfrx': write_hfrx,
+    'iasg': write_iasg,
+    'amundi': write_amundi,
+    'tabular_csvs': write_tabular_csv,
+    'rcm': write_rcm,
+    'eurekahedge': write_eureka,
+    'fred': write_fred,
+    'yahoo': write_yahoo,
+}
+
+
+def write_dataset(directory, n_funds, years, seed=0, formats=None):
+    """
+    Write `n_funds` synthetic funds of `years` years into `directory`, taking
+    turns over `formats`. Returns a spreadsheets dict in data_loader's layout.
+    """
+    formats = available_formats() if formats is None else list(formats)
+    os.makedirs(directory, exist_ok=True)
+    prices = random_prices(n_funds, years, seed)
+    sheets = {f: [] for f in formats}
+    for i, navs in enumerate(prices.to_numpy().T):
+        parse_class = formats[i % len(formats)]
+        fn = f'{parse_class}_{i:05d}.{EXTENSIONS[parse_class]}'
+        WRITERS[parse_class](os.path.join(directory, fn), prices.index, navs)
+        sheets[parse_class].append(fn)
+    return sheets
+
+
+def fund_tree(names, name='root'):
+    """
+    A nested fund tree over `names` for fund_tree.flatten. The number of
+    names must be a product of TREE_BRANCHING factors, e.g. 10, 100 or 5000.
+    """
+    n = len(names)
+    if n == 1:
+        return (names[0], 1)
+    branching = next((b for b in TREE_BRANCHING if n % b == 0), None)
+    if branching is None:
+        raise ValueError(f'Cannot build an evenly weighted tree over {n} funds')
+
+    size = n // branching
+    children = []
+    for k in range(branching):
+        group = names[k * size:(k + 1) * size]
+        child = fund_tree(group, f'{name}.{k}')
+        if len(child) == 2:
+            children.append((child[0], 1 / branching))
+        else:
+            children.append((child[0], 1 / branching, child[2]))
+    return (name, 1, children)
@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+import pytest
+import aligned_store
+
+
+def test_valid_bounds():
+    values = np.full((6, 3), np.nan, order='F')
+    values[1:4, 0] = 1.0
+    values[[0, 5], 1] = 2.0
+    first, last = aligned_store.valid_bounds(values)
+    assert list(first) == [1, 0, 6] and list(last) == [3, 5, -1]
+
+
+@pytest.mark.parametrize('dtype', aligned_store.DTYPES)
+def test_memory_mapped(tmp_path, dtype):
+    path = str(tmp_path / 'store' / 'matrix')
+    dates = pd.date_range('2000-01-01', periods=5, freq='MS', name='Date')
+    values = aligned_store.allocate((5, 2), dtype, path)
+    assert isinstance(values, np.memmap) and values.flags.f_contiguous and np.isnan(values).all()
+    values[1:, 0] = np.arange(4) / 10
+    aligned_store.save(path, values, dates, {'names': ['a', 'b']})
+
+    mapped, read_dates, meta = aligned_store.open_matrix(path)
+    assert isinstance(mapped, np.memmap) and mapped.dtype == dtype and mapped.flags.f_contiguous
+    np.testing.assert_array_equal(mapped, values)
+    assert read_dates.equals(dates) and read_dates.name == 'Date'
+    assert meta == {'names': ['a', 'b']}
+
+    aligned_store.remove(path)
+    assert not list((tmp_path / 'store').iterdir())
+    np.testing.assert_array_equal(mapped, values)
+    with pytest.raises(ValueError):
+        aligned_store.allocate((5, 2), 'float16')
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+import allocation_search
+import sim_engine
+
+
+def test_weight_grid():
+    grid = allocation_search.weight_grid(3, 0.1)
+    assert len(grid) == 36
+    np.testing.assert_allclose(grid.sum(axis=1), 1)
+    assert (grid >= 0.1 - 1e-12).all()
+    assert len(allocation_search.weight_grid(3, 0.1, allow_zero=True)) == 66
+
+
+def test_pareto_mask():
+    objectives = np.array([[1, 1, 1], [2, 0, 1], [0.5, 0.5, 0.5], [1, 1, np.nan]])
+    assert list(allocation_search.pareto_mask(objectives)) == [True, True, False, False]
+
+
+def make_prices():
+    rng = np.random.default_rng(8)
+    columns = [f'f{i}' for i in range(6)]
+    prices = pd.DataFrame(100 * np.cumprod(1 + rng.normal(0.006, 0.04, (120, 6)), axis=0),
+                          index=pd.date_range('2005-01-01', periods=120, freq='MS'),
+                          columns=columns)
+    return prices, {'a': columns[:3], 'b': columns[3:]}
+
+
+def test_search_ranks_candidates_like_the_engine():
+    prices, groups = make_prices()
+    columns = list(prices.columns)
+
+    table, n_candidates = allocation_search.search(prices, groups, 'cagr', step=0.25, top=3)
+    assert n_candidates == 7 * 7 * 3
+    assert table['cagr'].is_monotonic_decreasing
+
+    best = table.iloc[0]
+    weights = np.zeros(6)
+    for name in groups:
+        funds = best[f'{name}_funds'].split(', ')
+        for fund in funds:
+            weights[columns.index(fund)] = best[f'{name}_weight'] / len(funds)
+    values = sim_engine.simulate(prices.to_numpy(), weights,
+                                 sim_engine.rebalance_mask(prices.index, 'yearly'), 1).values
+    assert np.isclose(values[-1] ** (12 / 119) - 1, best['cagr'])
+
+
+def test_workers_find_the_same_ranking():
+    prices, groups = make_prices()
+    whole, _ = allocation_search.search(prices, groups, 'calmar', step=0.25, top=5)
+    # Chunks of 20 candidates, merged from two processes sharing the prices.
+    pooled, n_candidates = allocation_search.search(prices, groups, 'calmar', step=0.25, top=5,
+                                                    workers=2, chunk_size=20)
+    assert n_candidates > 20 * 2
+    pd.testing.assert_frame_equal(pooled, whole)
@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+import pytest
+import backtester
+
+
+def make_prices(n_months=110, start='2012-01-01', freq='MS', seed=1):
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(start, periods=n_months, freq=freq)
+    returns = rng.normal(0.005, 0.04, (n_months, 6))
+    return pd.DataFrame(100 * np.cumprod(1 + returns, axis=0), dates, list('abcdef'))
+
+
+def dragon():
+    return backtester.strategy('dragon', [
+        backtester.strategy('trend', ['a', 'b', 'c'], 'inv_vol'),
+        backtester.strategy('bonds', ['d', 'e'], 'equal'),
+        backtester.strategy('gold', ['f'], 'inv_vol'),
+    ], 'equal', 'yearly')
+
+
+def to_bt(bt, node):
+    """The same tree built from bt's algos."""
+    weigh = bt.algos.WeighInvVol() if node.weigh == 'inv_vol' else bt.algos.WeighEqually()
+    run = {None: [], 'monthly': [bt.algos.RunMonthly()], 'quarterly': [bt.algos.RunQuarterly()],
+           'yearly': [bt.algos.RunYearly()]}[node.run]
+    children = [to_bt(bt, c) if isinstance(c, backtester.Strategy) else c for c in node.children]
+    return bt.Strategy(node.name, run + [bt.algos.SelectAll(), weigh, bt.algos.Rebalance()], children)
+
+
+@pytest.mark.parametrize('start, freq', [('2012-01-01', 'MS'), ('2012-03-31', 'ME')])
+def test_matches_bt(start, freq):
+    bt = pytest.importorskip('bt')
+    prices = make_prices(start=start, freq=freq)
+    strategy = dragon()
+
+    res = bt.run(bt.Backtest(to_bt(bt, strategy), prices, integer_positions=False,
+                             progress_bar=False))
+    values = backtester.backtest(strategy, prices)
+    np.testing.assert_allclose(values['dragon'], res.prices['dragon'], rtol=1e-12)
+    for child in ('trend', 'bonds', 'gold'):
+        np.testing.assert_allclose(values[child],
+                                   res.backtests['dragon'].strategy.children[child].prices,
+                                   rtol=1e-12)
+
+    perf = backtester.performance(values['dragon'])
+    expected = res.stats['dragon']
+    for key in backtester.STAT_KEYS:
+        assert perf.stats[key] == pytest.approx(expected[key], rel=1e-9), key
+    assert perf.stats['start'] == expected['start']
+    pd.testing.assert_frame_equal(perf.return_table, res['dragon'].return_table,
+                                  check_dtype=False, check_index_type=False, rtol=1e-9)
+
+
+def test_inv_vol_waits_for_two_returns():
+    prices = make_prices(n_months=6)
+    values = backtester.backtest(backtester.strategy('trend', ['a', 'b'], 'inv_vol'), prices)
+    # Cash until the third month, the first with two returns in the lookback,
+    # so the value first moves in the fourth.
+    assert (values['trend'].iloc[:4] == backtester.PAR).all()
+    assert values['trend'].iloc[4] != backtester.PAR
+
+
+def test_yearly_schedule():
+    dates = pd.date_range('2010-06-01', periods=30, freq='MS')
+    mask = backtester.run_mask(dates, 'yearly')
+    assert list(dates[mask]) == [pd.Timestamp('2010-06-01'), pd.Timestamp('2011-01-01'),
+                                 pd.Timestamp('2012-01-01')]
+
+
+def test_unknown_weighing():
+    with pytest.raises(ValueError):
+        backtester.strategy('x', ['a'], 'min_var')
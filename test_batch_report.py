@@ -0,0 +1,81 @@
+import pandas as pd
+import pytest
+import batch_report
+import data_loader
+import return_store
+import series_cache
+import synthetic
+import yanshuf
+
+
+@pytest.fixture
+def pipeline(tmp_path, monkeypatch):
+    prices = synthetic.random_prices(4, 6, seed=3)
+    calls = []
+
+    def dragon_backtest(keys, strategy, data):
+        calls.append(strategy.name)
+        return pd.DataFrame({'cagr': [0.1]}, index=[strategy.name]), None
+
+    monkeypatch.setattr(series_cache, 'CACHE_DIR', str(tmp_path / '.cache'))
+    monkeypatch.setattr(data_loader, 'shortnames', {k: k[-2:] for k in prices})
+    monkeypatch.setattr(yanshuf, 'compile_data',
+                        lambda minimum, keys: return_store.build({k: prices[k] for k in keys}))
+    monkeypatch.setattr(yanshuf, 'dragon_backtest', dragon_backtest)
+    monkeypatch.setattr(yanshuf, 'render_performance', lambda stats: stats.to_html())
+    monkeypatch.setattr(yanshuf, 'render_corr', lambda returns: returns.corr().to_html())
+    return list(prices), calls
+
+
+def test_fragments_are_reused(pipeline, tmp_path):
+    funds, calls = pipeline
+    groups = {'long_vol_group': funds[:2], 'alt_group': funds[2:]}
+    portfolios = [('client-a', groups), ('client-b', groups)]
+
+    results = batch_report.run_batch(portfolios, str(tmp_path / 'out'))
+    assert [hits for _, hits in results] == [
+        {'perf': False, 'corr': False, 'info': False},
+        # Same funds, but the strategy name heads the performance table.
+        {'perf': False, 'corr': True, 'info': True},
+    ]
+    with open(results[0][0]) as f:
+        page = f.read()
+    assert 'client-a' in page and '[00]' in page
+
+    results = batch_report.run_batch(portfolios, str(tmp_path / 'out'))
+    assert all(all(hits.values()) for _, hits in results)
+    assert calls == ['client-a', 'client-b']
+
+    groups = {'long_vol_group': funds[:2], 'alt_group': funds[3:]}
+    _, hits = batch_report.build_report('client-a', groups)
+    assert hits == {'perf': False, 'corr': False, 'info': False}
+
+
+def test_data_hash():
+    s = pd.Series([1.0, 2.0], pd.date_range('2020-01-01', periods=2, freq='MS'), name='a')
+    assert batch_report.data_hash(s) == batch_report.data_hash(s.copy())
+    assert batch_report.data_hash(s) != batch_report.data_hash(s.rename('b'))
+    assert batch_report.data_hash(s) != batch_report.data_hash(s * 1.0001)
+
+
+def test_duplicate_names(tmp_path):
+    with pytest.raises(ValueError):
+        batch_report.run_batch([('a', {}), ('a', {})], str(tmp_path))
+
+
+def test_renderers_on_real_frames(monkeypatch):
+    prices = synthetic.random_prices(4, 12, seed=4, start='2010-01-01')
+    funds = list(prices)
+    monkeypatch.setattr(data_loader, 'shortnames', {k: f'short{k[-1]}' for k in funds})
+    data = return_store.build({k: prices[k] for k in funds})
+    strategy, keys = yanshuf.tailored_strategy({'long_vol_group': funds[:2], 'alt_group': funds[2:]})
+    stats, _ = yanshuf.dragon_backtest(keys, strategy, data)
+
+    perf = yanshuf.render_performance(stats)
+    assert perf.startswith('<style') and 'tailored-dragon' in perf and '%' in perf
+    returns = yanshuf.tailored_returns(keys, data)
+    heat_map = yanshuf.render_corr(returns)
+    assert 'short3' in heat_map and 'background-color' in heat_map
+    monkeypatch.setattr(yanshuf, 'corr_table_limit', 2)
+    pairs = yanshuf.render_corr(returns)
+    assert 'short3' in pairs and 'periods' in pairs
@@ -0,0 +1,91 @@
+import json
+import os
+import subprocess
+import sys
+import pytest
+import cli
+import parsers
+import series_cache
+import synthetic
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Seconds for the import alone; the scheduler starts hundreds of short jobs.
+IMPORT_BUDGETS = {'cli': 0.1}
+MODULES = ['aligned_store', 'allocation_search', 'backtester', 'batch_report', 'bench', 'cli',
+           'correlation', 'fund_stats', 'fund_tree', 'incremental', 'main', 'monte_carlo',
+           'parsers', 'rebalance_policy', 'report_server', 'resampling', 'return_store', 'rolling_stats',
+           'scripts.check_skill_metric', 'scripts.check_stats', 'series_cache', 'sim_engine',
+           'simulator', 'synthetic', 'vintage', 'yanshuf']
+# Only the commands that need these should load them.
+HEAVY = ['bt', 'empyrical', 'ffn', 'jinja2', 'matplotlib', 'monthdelta', 'scipy']
+
+
+def run_python(code):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([HERE, os.environ.get('PYTHONPATH', '')]))
+    out = subprocess.run([sys.executable, '-c', code], cwd=HERE, env=env,
+                         capture_output=True, text=True, check=True)
+    return out.stdout
+
+
+@pytest.mark.parametrize('module, budget', IMPORT_BUDGETS.items())
+def test_import_budget(module, budget):
+    seconds = float(run_python(
+        f'import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)'))
+    assert seconds < budget
+
+
+def test_imports_do_nothing():
+    out = run_python(f'import sys, json, logging; import {", ".join(MODULES)}; '
+                     f'print(json.dumps([sorted(set({HEAVY!r}) & set(sys.modules)), '
+                     f'logging.getLogger().hasHandlers()]))')
+    heavy, configured = json.loads(out)
+    assert heavy == []
+    assert not configured
+
+
+def test_stats_command(tmp_path, capsys):
+    saved = (parsers.DATA_DIR, parsers.spreadsheets, series_cache.CACHE_DIR)
+    series_cache.CACHE_DIR = str(tmp_path / '.cache')
+    try:
+        sheets = synthetic.write_dataset(str(tmp_path) + '/', 2, 3, formats=['fred', 'yahoo'])
+        parsers.use_data(str(tmp_path) + '/', sheets)
+        keys = parsers.all_keys()
+        assert cli.main(['ingest']) == 0
+        trace = str(tmp_path / 'trace.json')
+        assert cli.main(['--trace', trace, 'stats'] + keys) == 0
+        assert cli.main(['stats', '--bootstrap', '20', '--workers', '1'] + keys[:2]) == 0
+        assert cli.main(['stats', 'nope']) == 1
+    finally:
+        parsers.use_data(*saved[:2])
+        series_cache.CACHE_DIR = saved[2]
+
+    out = capsys.readouterr().out
+    assert 'tau' in out and 'cvar' in out and 'high' in out
+    assert all(key in out for key in keys)
+    with open(trace) as f:
+        names = {e['name'] for e in json.load(f)['traceEvents']}
+    assert {'command.stats', 'ingest.lookup', 'stats', 'corr', 'ingest.cached'} <= names
+    # Everything was ingested beforehand.
+    assert 'ingest' not in names
+
+
+def test_update_command(tmp_path, capsys, monkeypatch):
+    import data_loader
+
+    monkeypatch.setattr(series_cache, 'CACHE_DIR', str(tmp_path / '.cache'))
+    saved = (parsers.DATA_DIR, parsers.spreadsheets)
+    try:
+        sheets = synthetic.write_dataset(str(tmp_path) + '/', 2, 3, formats=['fred', 'yahoo'])
+        parsers.use_data(str(tmp_path) + '/', sheets)
+        monkeypatch.setattr(data_loader, 'simulation', synthetic.fund_tree(parsers.all_keys()))
+        monkeypatch.setattr(data_loader, 'proxies', {}, raising=False)
+        assert cli.main(['update']) == 0
+        assert cli.main(['update']) == 0
+        assert cli.main(['update', '--calendar', 'quarterly']) == 0
+    finally:
+        parsers.use_data(*saved)
+
+    out = capsys.readouterr().out
+    assert out.count('Rebuilt the checkpoint from 36 months.') == 2
+    assert 'Added 0 months, now up to' in out and 'sim' in out
@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+import correlation
+
+
+def make_returns(n_months=120, n_funds=7, seed=6):
+    rng = np.random.default_rng(seed)
+    common = rng.normal(0, 0.03, (n_months, 1))
+    returns = pd.DataFrame(common * rng.uniform(-1, 1, n_funds) + rng.normal(0, 0.02, (n_months, n_funds)),
+                           columns=[f'f{i}' for i in range(n_funds)])
+    # Funds that start late, stop early and have a hole.
+    returns.iloc[:40, 1] = np.nan
+    returns.iloc[90:, 2] = np.nan
+    returns.iloc[50:55, 4] = np.nan
+    return returns
+
+
+def test_pairwise_matches_pandas():
+    returns = make_returns()
+    expected = returns.corr(min_periods=30)
+    got = correlation.pairwise_corr(returns.to_numpy(), min_periods=30, block=3)
+    np.testing.assert_allclose(got, expected.to_numpy(), rtol=1e-10, atol=1e-12)
+
+    returns.iloc[:100, 5] = np.nan
+    frame = correlation.corr_frame(returns, min_periods=30)
+    assert frame['f5'].drop('f5').isna().all()
+    pd.testing.assert_frame_equal(frame, returns.corr(min_periods=30), rtol=1e-10)
+
+
+def test_returns_frame_keeps_own_history():
+    dates = pd.date_range('2010-01-01', periods=6, freq='MS')
+    data = {'a': pd.Series(np.arange(1, 7.0), dates), 'b': pd.Series([1, 2, 4.0], dates[3:])}
+    frame = correlation.returns_frame(data)
+    assert frame['a'].notna().sum() == 5
+    assert frame['b'].notna().sum() == 2
+
+
+def test_rolling_and_ewm_match_pandas():
+    returns = make_returns(n_funds=5)
+    got = correlation.rolling_corr(returns.to_numpy(), 24, rows=[30, 60, 119])
+    for i, end in enumerate([30, 60, 119]):
+        expected = returns.iloc[end - 23:end + 1].corr(min_periods=24)
+        np.testing.assert_allclose(got[i], expected.to_numpy(), rtol=1e-10)
+
+    got = correlation.ewm_corr(returns.to_numpy(), 12, rows=[45, 119], block=2)
+    for i, end in enumerate([45, 119]):
+        for a, b in [(0, 1), (0, 2), (1, 4), (2, 4)]:
+            expected = returns.iloc[:, a].ewm(halflife=12).corr(returns.iloc[:, b]).iloc[end]
+            np.testing.assert_allclose(got[i][a, b], expected, rtol=1e-9)
+
+
+def test_top_pairs():
+    returns = make_returns()
+    corr = returns.corr(min_periods=12)
+    pairs = correlation.top_pairs(returns, k=2, block=4)
+
+    assert len(pairs) == 2 * returns.shape[1]
+    for fund, group in pairs.groupby('fund'):
+        expected = corr[fund].drop(fund).sort_values(ascending=False)
+        assert list(group['other']) == list(expected.index[:2])
+        np.testing.assert_allclose(group['corr'], expected.iloc[:2], rtol=1e-10)
+
+    lowest = correlation.top_pairs(returns, k=1, largest=False)
+    assert list(lowest['other']) == [corr[f].drop(f).idxmin() for f in returns.columns]
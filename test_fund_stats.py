@@ -0,0 +1,118 @@
+import math
+import numpy as np
+import pandas as pd
+import pytest
+import fund_stats
+import synthetic
+from skill_metric import skill_metric
+
+emp = pytest.importorskip('empyrical')
+
+
+def reference_stats(value_series):
+    # The per-column compute_stats the kernel replaced.
+    series = value_series.pct_change().dropna()
+    af = math.sqrt(12)
+    raw_skew = series.skew()
+    raw_kurt = series.kurt()
+    sigma = series.std() * af
+    mu = series.mean() * 12
+    return pd.Series({
+        'calmar': emp.calmar_ratio(series, emp.MONTHLY),
+        'tau': skill_metric(mu, sigma, raw_skew / af),
+        'cagr': emp.cagr(series, emp.MONTHLY),
+        'max_drawdown': emp.max_drawdown(series),
+        'vol': sigma,
+        'sharpe': mu / sigma,
+        'skew': raw_skew / af,
+        'kurt': raw_kurt / 12,
+        'raw_skew': raw_skew,
+        'raw_kurt': raw_kurt,
+        'var': emp.value_at_risk(series),
+        'cvar': emp.conditional_value_at_risk(series),
+    })
+
+
+def test_matches_per_column_stats():
+    prices = synthetic.random_prices(6, 10, seed=3)
+    # A fund that starts late, as in an unaligned universe.
+    prices.iloc[:30, 2] = np.nan
+    table = fund_stats.stats_table(prices)
+
+    assert list(table.index) == list(fund_stats.METRICS)
+    for name in prices:
+        expected = reference_stats(prices[name])
+        np.testing.assert_allclose(table[name], expected[table.index], rtol=1e-9, err_msg=name)
+
+
+def test_returns_span_gaps():
+    prices = synthetic.random_prices(3, 4, seed=7)
+    prices.iloc[:5, 0] = np.nan
+    prices.iloc[[12, 13, 30], 1] = np.nan
+    table = fund_stats.stats_table(prices)
+    for name in prices:
+        expected = reference_stats(prices[name].dropna())
+        np.testing.assert_allclose(table[name], expected[table.index], rtol=1e-9, err_msg=name)
+
+    packed, n = fund_stats.packed_returns(prices.to_numpy())
+    assert list(n) == [42, 44, 47]
+    for j, name in enumerate(prices):
+        np.testing.assert_allclose(packed[:n[j], j], prices[name].dropna().pct_change().iloc[1:],
+                                   rtol=1e-12)
+        assert np.isnan(packed[n[j]:, j]).all()
+
+
+def test_stacked_paths():
+    prices = synthetic.random_prices(4, 5, seed=1).to_numpy()
+    paths = np.stack([prices, prices[:, ::-1], prices * 2])
+    stats = fund_stats.fund_stats(paths)
+    single = fund_stats.fund_stats(prices)
+    for metric in fund_stats.METRICS:
+        assert stats[metric].shape == (3, 4)
+        np.testing.assert_allclose(stats[metric][0], single[metric], err_msg=metric)
+        np.testing.assert_allclose(stats[metric][1], single[metric][::-1], err_msg=metric)
+        np.testing.assert_allclose(stats[metric][2], single[metric], err_msg=metric)
+
+
+def test_rising_fund_has_no_calmar():
+    prices = pd.DataFrame({'up': 1.01 ** np.arange(24)})
+    table = fund_stats.stats_table(prices)
+    assert table.loc['max_drawdown', 'up'] == 0
+    assert np.isnan(table.loc['calmar', 'up'])
+    assert table.loc['cagr', 'up'] == pytest.approx(1.01 ** 12 - 1)
+
+
+def test_quantile_matches_nanpercentile():
+    returns = synthetic.random_prices(5, 4, seed=2).pct_change().to_numpy().copy()
+    returns[:20, 1] = np.nan
+    returns[:, 4] = np.nan
+    n = (~np.isnan(returns)).sum(axis=0)
+    for q in (0.05, 0.5, 0.93):
+        expected = [np.nanpercentile(returns[:, j], 100 * q) if n[j] else np.nan for j in range(5)]
+        np.testing.assert_array_equal(fund_stats.nan_quantile(returns, q, n), expected)
+
+
+def test_bootstrap_is_deterministic():
+    prices = synthetic.random_prices(3, 6, seed=4).to_numpy()
+    serial = fund_stats.bootstrap_stats(prices, 40, seed=4, chunk_size=15)
+    pooled = fund_stats.bootstrap_stats(prices, 40, seed=4, chunk_size=15, workers=2)
+    other = fund_stats.bootstrap_stats(prices, 40, seed=5, chunk_size=15)
+    for metric in fund_stats.METRICS:
+        assert serial[metric].shape == (40, 3)
+        np.testing.assert_array_equal(serial[metric], pooled[metric], err_msg=metric)
+    assert not np.array_equal(serial['sharpe'], other['sharpe'])
+
+
+def test_short_histories_have_wider_intervals():
+    prices = synthetic.random_prices(2, 30, seed=6)
+    prices.iloc[:300, 1] = np.nan
+    table = fund_stats.bootstrap_table(prices, 400, seed=1)
+
+    assert list(table.columns) == [(f, c) for f in prices.columns for c in ('value', 'low', 'high')]
+    pd.testing.assert_frame_equal(table.xs('value', axis=1, level=1), fund_stats.stats_table(prices))
+    width = table.xs('high', axis=1, level=1) - table.xs('low', axis=1, level=1)
+    for metric in ('sharpe', 'cagr', 'vol', 'tau'):
+        assert width.at[metric, 'fund_00001'] > width.at[metric, 'fund_00000'], metric
+        for fund in prices:
+            assert table.at[metric, (fund, 'low')] < table.at[metric, (fund, 'value')] \
+                < table.at[metric, (fund, 'high')], (metric, fund)
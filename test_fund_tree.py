@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+import fund_tree
+
+TREE = ('root', 1, [
+    ('macro', 0.5, [('a', 0.6), ('b', 0.4)]),
+    ('c', 0.2),
+    ('trend', 0.3, [('d', 0.5), ('alt', 0.5, [('e', 0.3), ('f', 0.7)])]),
+])
+
+
+def test_flatten():
+    weights = fund_tree.flatten(TREE)
+    assert weights == {'f': 0.105, 'e': 0.045, 'd': 0.15, 'c': 0.2, 'b': 0.2, 'a': 0.3}
+    # Same order as the old stack walk.
+    assert list(weights) == ['f', 'e', 'd', 'c', 'b', 'a']
+
+
+def test_flatten_rejects_bad_sums():
+    with pytest.raises(ValueError, match='macro'):
+        fund_tree.flatten(('root', 1, [('macro', 1, [('a', 0.6), ('b', 0.5)])]))
+    with pytest.raises(ValueError):
+        fund_tree.flatten(('root', 0.9, [('a', 0.5), ('b', 0.5)]))
+    # Float noise is not an error.
+    assert len(fund_tree.flatten(('root', 1, [(str(i), 0.1) for i in range(10)]))) == 10
+
+
+def test_compiled_layout():
+    tree = fund_tree.compile_tree(TREE)
+    assert tree.names == ['root', 'macro', 'a', 'b', 'c', 'trend', 'd', 'alt', 'e', 'f']
+    assert list(tree.parent) == [-1, 0, 1, 1, 0, 0, 5, 5, 7, 7]
+    assert list(tree.size) == [10, 3, 1, 1, 1, 5, 1, 3, 1, 1]
+    assert tree.leaf_names == ['a', 'b', 'c', 'd', 'e', 'f']
+    assert tree.membership[tree.index['trend']].tolist() == [False, False, False, True, True, True]
+    assert list(tree.groups_at(1)) == [1, 4, 5]
+    assert list(tree.groups_at(2)) == [2, 3, 4, 6, 7]
+
+
+def test_set_weight_matches_recompiling():
+    tree = fund_tree.compile_tree(TREE)
+    tree.set_weight('macro', 0.3)
+    tree.set_weight('c', 0.4)
+    tree.set_weight('alt', 0)
+    tree.set_weight('alt', 0.8)
+    tree.set_weight('d', 0.2)
+
+    expected = fund_tree.compile_tree(('root', 1, [
+        ('macro', 0.3, [('a', 0.6), ('b', 0.4)]),
+        ('c', 0.4),
+        ('trend', 0.3, [('d', 0.2), ('alt', 0.8, [('e', 0.3), ('f', 0.7)])]),
+    ]))
+    np.testing.assert_allclose(tree.effective, expected.effective, rtol=1e-15)
+    tree.check()
+
+
+def test_group_returns():
+    tree = fund_tree.compile_tree(TREE)
+    returns = np.random.default_rng(0).normal(0, 0.02, (24, 6))
+    groups = tree.group_returns(returns, ['macro', 'c', 'trend', 'root'])
+
+    np.testing.assert_allclose(groups[:, 0], returns[:, 0] * 0.6 + returns[:, 1] * 0.4)
+    np.testing.assert_allclose(groups[:, 1], returns[:, 2])
+    np.testing.assert_allclose(groups[:, 2], returns[:, 3:] @ [0.5, 0.15, 0.35])
+    np.testing.assert_allclose(groups[:, 3], returns @ tree.leaf_weights())
@@ -0,0 +1,176 @@
+import numpy as np
+import pandas as pd
+import pytest
+import incremental
+import parsers
+import return_store
+import rolling_stats
+import series_cache
+import sim_engine
+import synthetic
+import taxes
+
+FORMATS = ['hfrx', 'iasg', 'amundi', 'tabular_csvs', 'fred', 'yahoo']
+
+
+def test_running_stats_in_blocks_match_rolling_stats():
+    prices = synthetic.random_prices(5, 8, seed=2)
+    values = prices.to_numpy()
+    running = incremental.RunningStats(5)
+    for block in np.array_split(values, [1, 40, 41, 90]):
+        running.update(block)
+
+    n = len(values) - 1
+    expected = rolling_stats.rolling_stats(prices, windows=(n,))[n].iloc[-1]
+    stats = running.stats()
+    for metric in rolling_stats.METRICS:
+        np.testing.assert_allclose(stats[metric], expected[metric], rtol=1e-9, err_msg=metric)
+
+
+def test_running_correlation():
+    returns = np.random.default_rng(4).normal(0.01, 0.03, (120, 4))
+    corr = incremental.RunningCorrelation(4)
+    corr.update(returns[:100])
+    corr.update(returns[100:])
+    np.testing.assert_allclose(corr.corr(), np.corrcoef(returns.T), rtol=1e-12)
+
+
+def test_checkpoint_advance_matches_full_run():
+    prices = synthetic.random_prices(4, 12, seed=5)
+    weights = dict(zip(prices.columns, [0.4, 0.3, 0.2, 0.1]))
+    full = incremental.Checkpoint(weights).advance(prices)
+    stepped = incremental.Checkpoint(weights).advance(prices.iloc[:50])
+    for start in range(50, len(prices), 7):
+        stepped.advance(prices.iloc[start:start + 7])
+
+    np.testing.assert_allclose(stepped.sim_values, full.sim_values, rtol=1e-12)
+    pd.testing.assert_frame_equal(stepped.stats_df(), full.stats_df(), rtol=1e-9)
+    pd.testing.assert_frame_equal(stepped.corr_df(), full.corr_df(), rtol=1e-9)
+
+    expected, _ = sim_engine.simulate_frame(prices, weights, sim_engine.yearly,
+                                            is_taxable=taxes.is_taxable, tax_rate=taxes.TAX_RATE)
+    np.testing.assert_allclose(full.simulation(), expected)
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    saved = (parsers.DATA_DIR, parsers.spreadsheets, series_cache.CACHE_DIR)
+    series_cache.CACHE_DIR = str(tmp_path / '.cache')
+    yield str(tmp_path) + '/'
+    parsers.use_data(*saved[:2])
+    series_cache.CACHE_DIR = saved[2]
+
+
+def test_refresh_parses_appended_rows(data_dir):
+    sheets = synthetic.write_dataset(data_dir, 6, 4, formats=FORMATS)
+    parsers.use_data(data_dir, sheets)
+    before = parsers.load(parsers.all_keys())
+
+    # Three more months for every fund: same text up front, new rows after.
+    prices = synthetic.random_prices(6, 5).iloc[:51]
+    for i, parse_class in enumerate(FORMATS):
+        fn = sheets[parse_class][0]
+        synthetic.WRITERS[parse_class](data_dir + fn, prices.index, prices.iloc[:, i].to_numpy())
+
+    for key in parsers.all_keys():
+        series, appended = incremental.refresh(key)
+        assert appended == 3, key
+        pd.testing.assert_series_equal(series.iloc[:-3], before[key], check_freq=False,
+                                       check_index_type=False)
+
+        series_cache.invalidate([key])
+        _, expected = parsers.parse_file(*parsers.file_index()[key])
+        np.testing.assert_array_equal(series.to_numpy(), expected.to_numpy())
+        assert series.index.equals(expected.index)
+
+
+def test_update_rebuilds_on_edited_history(data_dir):
+    sheets = synthetic.write_dataset(data_dir, 3, 4, formats=['hfrx', 'fred', 'iasg'])
+    parsers.use_data(data_dir, sheets)
+    weights = dict(zip(parsers.all_keys(), [0.5, 0.25, 0.25]))
+    path = data_dir + 'checkpoint.pkl'
+
+    checkpoint, added = incremental.update(weights, path)
+    assert added is None and len(checkpoint.dates) == 48
+
+    prices = synthetic.random_prices(3, 5).iloc[:50]
+    for i, parse_class in enumerate(['hfrx', 'fred', 'iasg']):
+        synthetic.WRITERS[parse_class](data_dir + sheets[parse_class][0], prices.index,
+                                       prices.iloc[:, i].to_numpy())
+    checkpoint, added = incremental.update(weights, path)
+    assert added == 2 and checkpoint.end == prices.index[-1]
+    rebuilt = incremental.build(weights)
+    pd.testing.assert_frame_equal(checkpoint.stats_df(), rebuilt.stats_df(), rtol=1e-9)
+
+    prices.iloc[5, 0] *= 1.1
+    synthetic.write_hfrx(data_dir + sheets['hfrx'][0], prices.index, prices.iloc[:, 0].to_numpy())
+    _, added = incremental.update(weights, path)
+    assert added is None
+
+
+def test_update_rebuilds_on_other_settings(data_dir, monkeypatch):
+    sheets = synthetic.write_dataset(data_dir, 3, 4, formats=['hfrx', 'fred', 'iasg'])
+    parsers.use_data(data_dir, sheets)
+    weights = dict(zip(parsers.all_keys(), [0.5, 0.25, 0.25]))
+    path = data_dir + 'checkpoint.pkl'
+
+    assert incremental.update(weights, path)[1] is None
+    assert incremental.update(weights, path, 'yearly')[1] == 0
+
+    monkeypatch.setattr(taxes, 'TAX_RATE', taxes.TAX_RATE / 2)
+    checkpoint, added = incremental.update(weights, path)
+    assert added is None and checkpoint.tax_rate == taxes.TAX_RATE
+    monkeypatch.setattr(taxes, 'is_taxable', lambda name: True)
+    checkpoint, added = incremental.update(weights, path)
+    assert added is None and all(checkpoint.taxable)
+    checkpoint, added = incremental.update(weights, path, 'quarterly')
+    assert added is None
+    np.testing.assert_allclose(checkpoint.sim_values, incremental.build(weights, 'quarterly').sim_values)
+    assert incremental.update(weights, path, sim_engine.quarterly)[1] == 0
+
+
+def test_update_catches_edits_already_cached(data_dir):
+    sheets = synthetic.write_dataset(data_dir, 3, 4, formats=['hfrx', 'fred', 'iasg'])
+    parsers.use_data(data_dir, sheets)
+    weights = dict(zip(parsers.all_keys(), [0.5, 0.25, 0.25]))
+    path = data_dir + 'checkpoint.pkl'
+    incremental.update(weights, path)
+
+    prices = synthetic.random_prices(3, 5).iloc[:50]
+    prices.iloc[5, 1] *= 0.7
+    for i, parse_class in enumerate(['hfrx', 'fred', 'iasg']):
+        synthetic.WRITERS[parse_class](data_dir + sheets[parse_class][0], prices.index,
+                                       prices.iloc[:, i].to_numpy())
+    # Re-cached first, so the cache reports nothing changed.
+    for key in weights:
+        incremental.refresh(key)
+    assert all(incremental.refresh(key)[1] == 0 for key in weights)
+
+    checkpoint, added = incremental.update(weights, path)
+    assert added is None
+    series = parsers.load(list(weights))
+    expected = incremental.Checkpoint(weights).advance(pd.DataFrame(series).dropna())
+    pd.testing.assert_frame_equal(checkpoint.stats_df(), expected.stats_df(), rtol=1e-9)
+
+
+def test_checkpoint_uses_proxies(data_dir, monkeypatch):
+    sheets = synthetic.write_dataset(data_dir, 3, 6, formats=['hfrx', 'fred', 'yahoo'])
+    parsers.use_data(data_dir, sheets)
+    fund, other, index = parsers.all_keys()
+    # The fund only starts in its third year; the index stands in before.
+    prices = synthetic.random_prices(3, 6).iloc[24:, 0]
+    synthetic.write_hfrx(data_dir + sheets['hfrx'][0], prices.index, prices.to_numpy())
+    monkeypatch.setattr(incremental.data_loader, 'proxies', {fund: [index]}, raising=False)
+    weights = {fund: 0.5, other: 0.5}
+    path = data_dir + 'checkpoint.pkl'
+
+    checkpoint, _ = incremental.update(weights, path)
+    expected = return_store.load(list(weights)).frame(list(weights))
+    assert len(checkpoint.dates) == len(expected) == 72
+    np.testing.assert_allclose(checkpoint.simulation(), incremental.Checkpoint(weights)
+                               .advance(expected).simulation(), rtol=1e-12)
+    assert incremental.update(weights, path)[1] == 0
+
+    monkeypatch.setattr(incremental.data_loader, 'proxies', {}, raising=False)
+    checkpoint, added = incremental.update(weights, path)
+    assert added is None and len(checkpoint.dates) == 48
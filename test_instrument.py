@@ -0,0 +1,58 @@
+import json
+import time
+import instrument
+
+
+def test_disabled_records_nothing():
+    assert not instrument.enabled()
+    with instrument.span('x', a=1):
+        instrument.count('n')
+
+    @instrument.timed('f')
+    def f(x):
+        return x + 1
+
+    assert f(1) == 2
+    start = time.perf_counter()
+    for _ in range(100_000):
+        with instrument.span('x'):
+            pass
+    # A shared no-op context manager: well under a microsecond a span.
+    assert time.perf_counter() - start < 0.5
+
+
+def test_spans_and_counters():
+    @instrument.timed('inner')
+    def inner():
+        instrument.count('calls')
+        instrument.count('rows', 10)
+
+    recorder = instrument.enable()
+    try:
+        with instrument.span('outer', key='a'):
+            inner()
+            inner()
+    finally:
+        assert instrument.disable() is recorder
+
+    summary = recorder.summary()
+    assert summary['spans']['inner']['count'] == 2
+    assert summary['spans']['outer']['seconds'] >= summary['spans']['inner']['seconds']
+    assert summary['counters'] == {'calls': 2, 'rows': 20}
+
+    trace = json.loads(json.dumps(recorder.chrome_trace()))
+    spans = [e for e in trace['traceEvents'] if e['ph'] == 'X']
+    assert [e['name'] for e in spans] == ['inner', 'inner', 'outer']
+    assert spans[-1]['args'] == {'key': 'a'}
+    outer = spans[-1]
+    assert all(outer['ts'] <= e['ts'] and e['ts'] + e['dur'] <= outer['ts'] + outer['dur']
+               for e in spans[:2])
+    assert {e['name'] for e in trace['traceEvents'] if e['ph'] == 'C'} == {'calls', 'rows'}
+
+
+def test_profiled(tmp_path):
+    import pstats
+    path = str(tmp_path / 'run.prof')
+    with instrument.profiled(path):
+        sum(range(1000))
+    assert pstats.Stats(path).total_calls > 0
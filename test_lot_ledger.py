@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+from lot_ledger import FIFO, HIFO, LotLedger
+
+
+def reference_fifo_basis(lots, to_sell):
+    basis = 0
+    while True:
+        shares, price = lots.pop(0)
+        if to_sell > shares:
+            basis += price * shares
+            to_sell -= shares
+        else:
+            basis += price * to_sell
+            if shares - to_sell > 0:
+                lots.insert(0, (shares - to_sell, price))
+            return basis
+
+
+def test_fifo_matches_list_implementation():
+    rng = np.random.default_rng(11)
+    ledger = LotLedger(1, FIFO)
+    lots = []
+    for t in range(300):
+        shares, price = rng.uniform(1, 10), rng.uniform(50, 150)
+        ledger.buy(0, shares, price, t)
+        lots.append((shares, price))
+        if t % 3 == 2:
+            to_sell = rng.uniform(0.5, 0.9) * sum(s for s, _ in lots)
+            expected = reference_fifo_basis(lots, to_sell)
+            assert ledger.sell(0, to_sell, price, t) == pytest.approx(expected, rel=1e-12)
+
+    assert ledger.shares(0) == pytest.approx(sum(s for s, _ in lots), rel=1e-12)
+
+
+def test_hifo_and_specific_lots():
+    ledger = LotLedger(2, HIFO)
+    for price in (10, 30, 20):
+        ledger.buy(0, 1, price, 0)
+    assert ledger.sell(0, 1.5, 25, 1) == 30 + 0.5 * 20
+    ids, shares, prices, _ = ledger.open_lots(0)
+    assert list(prices) == [10, 20] and list(shares) == [1, 0.5]
+
+    first = ledger.buy(1, 2, 5, 1)
+    ledger.buy(1, 2, 7, 1)
+    assert ledger.sell(1, 1, 6, 2, lots=[first]) == 5
+    assert ledger.cost_basis(1) == 5 + 14
+
+
+def test_realized_gains_queries():
+    ledger = LotLedger(1)
+    ledger.buy(0, 10, 1, 0)
+    ledger.sell(0, 2, 2, 3)
+    ledger.sell(0, 2, 3, 5)
+    ledger.sell(0, 2, 0.5, 14)
+
+    assert ledger.realized_gains() == 2 + 4 - 1
+    assert ledger.realized_gains(since=3, until=5) == 4
+    years = np.repeat([2000, 2001], 12)
+    assert ledger.realized_by(years) == {2000: 6, 2001: -1}
@@ -0,0 +1,34 @@
+import numpy as np
+import monte_carlo
+import sim_engine
+
+
+def test_portfolio_values_match_engine():
+    rng = np.random.default_rng(5)
+    returns = rng.normal(0.006, 0.04, (3, 100, 4))
+    weights = np.array([0.4, 0.3, 0.2, 0.1])
+    values = monte_carlo.portfolio_values(returns, weights, 12)
+
+    prices = np.vstack((np.ones(4), np.cumprod(1 + returns[1], axis=0)))
+    rebalance = np.zeros(101, dtype=bool)
+    rebalance[12::12] = True
+    expected = sim_engine.simulate(prices, weights, rebalance, 1).values[1:]
+    np.testing.assert_allclose(values[1], expected, rtol=1e-12)
+
+
+def test_reproducible_across_workers():
+    rng = np.random.default_rng(1)
+    returns = rng.normal(0.006, 0.04, (200, 3))
+    weights = np.full(3, 1 / 3)
+    serial = monte_carlo.simulate_paths(returns, weights, 600, 10, seed=9, chunk_size=200)
+    again = monte_carlo.simulate_paths(returns, weights, 600, 10, seed=9, chunk_size=200)
+    pooled = monte_carlo.simulate_paths(returns, weights, 600, 10, seed=9, chunk_size=200,
+                                        workers=2)
+    for a, b in zip(serial, again):
+        np.testing.assert_array_equal(a, b)
+    # Same draws, but `growth @ weights` goes through BLAS, whose kernels pick
+    # a code path by buffer alignment, and arrays unpickled in a worker are
+    # aligned differently, so the last bit can differ.
+    for a, b in zip(serial, pooled):
+        np.testing.assert_allclose(a, b, rtol=1e-12, atol=1e-15)
+    assert (serial.max_drawdown <= 0).all()
@@ -0,0 +1,238 @@
+import io
+import math
+import os
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from itertools import accumulate, islice
+import numpy as np
+import pandas as pd
+import pytest
+import instrument
+import parsers
+import series_cache
+import synthetic
+
+
+def reference_nav(returns, scale):
+    def adjust(acc, val):
+        val = 0 if math.isnan(val) else val
+        return acc * (1 + (val / scale))
+
+    return list(islice(accumulate(returns, func=adjust, initial=1000), 1, None))
+
+
+def test_nav_from_returns_matches_accumulate():
+    rng = np.random.default_rng(7)
+    returns = rng.normal(0.5, 3, 600)
+    returns[[3, 50, 599]] = np.nan
+
+    assert (parsers.nav_from_returns(returns) == reference_nav(returns, 100)).all()
+    assert (parsers.nav_from_returns(returns / 100, scale=1)
+            == reference_nav(returns / 100, 1)).all()
+
+
+def test_month_start_dates_matches_to_datetime():
+    years = np.repeat(np.arange(1950, 2030), 12)
+    months = np.tile(np.arange(1, 13), 80)
+    expected = pd.DatetimeIndex([pd.to_datetime(f'{y:04d}-{m:02d}-01')
+                                 for y, m in zip(years, months)])
+
+    assert parsers.month_start_dates(years, months).equals(expected)
+
+
+def test_split_month_year():
+    labels = pd.Index(['3/2020', '12/1999', '01/2001'], name='date')
+    dates = parsers.split_month_year(labels, '/')
+    assert list(dates) == [pd.Timestamp('2020-03-01'), pd.Timestamp('1999-12-01'),
+                           pd.Timestamp('2001-01-01')]
+    assert dates.name == 'date'
+
+    eureka = parsers.split_month_year(pd.Index(['Mar 2020', 'december 2019']), ' ')
+    assert list(eureka) == [pd.Timestamp('2020-03-01'), pd.Timestamp('2019-12-01')]
+
+
+CSV_FORMATS = [f for f in synthetic.available_formats() if f not in synthetic.EXCEL_FORMATS]
+
+
+@pytest.fixture(params=['c', 'pyarrow'])
+def engine(request, monkeypatch):
+    if request.param == 'pyarrow':
+        pytest.importorskip('pyarrow.csv')
+    monkeypatch.setattr(parsers, 'CSV_ENGINE', request.param)
+    parsers._arrow_csv.cache_clear()
+    yield request.param
+    parsers._arrow_csv.cache_clear()
+
+
+# What vendor files have that the synthetic writers don't: the token of a
+# missing price, and whether dates are day first.
+MESSY = {'fred': ('.', False), 'yahoo': ('null', False), 'amundi': ('null', True)}
+
+
+def mess_up(path, parse_class):
+    """Rewrite a synthetic file with its third price missing and, for some formats, dd/mm/YYYY dates."""
+    token, day_first = MESSY[parse_class]
+    form = parsers.FORMATS[parse_class]
+    with open(path) as f:
+        lines = f.read().splitlines()
+    for i in range(form.skiprows, len(lines)):
+        fields = lines[i].split(',')
+        for p, _, dtype in form.columns:
+            if dtype == 'date' and day_first:
+                fields[p] = pd.Timestamp(fields[p]).strftime('%d/%m/%Y')
+            elif dtype == 'float64' and i == form.skiprows + 2:
+                fields[p] = token
+        lines[i] = ','.join(fields)
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+@pytest.mark.parametrize('parse_class,messy', [(f, False) for f in CSV_FORMATS] +
+                         [(f, True) for f in MESSY])
+def test_formats_read_what_synthetic_writes(tmp_path, monkeypatch, engine, parse_class, messy):
+    prices = synthetic.random_prices(1, 3, seed=5).iloc[:, 0]
+    path = str(tmp_path / f'{parse_class}.csv')
+    synthetic.WRITERS[parse_class](path, prices.index, prices.to_numpy())
+    expected = prices.copy()
+    if messy:
+        mess_up(path, parse_class)
+        expected.iloc[2] = np.nan
+
+    if parse_class in parsers.APPENDABLE:
+        ticker, series = parsers.PARSERS[parse_class](f'{parse_class}.csv', path)
+    else:
+        monkeypatch.setattr(parsers, 'DATA_DIR', str(tmp_path) + '/')
+        ticker, series = parsers.PARSERS[parse_class](f'{parse_class}.csv')
+    assert series.name == ticker and series.index.name == 'date'
+    assert series.index.equals(pd.DatetimeIndex(prices.index, name='date'))
+    # Returns are written to four decimals.
+    np.testing.assert_allclose(series.to_numpy(), expected.to_numpy(), rtol=1e-4)
+    assert parsers.sniff(path) == parse_class
+
+
+def test_appended_rows_with_day_first_dates(engine):
+    source = io.BytesIO(b'EUR,29/02/2020,12.5,\nEUR,31/03/2020,null,\n')
+    _, series = parsers.parse_amundi('fund.csv', source, skiprows=0)
+    assert list(series.index) == [pd.Timestamp('2020-02-29'), pd.Timestamp('2020-03-31')]
+    np.testing.assert_array_equal(series.to_numpy(), [125, np.nan])
+
+    # Ambiguous either way round, and no warning about it.
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        _, series = parsers.parse_amundi('fund.csv', io.BytesIO(b'EUR,03/04/2020,12.5,\n'), skiprows=0)
+    assert list(series.index) == [pd.Timestamp('2020-04-03')]
+
+
+def test_unlisted_files_are_found(tmp_path):
+    data_dir = str(tmp_path) + '/'
+    sheets = synthetic.write_dataset(data_dir, 4, 2, formats=['fred', 'yahoo'])
+    prices = synthetic.random_prices(1, 2, seed=1).iloc[:, 0]
+    synthetic.write_hfrx(data_dir + 'new_fund.csv', prices.index, prices.to_numpy())
+    with open(data_dir + 'notes.csv', 'w') as f:
+        f.write('nothing,to,see\n')
+
+    index = parsers.build_index(sheets, data_dir)
+    assert index['new_fund'] == ('hfrx', 'new_fund.csv')
+    assert 'notes' not in index and len(index) == 5
+
+
+def test_registered_vendor_loads(tmp_path, monkeypatch):
+    monkeypatch.setattr(parsers, 'FORMATS', dict(parsers.FORMATS))
+    monkeypatch.setattr(parsers, 'PARSERS', dict(parsers.PARSERS))
+
+    @parsers.register('vendor', columns=((0, 'date', 'date'), (2, 'value', 'float64')),
+                      header=r'Vendor NAV\b', extensions=('.txt',))
+    def parse_vendor(fn, source=None, skiprows=None):
+        ticker, c = parsers.read_format('vendor', fn, source, skiprows)
+        return (ticker, parsers.fund_series(ticker, c['value'], c['date']))
+
+    data_dir = str(tmp_path) + '/'
+    with open(data_dir + 'acme.txt', 'w') as f:
+        f.write('Vendor NAV export\n2020-01-01,x,100.5\n2020-02-01,x,101.25\n')
+    monkeypatch.setattr(series_cache, 'CACHE_DIR', str(tmp_path / '.cache'))
+    saved = (parsers.DATA_DIR, parsers.spreadsheets)
+    parsers.use_data(data_dir, {})
+    try:
+        series = parsers.load(['acme'])['acme']
+    finally:
+        parsers.use_data(*saved)
+    assert list(series) == [100.5, 101.25]
+
+
+def test_cache_entries_are_keyed_by_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(series_cache, 'CACHE_DIR', str(tmp_path / '.cache'))
+    data_dir = str(tmp_path) + '/'
+    (tmp_path / 'sub').mkdir()
+    files = ['x.csv', 'x.txt', 'sub/x.csv']
+    for i, fn in enumerate(files):
+        (tmp_path / fn).write_text(fn)
+        series = pd.Series([float(i)], index=pd.DatetimeIndex(['2020-01-01'], name='date'), name=fn)
+        series_cache.store_entry(data_dir + fn, fn, series, data_dir=data_dir)
+
+    for i, fn in enumerate(files):
+        ticker, series = series_cache.load_entry(data_dir + fn, data_dir=data_dir)
+        assert ticker == fn and list(series) == [i]
+    assert series_cache.invalidate(['sub/x']) == 3
+    assert series_cache.load_entry(data_dir + 'sub/x.csv', data_dir=data_dir) is None
+    assert sorted(key for key, _, _ in series_cache.status()) == ['x.csv', 'x.txt']
+
+
+def test_concurrent_stores_of_one_entry(tmp_path, monkeypatch):
+    monkeypatch.setattr(series_cache, 'CACHE_DIR', str(tmp_path / '.cache'))
+    data_dir = str(tmp_path) + '/'
+    (tmp_path / 'x.csv').write_text('x')
+    series = pd.Series(np.arange(500.0), index=pd.date_range('1980-01-01', periods=500, freq='MS',
+                                                             name='date'), name='x')
+
+    def store(_):
+        for _ in range(20):
+            assert series_cache.store_entry(data_dir + 'x.csv', 'x', series, data_dir=data_dir)
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        list(pool.map(store, range(4)))
+    _, loaded = series_cache.load_entry(data_dir + 'x.csv', data_dir=data_dir)
+    np.testing.assert_array_equal(loaded, series)
+    assert loaded.index.equals(series.index)
+    assert not [f for _, _, files in os.walk(tmp_path / '.cache') for f in files if f.endswith('.tmp')]
+
+
+def test_listed_files_in_subdirectories_load(tmp_path, monkeypatch):
+    data_dir = str(tmp_path) + '/'
+    (tmp_path / 'sub').mkdir()
+    prices = synthetic.random_prices(2, 2, seed=3)
+    synthetic.write_fred(data_dir + 'x.csv', prices.index, prices.iloc[:, 0].to_numpy())
+    synthetic.write_fred(data_dir + 'sub/x.csv', prices.index, prices.iloc[:, 1].to_numpy())
+    monkeypatch.setattr(series_cache, 'CACHE_DIR', str(tmp_path / '.cache'))
+    saved = (parsers.DATA_DIR, parsers.spreadsheets)
+    parsers.use_data(data_dir, {'fred': ['x.csv', 'sub/x.csv']})
+    try:
+        data = parsers.load(['sub/x', 'x'])
+    finally:
+        parsers.use_data(*saved)
+    assert list(data) == ['x', 'sub/x']
+    np.testing.assert_allclose(data['sub/x'], prices.iloc[:, 1], rtol=1e-4)
+
+
+def test_ingest_spans_count_each_file_once(tmp_path, monkeypatch):
+    data_dir = str(tmp_path) + '/'
+    sheets = synthetic.write_dataset(data_dir, 3, 2, formats=['fred', 'yahoo'])
+    monkeypatch.setattr(series_cache, 'CACHE_DIR', str(tmp_path / '.cache'))
+    saved = (parsers.DATA_DIR, parsers.spreadsheets)
+    parsers.use_data(data_dir, sheets)
+    try:
+        runs = []
+        for _ in range(2):
+            recorder = instrument.enable()
+            try:
+                parsers.load(parsers.all_keys(), workers=1)
+            finally:
+                instrument.disable()
+            runs.append(recorder.summary())
+    finally:
+        parsers.use_data(*saved)
+
+    cold, warm = runs
+    assert cold['spans']['ingest']['count'] == 3 and cold['spans']['ingest.lookup']['count'] == 3
+    assert cold['counters'] == {'ingest.parsed': 3}
+    assert 'ingest' not in warm['spans'] and warm['spans']['ingest.lookup']['count'] == 3
+    assert warm['counters'] == {'ingest.cached': 3, 'ingest.parsed': 0}
@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+import pytest
+import rebalance_policy
+import sim_engine
+
+
+def make_prices(n_months=150, n_funds=4, seed=5, start='2003-01-01'):
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(start, periods=n_months, freq='MS')
+    returns = rng.normal(0.006, 0.05, (n_months, n_funds))
+    return dates, 100 * np.cumprod(1 + returns, axis=0)
+
+
+WEIGHTS = np.array([0.4, 0.3, 0.2, 0.1])
+
+
+def band_mask(prices, weights, band, relative, check):
+    """Rebalance months of a band policy, found one month at a time."""
+    shares = weights / prices[0]
+    mask = np.zeros(len(prices), dtype=bool)
+    for t in range(1, len(prices)):
+        holdings = shares * prices[t]
+        drift = np.abs(holdings / holdings.sum() - weights)
+        if relative:
+            drift = drift / weights
+        if check[t] and drift.max() > band:
+            mask[t] = True
+            shares = holdings.sum() * weights / prices[t]
+    return mask
+
+
+def test_calendars_match_simulate():
+    dates, prices = make_prices()
+    policies = [rebalance_policy.policy(c) for c in ('monthly', 'quarterly', 'yearly', 'never')]
+    result = rebalance_policy.evaluate(prices, WEIGHTS, dates, policies)
+    for k, p in enumerate(policies):
+        expected = sim_engine.simulate(prices, WEIGHTS, sim_engine.rebalance_mask(dates, p.calendar), 1)
+        np.testing.assert_allclose(result.values[:, k], expected.values, rtol=1e-12)
+    assert list(result.rebalances) == [149, 49, 12, 0]
+    assert result.pretax is None
+
+
+@pytest.mark.parametrize('calendar, band, relative', [('monthly', 0.03, False), ('quarterly', 0.02, False),
+                                                      ('monthly', 0.25, True)])
+def test_bands_match_simulate(calendar, band, relative):
+    dates, prices = make_prices()
+    p = rebalance_policy.policy(calendar, band, relative)
+    result = rebalance_policy.evaluate(prices, WEIGHTS, dates, [p, rebalance_policy.policy('monthly', 10)])
+    mask = band_mask(prices, WEIGHTS, band, relative, sim_engine.rebalance_mask(dates, calendar))
+    assert 0 < mask.sum() < len(mask) - 1 and result.rebalances[0] == mask.sum()
+    expected = sim_engine.simulate(prices, WEIGHTS, mask, 1)
+    np.testing.assert_allclose(result.values[:, 0], expected.values, rtol=1e-12)
+    # A band nothing drifts past never trades.
+    never = sim_engine.simulate(prices, WEIGHTS, sim_engine.never(dates), 1)
+    np.testing.assert_allclose(result.values[:, 1], never.values, rtol=1e-12)
+
+
+def test_taxes_match_simulate_until_second_lots():
+    # Through the second rebalance every sale comes out of the first purchase,
+    # where average cost and FIFO agree; taxes from it are still owed.
+    dates, prices = make_prices(25)
+    taxable = np.array([True, False, True, True])
+    result = rebalance_policy.evaluate(prices, WEIGHTS, dates, [rebalance_policy.policy('yearly')],
+                                       taxable, 0.25)
+    expected = sim_engine.simulate(prices, WEIGHTS, sim_engine.yearly(dates), 1,
+                                   taxable=taxable, tax_rate=0.25, tax_dates=dates.is_year_start)
+    np.testing.assert_allclose(result.values[:, 0], expected.values, rtol=1e-12)
+    np.testing.assert_allclose(result.taxes[0], expected.taxes.sum(), rtol=1e-12)
+    untaxed = sim_engine.simulate(prices, WEIGHTS, sim_engine.yearly(dates), 1)
+    np.testing.assert_allclose(result.pretax[:, 0], untaxed.values, rtol=1e-12)
+
+
+def test_costs_and_table():
+    dates, prices = make_prices()
+    df = pd.DataFrame(prices, dates, columns=['a', 'b', 'c', 'd'])
+    weights = dict(zip(df.columns, WEIGHTS))
+    policies = [rebalance_policy.parse(s) for s in ('monthly', 'yearly', 'monthly:0.05', 'quarterly:0.2r')]
+    policies.append(rebalance_policy.parse('monthly', cost=0.01))
+    table = rebalance_policy.compare(df, weights, policies, lambda name: name != 'b', 0.25, 1)
+
+    assert list(table.columns) == list(rebalance_policy.COLUMNS)
+    assert list(table.index) == ['monthly', 'yearly', 'monthly 0.05', 'quarterly 0.2r', 'monthly @0.01']
+    assert table.at['monthly', 'rebalances'] == pytest.approx(12)
+    assert table.at['monthly', 'turnover'] > table.at['yearly', 'turnover'] > 0
+    assert table.at['monthly', 'costs'] == 0 and table.at['monthly @0.01', 'costs'] > 0
+    assert table.at['monthly @0.01', 'terminal_value'] < table.at['monthly', 'terminal_value']
+    assert (table['taxes'] > 0).all() and (table['tax_drag'] > 0).all()
+
+    with pytest.raises(ValueError):
+        rebalance_policy.parse('weekly')
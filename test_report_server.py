@@ -0,0 +1,120 @@
+import asyncio
+import time
+import pandas as pd
+import pytest
+import data_loader
+import parsers
+import report_server
+import series_cache
+import synthetic
+import yanshuf
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    data_dir = str(tmp_path / 'data') + '/'
+    sheets = synthetic.write_dataset(data_dir, 4, 6, formats=['fred', 'yahoo'])
+    saved = (parsers.DATA_DIR, parsers.spreadsheets)
+    parsers.use_data(data_dir, sheets)
+    keys = parsers.all_keys()
+    calls = []
+
+    def dragon_backtest(keys, strategy, data):
+        calls.append(tuple(keys))
+        # Long enough for the other requests to arrive while it runs.
+        time.sleep(0.05)
+        stats = {'months': len(data.frame(keys)), 'cagr': 0.05, 'calmar': 0.5, 'monthly_skew': -0.2,
+                 'monthly_sharpe': 0.3}
+        return pd.DataFrame(stats, index=[strategy.name]), None
+
+    monkeypatch.setattr(series_cache, 'CACHE_DIR', str(tmp_path / '.cache'))
+    monkeypatch.setattr(data_loader, 'shortnames', {k: k[-2:] for k in keys})
+    monkeypatch.setattr(data_loader, 'tailored', {'long_vol_group': keys[:2], 'alt_group': keys[2:]})
+    monkeypatch.setattr(yanshuf, 'dragon_backtest', dragon_backtest)
+    yield report_server.ReportServer(), keys, calls, data_dir, sheets
+    parsers.use_data(*saved)
+
+
+def test_concurrent_requests_share_work(server):
+    server, keys, calls, _, _ = server
+    groups = {'long_vol_group': keys[:2]}
+
+    async def run():
+        pages = await asyncio.gather(*[server.report(groups) for _ in range(4)])
+        again = await server.report(groups)
+        return pages, again
+
+    pages, again = asyncio.run(run())
+    assert calls == [tuple(keys[:2])]
+    assert len(set(pages)) == 1 and again == pages[0]
+
+
+def test_changed_file_invalidates_dependents(server):
+    server, keys, calls, data_dir, sheets = server
+    changed = sheets['fred'][0].split('.')[0]
+    other = [k for k in keys if k != changed]
+    first = {'long_vol_group': [changed, other[0]]}
+    second = {'alt_group': other[1:]}
+
+    async def run():
+        pages = [await server.report(first), await server.report(second),
+                 await server.fund(changed), await server.fund(other[1])]
+        # Seven years of other prices instead of six.
+        prices = synthetic.random_prices(4, 7, seed=1)
+        synthetic.write_fred(data_dir + sheets['fred'][0], prices.index, prices.iloc[:, 0].to_numpy())
+        assert await server.check() == {changed}
+        assert ('fund', changed) not in server.cache and ('fund', other[1]) in server.cache
+        return pages, [await server.report(first), await server.report(second),
+                       await server.fund(changed), await server.fund(other[1])]
+
+    before, after = asyncio.run(run())
+    assert calls == [(changed, other[0]), tuple(other[1:]), (changed, other[0])]
+    assert after[0] != before[0] and after[1] == before[1]
+    assert '72 months' in before[2] and '84 months' in after[2]
+    assert after[3] == before[3]
+
+
+def test_http(server):
+    server, keys, calls, _, _ = server
+
+    async def get(port, target):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(f'GET {target} HTTP/1.1\r\nHost: localhost\r\n\r\n'.encode())
+        response = (await reader.read()).decode()
+        writer.close()
+        status = int(response.split()[1])
+        return status, response.partition('\r\n\r\n')[2]
+
+    async def run():
+        http, watcher = await server.start(port=0, interval=60)
+        port = http.sockets[0].getsockname()[1]
+        try:
+            return [await get(port, t) for t in ('/', f'/fund/{keys[1]}', '/fund/nope', '/nope',
+                                                 '/?run=weekly')]
+        finally:
+            watcher.cancel()
+            http.close()
+            await http.wait_closed()
+
+    (report, body), (fund, page), (missing, _), (unknown, _), (bad, _) = asyncio.run(run())
+    assert (report, fund, missing, unknown, bad) == (200, 200, 404, 404, 400)
+    assert keys[1] in page and 'cagr' in page
+    # The real renderers' tables.
+    assert 'monthly_sharpe' in body and data_loader.shortnames[keys[1]] in body
+    assert len(calls) == 1
+
+
+def test_new_file_is_served_after_check(server):
+    server, keys, _, data_dir, _ = server
+    prices = synthetic.random_prices(1, 3, seed=9)
+    synthetic.write_fred(data_dir + 'added.csv', prices.index, prices.iloc[:, 0].to_numpy())
+    added = parsers.file_ticker('added.csv')
+
+    async def run():
+        with pytest.raises(KeyError):
+            await server.fund(added)
+        assert await server.check() == {added}
+        return await server.fund(added)
+
+    assert '36 months' in asyncio.run(run())
+    assert added in parsers.all_keys()
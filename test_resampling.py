@@ -0,0 +1,36 @@
+import numpy as np
+import resampling
+
+
+def test_fixed_blocks_are_contiguous():
+    rng = np.random.default_rng(0)
+    idx = resampling.bootstrap_indices(rng, 4, 36, 50, block=6, stationary=False)
+    assert idx.shape == (4, 36)
+    steps = np.diff(idx, axis=1) % 50
+    within = np.ones(35, dtype=bool)
+    within[5::6] = False
+    assert (steps[:, within] == 1).all()
+
+
+def test_resamples_stay_in_own_history():
+    rng = np.random.default_rng(0)
+    n = np.array([5, 12, 7])
+    idx = resampling.bootstrap_indices(rng, 50, 12, n, block=3, stationary=False)
+    assert idx.shape == (50, 12, 3)
+    assert (idx < n).all() and (idx >= 0).all()
+    # Within a block each fund steps through consecutive months, wrapping around.
+    steps = (idx[:, 1:] - idx[:, :-1]) % n
+    within = np.arange(1, 12) % 3 != 0
+    assert (steps[:, within] == 1).all()
+
+
+def draw(n_source, n, seed):
+    return np.random.default_rng(seed).integers(0, n_source, n)
+
+
+def test_chunks_are_the_same_with_workers():
+    serial = resampling.run_chunks(draw, (100,), 25, 10, seed=3)
+    pooled = resampling.run_chunks(draw, (100,), 25, 10, seed=3, workers=2)
+    assert [len(c) for c in serial] == [10, 10, 5]
+    np.testing.assert_array_equal(np.concatenate(serial), np.concatenate(pooled))
+    assert resampling.chunk_size(resampling.CHUNK_BYTES // 3) == 3
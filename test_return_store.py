@@ -0,0 +1,137 @@
+import numpy as np
+import pandas as pd
+import pytest
+import parsers
+import return_store
+import series_cache
+import synthetic
+
+
+def make_data():
+    prices = synthetic.random_prices(4, 5, seed=2)
+    data = {name: prices[name] for name in prices}
+    data['fund_00001'] = data['fund_00001'].iloc[10:]
+    data['fund_00002'] = data['fund_00002'].iloc[:50]
+    # One with a missing month and an extra earlier one.
+    data['fund_00003'] = pd.concat([
+        pd.Series([100.0], pd.DatetimeIndex(['1989-12-01'])),
+        data['fund_00003'].drop(data['fund_00003'].index[20])]).rename('fund_00003')
+    return data
+
+
+def rebased(df):
+    return df / df.iloc[0]
+
+
+@pytest.mark.parametrize('names', [None, ['fund_00000', 'fund_00002'], ['fund_00003', 'fund_00001'],
+                                   ['fund_00003']])
+def test_frame_matches_dropna(names):
+    data = make_data()
+    store = return_store.build(data)
+    names = list(data) if names is None else names
+    expected = pd.DataFrame({n: data[n] for n in names}).dropna()
+
+    frame = store.frame(names)
+    assert frame.index.equals(expected.index)
+    np.testing.assert_allclose(frame.to_numpy(), rebased(expected).to_numpy(), rtol=1e-12)
+    np.testing.assert_allclose(store.common_returns(names).to_numpy(),
+                               expected.pct_change().iloc[1:].to_numpy(), rtol=1e-9)
+
+
+def test_own_ranges():
+    data = make_data()
+    store = return_store.build(data)
+    assert store.returns.flags.f_contiguous
+    for name, series in data.items():
+        np.testing.assert_allclose(store[name].to_numpy(), (series / series.iloc[0]).to_numpy(),
+                                   rtol=1e-12)
+    returns = store.returns_frame(['fund_00001'])['fund_00001']
+    pd.testing.assert_series_equal(returns.dropna(), data['fund_00001'].pct_change().iloc[1:],
+                                   check_freq=False, check_index_type=False, rtol=1e-12)
+
+
+def test_proxy_chain():
+    prices = synthetic.random_prices(3, 10, seed=4)
+    fund = prices['fund_00000'].iloc[60:]
+    data = {'fund': fund, 'index': prices['fund_00001'].iloc[30:], 'old_index': prices['fund_00002']}
+    store = return_store.build(data, {'fund': ['index', 'missing', 'old_index']})
+
+    spliced = store['fund']
+    assert spliced.index.equals(prices.index)
+    np.testing.assert_allclose(spliced.iloc[60:] / spliced.iloc[60], fund / fund.iloc[0], rtol=1e-12)
+    np.testing.assert_allclose(spliced.iloc[30:61] / spliced.iloc[30],
+                               prices['fund_00001'].iloc[30:61] / prices['fund_00001'].iloc[30],
+                               rtol=1e-12)
+    np.testing.assert_allclose(spliced.iloc[:31] / spliced.iloc[0],
+                               prices['fund_00002'].iloc[:31] / prices['fund_00002'].iloc[0],
+                               rtol=1e-12)
+    assert store.splices['fund'] == [('index', prices.index[31], prices.index[60]),
+                                     ('old_index', prices.index[1], prices.index[30])]
+
+    # The proxies themselves and the fund's own returns are left alone.
+    assert len(store['index']) == len(prices) - 30
+    own = store.returns_frame(['fund'], spliced=False)['fund']
+    assert own.first_valid_index() == prices.index[61]
+    assert len(store.frame(['fund', 'index'])) == len(prices) - 30
+
+
+def test_proxies_lend_their_own_returns():
+    prices = synthetic.random_prices(3, 10, seed=5)
+    data = {'fund': prices['fund_00000'].iloc[60:], 'index': prices['fund_00001'].iloc[30:],
+            'old_index': prices['fund_00002']}
+    chains = {'fund': ['index'], 'index': ['old_index']}
+    stores = [return_store.build(data, chains),
+              return_store.build(data, dict(reversed(list(chains.items()))))]
+    for store in stores:
+        # The index is extended back, but the fund only gets the index's own months.
+        assert store['index'].index[0] == prices.index[0]
+        assert store['fund'].index[0] == prices.index[30]
+        assert store.splices['fund'] == [('index', prices.index[31], prices.index[60])]
+    np.testing.assert_array_equal(stores[0].returns, stores[1].returns)
+
+
+@pytest.mark.parametrize('dtype', ['float64', 'float32'])
+def test_memory_mapped(tmp_path, dtype):
+    prices = synthetic.random_prices(3, 10, seed=4)
+    data = {'fund': prices['fund_00000'].iloc[60:], 'index': prices['fund_00001'].iloc[30:],
+            'other': prices['fund_00002']}
+    proxies = {'fund': ['index']}
+    expected = return_store.build(data, proxies)
+    path = str(tmp_path / 'store' / 'returns')
+    built = return_store.build(data, proxies, dtype=dtype, path=path)
+    store = return_store.open_store(path)
+
+    for s in (built, store):
+        assert isinstance(s.returns, np.memmap) and s.returns.dtype == dtype
+        assert s.returns.flags.f_contiguous
+        assert s.splices == expected.splices
+        np.testing.assert_allclose(s.frame().to_numpy(), expected.frame().to_numpy(),
+                                   rtol=1e-6 if dtype == 'float32' else 0)
+        assert s.frame().index.equals(expected.frame().index)
+    assert list(store.inception) == list(expected.inception)
+    # Adjacent funds are handed out without a copy.
+    assert np.shares_memory(store.common_returns(['index', 'other']).to_numpy(), store.returns)
+    assert np.shares_memory(store.returns_frame(['fund', 'index']).to_numpy(), store.returns)
+    assert not np.shares_memory(store.returns_frame(['fund', 'other']).to_numpy(), store.returns)
+
+
+def test_load_as_configured(tmp_path, monkeypatch):
+    saved = (parsers.DATA_DIR, parsers.spreadsheets, series_cache.CACHE_DIR)
+    series_cache.CACHE_DIR = str(tmp_path / '.cache')
+    sheets = synthetic.write_dataset(str(tmp_path) + '/', 3, 4, formats=['hfrx', 'fred', 'iasg'])
+    try:
+        parsers.use_data(str(tmp_path) + '/', sheets)
+        keys = parsers.all_keys()
+        expected = return_store.load(keys)
+        assert not isinstance(expected.returns, np.memmap) and expected.returns.dtype == 'float64'
+
+        monkeypatch.setattr(return_store, 'DTYPE', 'float32')
+        monkeypatch.setattr(return_store, 'STORE_DIR', str(tmp_path / 'stores'))
+        store = return_store.load(keys)
+        assert isinstance(store.returns, np.memmap) and store.returns.dtype == 'float32'
+        assert not list((tmp_path / 'stores').iterdir())
+        np.testing.assert_allclose(store.frame().to_numpy(), expected.frame().to_numpy(), rtol=1e-6)
+        assert np.shares_memory(store.common_returns(keys[:2]).to_numpy(), store.returns)
+    finally:
+        parsers.use_data(*saved[:2])
+        series_cache.CACHE_DIR = saved[2]
@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+import fund_stats
+import rolling_stats
+
+
+def make_prices(n_months=150, n_funds=4, seed=4):
+    rng = np.random.default_rng(seed)
+    returns = rng.normal(0.006, 0.04, (n_months, n_funds))
+    prices = pd.DataFrame(100 * np.cumprod(1 + returns, axis=0),
+                          index=pd.date_range('2001-01-01', periods=n_months, freq='MS'),
+                          columns=['a', 'b', 'c', 'd'])
+    prices.iloc[:20, 3] = np.nan
+    return prices
+
+
+def test_moments_match_pandas_rolling():
+    prices = make_prices()
+    returns = prices.pct_change().iloc[1:]
+    stats = rolling_stats.rolling_stats(prices, windows=(12, 36))
+
+    for window in (12, 36):
+        rolling = returns.rolling(window)
+        pd.testing.assert_frame_equal(stats[window]['raw_skew'], rolling.skew(), rtol=1e-9)
+        pd.testing.assert_frame_equal(stats[window]['raw_kurt'], rolling.kurt(), rtol=1e-9)
+        pd.testing.assert_frame_equal(stats[window]['vol'], rolling.std() * np.sqrt(12),
+                                      rtol=1e-9)
+
+
+def test_max_drawdown_matches_naive_windows():
+    prices = make_prices()
+    window = 24
+    got = rolling_stats.rolling_max_drawdown(prices.to_numpy(), window + 1)
+
+    for t in range(window, len(prices)):
+        chunk = prices.iloc[t - window:t + 1].to_numpy()
+        expected = (chunk / np.maximum.accumulate(chunk, axis=0) - 1).min(axis=0)
+        np.testing.assert_allclose(got[t, :3], expected[:3], rtol=1e-12)
+    assert np.isnan(got[:window]).all()
+
+
+def test_every_metric_matches_stats_of_the_window():
+    prices = make_prices()
+    window = 36
+    stats = rolling_stats.rolling_stats(prices, windows=(window,))[window]
+
+    for t in (window, 57, 100, len(prices) - 1):
+        # Fund d only has full windows from its 21st month.
+        funds = prices.columns if t - window >= 20 else prices.columns[:3]
+        expected = fund_stats.stats_table(prices.iloc[t - window:t + 1][funds])
+        got = stats.loc[prices.index[t]].unstack(level=0).loc[funds]
+        for metric in rolling_stats.METRICS:
+            np.testing.assert_allclose(got[metric], expected.loc[metric], rtol=1e-9,
+                                       err_msg=f'{metric} at {t}')
+
+
+def test_max_drawdown_windows_across_blocks():
+    rng = np.random.default_rng(8)
+    prices = np.cumprod(1 + rng.normal(0, 0.08, (97, 3)), axis=0)
+    prices[:30, 2] = np.nan
+    for window in (2, 7, 13, 97):
+        got = rolling_stats.rolling_max_drawdown(prices, window)
+        for t in range(window - 1, len(prices)):
+            chunk = prices[t - window + 1:t + 1]
+            peaks = np.fmax.accumulate(chunk, axis=0)
+            expected = np.nanmin(chunk / peaks - 1, axis=0) if t >= 30 \
+                else np.append((chunk / peaks - 1)[:, :2].min(axis=0), np.nan)
+            np.testing.assert_array_equal(got[t], expected)
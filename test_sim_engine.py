@@ -0,0 +1,108 @@
+import numpy as np
+import pandas as pd
+import fund_tree
+import sim_engine
+
+
+def make_prices(n_months=150, n_funds=4, seed=3):
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range('2003-07-01', periods=n_months, freq='MS')
+    returns = rng.normal(0.006, 0.04, (n_months, n_funds))
+    return dates, 100 * np.cumprod(1 + returns, axis=0)
+
+
+def reference_simulate(dates, prices, weights, taxable, tax_rate, capital):
+    """The original month-by-month loop from simulator.simulate."""
+    holdings = capital * weights / prices[0]
+    purchases = {i: [(holdings[i], prices[0, i])] for i in range(len(weights)) if taxable[i]}
+    cap_gains = 0
+    tax_owed = 0
+    values = []
+    for t, date in enumerate(dates):
+        value = sum(holdings[i] * prices[t, i] for i in range(len(weights)))
+        if date.is_year_start:
+            value -= tax_owed
+            tax_owed = 0
+            for i, pct in enumerate(weights):
+                shares = (value * pct) / prices[t, i]
+                delta = shares - holdings[i]
+                if taxable[i]:
+                    if delta < 0:
+                        to_sell, basis = -delta, 0
+                        while True:
+                            lot_shares, price = purchases[i].pop(0)
+                            if to_sell > lot_shares:
+                                basis += price * lot_shares
+                                to_sell -= lot_shares
+                            else:
+                                basis += price * to_sell
+                                if lot_shares - to_sell > 0:
+                                    purchases[i].insert(0, (lot_shares - to_sell, price))
+                                break
+                        cap_gains += -delta * prices[t, i] - basis
+                    elif delta > 0:
+                        purchases[i].append((delta, prices[t, i]))
+                holdings[i] = shares
+        if date.is_year_start and cap_gains > 0:
+            tax_owed += cap_gains * tax_rate
+            cap_gains = 0
+        values.append(value)
+    return np.array(values)
+
+
+def test_matches_reference_loop_with_taxes():
+    dates, prices = make_prices()
+    weights = np.array([0.4, 0.3, 0.2, 0.1])
+    taxable = np.array([True, False, True, True])
+
+    expected = reference_simulate(dates, prices, weights, taxable, 0.25, 1_000_000)
+    result = sim_engine.simulate(prices, weights, sim_engine.rebalance_mask(dates, 'yearly'),
+                                 1_000_000, taxable=taxable, tax_rate=0.25,
+                                 tax_dates=dates.is_year_start)
+
+    np.testing.assert_allclose(result.values, expected, rtol=1e-12)
+    assert result.taxes.sum() > 0
+
+
+def test_never_rebalancing_is_buy_and_hold():
+    dates, prices = make_prices()
+    weights = np.array([0.25, 0.25, 0.25, 0.25])
+    result = sim_engine.simulate(prices, weights, sim_engine.rebalance_mask(dates, 'never'), 1000)
+
+    np.testing.assert_allclose(result.values, (prices / prices[0]) @ (1000 * weights))
+    assert not result.trades.any()
+
+
+def test_custom_calendar():
+    dates, _ = make_prices()
+    mask = sim_engine.rebalance_mask(dates, lambda d: d.month == 7)
+    assert mask.sum() == len(set(dates.year[dates.month == 7]))
+    assert sim_engine.rebalance_mask(dates, 'quarterly').sum() == dates.is_quarter_start.sum()
+
+
+def test_tree_with_one_calendar_matches_flat_simulation():
+    dates, prices = make_prices()
+    tree = fund_tree.compile_tree(('root', 1, [('g', 0.6, [('0', 0.5), ('1', 0.5)]),
+                                               ('h', 0.4, [('2', 0.25), ('3', 0.75)])]))
+    values = sim_engine.simulate_tree(prices, dates, tree)
+    flat = sim_engine.simulate(prices, tree.leaf_weights(),
+                               sim_engine.rebalance_mask(dates, 'yearly'), 1)
+
+    np.testing.assert_allclose(values[:, 0], flat.values, rtol=1e-13)
+
+
+def test_tree_groups_on_their_own_calendars():
+    dates, prices = make_prices()
+    tree = fund_tree.compile_tree(('root', 1, [('g', 0.6, [('0', 0.5), ('1', 0.5)]),
+                                               ('h', 0.4, [('2', 0.25), ('3', 0.75)])]))
+    values = sim_engine.simulate_tree(prices, dates, tree, {'g': 'monthly', 'h': 'never'})
+
+    returns = prices[1:] / prices[:-1] - 1
+    g = np.cumprod(np.concatenate(([1], 1 + returns[:, :2] @ [0.5, 0.5])))
+    h = (prices[:, 2:] / prices[0, 2:]) @ [0.25, 0.75]
+    np.testing.assert_allclose(values[:, 1], g, rtol=1e-13)
+    np.testing.assert_allclose(values[:, 4], h, rtol=1e-13)
+
+    expected = sim_engine.simulate(np.column_stack((g, h)), [0.6, 0.4],
+                                   sim_engine.rebalance_mask(dates, 'yearly'), 1)
+    np.testing.assert_allclose(values[:, 0], expected.values, rtol=1e-13)
@@ -0,0 +1,30 @@
+import numpy as np
+from skill_metric import compute_eta, compute_eta_array, skill_metric, skill_metric_array
+
+
+def test_matches_scalar_skill_metric():
+    rng = np.random.default_rng(2)
+    mu = rng.normal(0.05, 0.05, 5000)
+    sigma = rng.uniform(0.02, 0.3, 5000)
+    skew = rng.uniform(-1.2, 1.2, 5000)
+
+    tau = skill_metric_array(mu, sigma, skew)
+    expected = np.array([skill_metric(m, s, k) for m, s, k in zip(mu, sigma, skew)],
+                        dtype='float64')
+    np.testing.assert_allclose(tau, expected, rtol=1e-13, equal_nan=True)
+    assert np.isnan(tau[np.abs(skew) > 0.995]).all()
+
+
+def test_eta_lookup_and_interpolation():
+    skews = np.array([-0.99, -0.5, 0, 0.004, 0.5, 0.99, 0.996, -1.5, np.nan])
+    exact = compute_eta_array(skews)
+    expected = [compute_eta(k) if not np.isnan(k) else None for k in skews]
+    np.testing.assert_array_equal(exact, np.array(expected, dtype='float64'))
+
+    grid = np.array([-0.5, 0.25, 0.99])
+    for method in ('linear', 'spline'):
+        np.testing.assert_allclose(compute_eta_array(grid, method),
+                                   [compute_eta(k) for k in grid], rtol=1e-12)
+    linear = compute_eta_array([0.255, 1.2], 'linear')
+    assert compute_eta(0.25) < linear[0] < compute_eta(0.26)
+    assert np.isnan(linear[1])
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+import fund_tree
+import parsers
+import series_cache
+import synthetic
+
+
+@pytest.fixture
+def synthetic_data(tmp_path):
+    saved = (parsers.DATA_DIR, parsers.spreadsheets, series_cache.CACHE_DIR)
+    directory = str(tmp_path) + '/'
+    sheets = synthetic.write_dataset(directory, 16, 3)
+    parsers.use_data(directory, sheets)
+    series_cache.CACHE_DIR = str(tmp_path / '.cache')
+    yield sheets
+    parsers.use_data(*saved[:2])
+    series_cache.CACHE_DIR = saved[2]
+
+
+def test_every_format_parses_back(synthetic_data):
+    prices = synthetic.random_prices(16, 3)
+    data = parsers.load(parsers.all_keys())
+    assert len(data) == sum(len(files) for files in synthetic_data.values())
+
+    for ticker, series in data.items():
+        expected = prices[f'fund_{int(ticker.split("_")[-1]):05d}']
+        assert len(series) == len(expected)
+        np.testing.assert_allclose(series.to_numpy(dtype='float64'), expected, rtol=1e-4)
+
+
+def test_excel_formats_parse_back(tmp_path, monkeypatch):
+    pytest.importorskip('openpyxl')
+    monkeypatch.setattr(parsers, 'DATA_DIR', str(tmp_path) + '/')
+    prices = synthetic.random_prices(1, 3, seed=3).iloc[:, 0]
+    for parse_class in synthetic.EXCEL_FORMATS:
+        fn = f'{parse_class}.{synthetic.EXTENSIONS[parse_class]}'
+        synthetic.WRITERS[parse_class](str(tmp_path / fn), prices.index, prices.to_numpy())
+        ticker, series = parsers.PARSERS[parse_class](fn)
+        assert ticker == parse_class and series.index.equals(prices.index.rename('date'))
+        np.testing.assert_allclose(series.to_numpy(), prices.to_numpy(), rtol=1e-4,
+                                   err_msg=parse_class)
+
+
+@pytest.mark.parametrize('n_funds', [1, 10, 100, 5000])
+def test_fund_tree_flattens(n_funds):
+    names = [f'f{i}' for i in range(n_funds)]
+    weights = fund_tree.flatten(synthetic.fund_tree(names))
+    assert sorted(weights) == sorted(names)
+    assert sum(weights.values()) == pytest.approx(1)
+
+
+def test_fund_tree_needs_even_split():
+    with pytest.raises(ValueError):
+        synthetic.fund_tree([f'f{i}' for i in range(7)])
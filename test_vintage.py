@@ -0,0 +1,46 @@
+import time
+import numpy as np
+import pytest
+import sim_engine
+import synthetic
+import vintage
+
+
+def naive(df, weights, calendar, start, end):
+    names = list(weights)
+    window = df.iloc[start:end + 1]
+    result = sim_engine.simulate(sim_engine.price_matrix(window, names),
+                                 sim_engine.weights_vector(weights, names),
+                                 sim_engine.rebalance_mask(window.index, calendar), 1)
+    values = result.values
+    return values[-1], (values / np.maximum.accumulate(values) - 1).min()
+
+
+@pytest.mark.parametrize('calendar, horizon', [('yearly', None), ('quarterly', 30),
+                                               ('never', 24), ('monthly', None)])
+def test_matches_independent_simulations(calendar, horizon):
+    prices = synthetic.random_prices(4, 6, seed=8)
+    weights = dict(zip(prices.columns, [0.4, 0.3, 0.2, 0.1]))
+    table = vintage.vintages(prices, weights, calendar, horizon, initial_capital=1)
+
+    expected_count = len(prices) - (1 if horizon is None else horizon)
+    assert len(table) == expected_count
+    for s in range(expected_count):
+        end = len(prices) - 1 if horizon is None else s + horizon
+        terminal, max_drawdown = naive(prices, weights, calendar, s, end)
+        row = table.iloc[s]
+        assert row['end'] == prices.index[end]
+        np.testing.assert_allclose(row['terminal_value'], terminal, rtol=1e-12)
+        np.testing.assert_allclose(row['max_drawdown'], max_drawdown, rtol=1e-12, atol=1e-15)
+        np.testing.assert_allclose(row['cagr'], terminal ** (12 / (end - s)) - 1, rtol=1e-12)
+
+
+def test_thirty_years_is_fast():
+    prices = synthetic.random_prices(20, 30, seed=1)
+    weights = dict(zip(prices.columns, np.full(20, 1 / 20)))
+    start = time.perf_counter()
+    table = vintage.vintages(prices, weights, 'yearly', horizon=120)
+    summary = vintage.summarize(table)
+    assert time.perf_counter() - start < 0.5
+    assert len(table) == 360 - 120
+    assert list(summary.index) == ['p5', 'p25', 'p50', 'p75', 'p95', 'mean']
@@ -0,0 +1,98 @@
+"""
+Vintage analysis: the portfolio simulated from every start month.
+
+A portfolio bought at month s drifts with its own price relatives until its
+first rebalance date r; from then on it holds target weights on the same
+calendar as a portfolio bought at the first month, so its path is that
+shared rebalanced index scaled to its value at r. Every vintage therefore
+costs one short partial holding period, evaluated for all vintages at once
+per month offset, plus a scaling of the shared index, instead of a full
+simulation each. Taxes are not modelled, as the tax lots of each vintage
+differ from the start.
+"""
+import numpy as np
+import pandas as pd
+import sim_engine
+
+PERCENTILES = (5, 25, 50, 75, 95)
+METRICS = ('cagr', 'max_drawdown', 'terminal_value')
+
+
+def vintage_values(prices, weights, rebalance, horizon=None):
+    """
+    Value paths, starting at 1, of buying `weights` at every row of `prices`
+    that has at least one month (or `horizon` months) after it. Returns the
+    start rows, end rows and a (vintages x months) array that is NaN outside
+    each vintage's [start, end].
+    """
+    prices = np.asarray(prices, dtype='float64')
+    weights = np.asarray(weights, dtype='float64')
+    rebalance = np.asarray(rebalance, dtype=bool)
+    n_months = len(prices)
+    if horizon is None:
+        starts = np.arange(n_months - 1)
+        ends = np.full(len(starts), n_months - 1)
+    else:
+        starts = np.arange(max(n_months - horizon, 0))
+        ends = starts + horizon
+
+    index = sim_engine.simulate_batch(prices, weights, rebalance)[:, 0]
+    # First rebalance after each start, n_months if there is none.
+    rows = np.append(np.flatnonzero(rebalance), n_months)
+    first = rows[np.searchsorted(rows, starts, side='right')]
+    # Drifting from the start up to the first rebalance, or the end if sooner.
+    drift_end = np.minimum(first, ends)
+
+    length = int((drift_end - starts).max()) + 1 if len(starts) else 1
+    shares = weights / prices[starts]
+    drift = np.empty((len(starts), length))
+    for k in range(length):
+        at = np.minimum(starts + k, n_months - 1)
+        drift[:, k] = (prices[at] * shares).sum(axis=1)
+
+    t = np.arange(n_months)
+    k = np.clip(t - starts[:, None], 0, length - 1)
+    in_drift = (t >= starts[:, None]) & (t <= drift_end[:, None])
+    rebalanced = (t > drift_end[:, None]) & (t <= ends[:, None])
+    at_first = np.minimum(first, n_months - 1)
+    scale = drift[np.arange(len(starts)), np.minimum(at_first - starts, length - 1)] / index[at_first]
+
+    values = np.where(in_drift, np.take_along_axis(drift, k, axis=1),
+                      np.where(rebalanced, scale[:, None] * index, np.nan))
+    return starts, ends, values
+
+
+def vintages(df, fund_weights, calendar='yearly', horizon=None, initial_capital=1_000_000):
+    """
+    Terminal value, CAGR and max drawdown of investing `initial_capital` in
+    the flattened fund tree weights at each month of an aligned price
+    DataFrame, to its end or over `horizon` months. Indexed by start date.
+    """
+    names = list(fund_weights)
+    starts, ends, values = vintage_values(sim_engine.price_matrix(df, names),
+                                          sim_engine.weights_vector(fund_weights, names),
+                                          sim_engine.rebalance_mask(df.index, calendar),
+                                          horizon)
+    months = ends - starts
+    terminal = values[np.arange(len(starts)), ends]
+    peaks = np.fmax.accumulate(values, axis=1)
+    with np.errstate(invalid='ignore'):
+        max_drawdown = np.nanmin(values / peaks, axis=1) - 1 if len(starts) else np.empty(0)
+
+    return pd.DataFrame({
+        'end': df.index[ends],
+        'months': months,
+        'cagr': terminal ** (12 / months) - 1,
+        'max_drawdown': max_drawdown,
+        'terminal_value': terminal * initial_capital,
+    }, index=pd.Index(df.index[starts], name='start'))
+
+
+def summarize(table, percentiles=PERCENTILES):
+    """Percentiles and mean of each vintage metric, like monte_carlo.summarize."""
+    d = {}
+    for name in METRICS:
+        d[name] = pd.Series(np.nanpercentile(table[name], percentiles),
+                            index=[f'p{p}' for p in percentiles])
+        d[name]['mean'] = table[name].mean()
+    return pd.DataFrame(d)
@@ -1,38 +1,29 @@
-import logging, sys
-logging.basicConfig(stream=sys.stderr, level=logging.INFO)
-
+import logging
 import pandas as pd
-import bt
+import backtester
+import correlation
 import data_loader
-import matplotlib.pyplot as plt
-import matplotlib.ticker as mtick
-
-from itertools import product, chain, combinations
-from monthdelta import monthmod
-from parsers import load
+import instrument
+import return_store
 from math import isnan
 
+logger = logging.getLogger('yanshuf')
+
+
 algo_stacks = (
-    ('qrv', [bt.algos.SelectAll(),
-             bt.algos.WeighInvVol(),
-             bt.algos.Rebalance()]
-     ),
-    ('qre', [bt.algos.SelectAll(),
-             bt.algos.WeighEqually(),
-             bt.algos.Rebalance()]
-     )
+    ('qrv', 'inv_vol'),
+    ('qre', 'equal')
 )
 
+# Above this many funds the correlation heat map gives way to a top pairs table.
+corr_table_limit = 40
+
 stat_keys = ['max_drawdown', 'monthly_vol', 'best_month', 'best_year', 'worst_month',
              'worst_year', 'monthly_skew', 'monthly_sharpe', 'cagr', 'calmar', 'three_month']
 
 
 def compile_data(minimum_months, keys):
-    data = load(keys)
-    res = {k: v for k, v in data.items(
-    ) if k in keys and v.size > minimum_months}
-
-    return res
+    return return_store.load(keys, minimum_months=minimum_months)
 
 def to_float_fmt(f):
     return "None" if isnan(f) else f"{f:.3f}"
@@ -46,22 +37,18 @@ def to_int_fmt(f):
     return f'{f:.0f}'
 
 def dragon_backtest(keys, strategy, data):
-    filtered_data = {k: v for k, v in data.items() if k in keys}
-    df = pd.DataFrame(filtered_data)
-    df.dropna(inplace=True)
+    from monthdelta import monthmod
+    with instrument.span('align'):
+        df = data.frame([k for k in data if k in keys])
     
-    test = bt.Backtest(strategy, df, progress_bar=False)
-    res = bt.run(test)
-
-    filtered_stats = res.stats.filter(stat_keys, axis='index')
     strategy_name = strategy.name
-    ss = res.stats[strategy_name]
+    prices = backtester.backtest(strategy, df)[strategy_name]
+    ss, return_table = backtester.performance(prices)
+    filtered_stats = ss[stat_keys].astype('float64').to_frame(strategy_name)
 
-    logging.info('end: %s', ss['end'])
+    logger.info('end: %s', ss['end'])
     months_rec = monthmod(ss['start'], ss['end'])
     months = months_rec[0].months
-    ps = res[strategy_name]
-    return_table = ps.return_table
     mar_2020 = return_table.at[2020, 'Mar']
     ytd_2020 = return_table.at[2020, 'YTD']
     score = ss['cagr']
@@ -88,68 +75,59 @@ def dragon_backtest(keys, strategy, data):
 def group_info(group):
     return [(key, data_loader.shortnames[key]) for key in group]
 
-def tailored_info():
-    return [(group_name, group_info(group)) for (group_name, group) in tailored.items() if len(group) > 0]
+def tailored_info(groups):
+    return [(group_name, group_info(group)) for (group_name, group) in groups.items() if len(group) > 0]
 
-def run_tailored_dragon():
+def tailored_groups():
     qrv, qre = algo_stacks
-    
-    long_vol_group = tailored['long_vol_group']
-    long_vol_strat = qre
-    
-    commodity_trend_group = tailored['commodity_trend_group']
-    commodity_trend_strat = qrv
-
-    alt_group = tailored['alt_group']
-    alt_strat = qrv
-
-    bond_group = tailored['bonds']
-    bond_strat = qre
-
-    gold_group = tailored['gold']
-    gold_strat = qre
-
-    stocks_group = tailored['stocks']
-    stocks_strat = qre
-    
-    keys = long_vol_group + commodity_trend_group + \
-        alt_group + bond_group + stocks_group + gold_group
-        
-    data = compile_data(55, keys)
-
-    strategy_name = 'tailored-dragon'
-    long_vol_strategy = bt.Strategy(
-        'long_vol', long_vol_strat[1], list(long_vol_group))
-    commodity_trend_strategy = bt.Strategy(
-        'commodity_trend', commodity_trend_strat[1], list(commodity_trend_group))
-    alt_strategy = bt.Strategy(
-        'alt', alt_strat[1], list(alt_group))
-    bond_strategy = bt.Strategy(
-        'bonds', bond_strat[1], list(bond_group))
-    gold_strategy = bt.Strategy(
-        'gold', gold_strat[1], list(gold_group))
-    stocks_strategy = bt.Strategy(
-        'stocks', stocks_strat[1], list(stocks_group))
-    
-    strategy = bt.Strategy(strategy_name, [bt.algos.RunYearly(),
-                                           bt.algos.SelectAll(),
-                                           bt.algos.WeighEqually(),
-                                           bt.algos.Rebalance()], [long_vol_strategy,
-                                                                   commodity_trend_strategy, alt_strategy,
-                                                                   bond_strategy, stocks_strategy, gold_strategy])
-    
-    stats, sources = dragon_backtest(keys, strategy, data)
-    
-    performance_table = stats.style.format(to_pct_fmt)\
+    # (group in data_loader.tailored, child strategy, weighing), in portfolio order.
+    return (
+        ('long_vol_group', 'long_vol', qre[1]),
+        ('commodity_trend_group', 'commodity_trend', qrv[1]),
+        ('alt_group', 'alt', qrv[1]),
+        ('bonds', 'bonds', qre[1]),
+        ('stocks', 'stocks', qre[1]),
+        ('gold', 'gold', qre[1]),
+    )
+
+def tailored_strategy(groups, strategy_name='tailored-dragon', run='yearly'):
+    """The strategy over `groups`, rebalanced on the `run` schedule, and the fund keys it holds."""
+    children = [backtester.strategy(child, groups[group], weighing)
+                for group, child, weighing in tailored_groups() if groups.get(group)]
+    keys = [key for child in children for key in child.children]
+    return backtester.strategy(strategy_name, children, 'equal', run=run), keys
+
+def tailored_returns(keys, data):
+    # Every pair over the months both funds have, not just the backtest window.
+    return data.returns_frame([k for k in keys if k in data], spliced=False)\
+        .rename(columns=data_loader.shortnames)
+
+@instrument.timed('render.perf')
+def render_performance(stats):
+    return stats.style.format(to_pct_fmt)\
         .format(to_int_fmt, subset=['months'])\
         .format(to_float_fmt,
                 subset=['calmar', 'monthly_skew', 'monthly_sharpe'])\
-        .render()
-        
-    corr_table = sources.rename(columns=data_loader.shortnames).pct_change().corr()\
+        .to_html()
+
+@instrument.timed('render.corr')
+def render_corr(returns):
+    if returns.shape[1] > corr_table_limit:
+        return correlation.top_pairs(returns).style.hide(axis='index')\
+            .format(to_float_fmt, subset=['corr']).to_html()
+    return correlation.corr_frame(returns)\
         .style.background_gradient(cmap='coolwarm')\
-        .set_precision(2).render()
+        .format(precision=2).to_html()
+
+def run_tailored_dragon(groups=None, strategy_name='tailored-dragon', run='yearly'):
+    """
+    Performance table, correlation table and fund info of a tailored-dragon
+    portfolio, by default the one in data_loader.tailored, rebalanced on the
+    `run` schedule.
+    """
+    groups = data_loader.tailored if groups is None else groups
+    strategy, keys = tailored_strategy(groups, strategy_name, run)
+    data = compile_data(55, keys)
+    stats, _ = dragon_backtest(keys, strategy, data)
 
-    info = tailored_info()
-        
-    return performance_table, corr_table, info
+    return render_performance(stats), render_corr(tailored_returns(keys, data)), tailored_info(groups)